@@ -1,9 +1,186 @@
 # -*- coding: utf-8 -*-
 
+import typing as T
+import queue
+import asyncio
+import threading
+import contextlib
+
 from .one.api import one
+from .routing import (
+    ROUTE_DIRECT,
+    ROUTE_TOOLS,
+    RoutingDecision,
+    make_specialist_queries,
+    make_routing_decision,
+)
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    from .one.one_03_agent import AgentMixin
+    from .one.one_07_session import AgentSession
+
+#: serializes the :func:`run_agent` requests without a session, they share
+#: the agents and conversations of ``one``
+_shared_agents_lock = threading.Lock()
+
+
+def make_report_prompt(user_input: str, router_response: T.Any) -> str:
+    """
+    Prompt of the report agent: the user question and the router results.
+    """
+    return f"""The user asked: "{user_input}"
+
+Intermediate analysis and results:
+{router_response}
+
+Your task: Create a polished, comprehensive final answer that addresses all aspects of the user's question. Use proper formatting, structure the information clearly, and ensure nothing important is lost."""
+
+
+def route(
+    user_input: str,
+    agents: "AgentMixin" = one,
+) -> RoutingDecision:
+    """
+    Run the router agent on a query, and record which tools it called and
+    which assistants failed.
+
+    :param agents: ``one`` or an :class:`~music_bi_agent_poc.one.one_07_session.AgentSession`.
+    """
+    tool_calls, failed_assistants = [], []
+    router_response = agents.router_agent(
+        user_input,
+        invocation_state={
+            "tool_calls": tool_calls,
+            "failed_assistants": failed_assistants,
+        },
+    )
+    return make_routing_decision(router_response, tool_calls, failed_assistants)
+
+
+async def route_async(
+    user_input: str,
+    agents: "AgentMixin" = one,
+) -> RoutingDecision:
+    """
+    Async version of :func:`route`.
+    """
+    tool_calls, failed_assistants = [], []
+    router_response = await agents.router_agent.invoke_async(
+        user_input,
+        invocation_state={
+            "tool_calls": tool_calls,
+            "failed_assistants": failed_assistants,
+        },
+    )
+    return make_routing_decision(router_response, tool_calls, failed_assistants)
+
+
+async def _acquire_in_thread(lock: threading.Lock):
+    acquiring = asyncio.ensure_future(asyncio.to_thread(lock.acquire))
+    try:
+        await asyncio.shield(acquiring)
+    except asyncio.CancelledError:
+        # the worker thread still gets the lock, give it back
+        acquiring.add_done_callback(lambda _: lock.release())
+        raise
+
+
+@contextlib.asynccontextmanager
+async def _hold(session: "AgentSession"):
+    # the async requests of the session wait on an asyncio lock without
+    # blocking the loop, then the first one takes the thread lock, which is
+    # only busy while a sync request, or one on another event loop, runs
+    async with session.get_async_lock():
+        if not session.lock.acquire(blocking=False):
+            await _acquire_in_thread(session.lock)
+        try:
+            yield session
+        finally:
+            session.lock.release()
+
+
+def is_standalone_question(agents: "AgentMixin") -> bool:
+    """
+    Whether a question can be understood without the conversation. A
+    question that follows earlier turns may depend on them, e.g. "and in
+    2012?", so only the first question of a conversation is. The calls
+    without a session share the conversation of ``one.router_agent``.
+    """
+    if "router_agent" not in agents.__dict__:
+        return True
+    return len(agents.router_agent.messages) == 0
+
+
+def is_cacheable(agents: "AgentMixin") -> bool:
+    """
+    Whether a request can use the answer cache, see
+    ``settings.answer_cache_enabled``.
+    """
+    return one.settings.answer_cache_enabled and is_standalone_question(agents)
+
+
+def remember_answer(
+    agents: "AgentMixin",
+    user_input: str,
+    answer: str,
+):
+    """
+    Add a question answered without the router, from the cache or by
+    :func:`pre_route`, to the router conversation, so the next questions can
+    refer to it. The conversation is trimmed to its window like after a
+    router turn.
+    """
+    router_agent = agents.router_agent
+    router_agent.messages.extend(
+        [
+            {"role": "user", "content": [{"text": user_input}]},
+            {"role": "assistant", "content": [{"text": answer}]},
+        ]
+    )
+    router_agent.conversation_manager.apply_management(router_agent)
+
+
+def pre_route(
+    user_input: str,
+    agents: "AgentMixin" = one,
+) -> T.Optional[RoutingDecision]:
+    """
+    Send a question straight to its specialists when the route classifier
+    is confident, without the router LLM turn, see
+    ``settings.route_classifier_enabled``.
+
+    :return: the specialist answer, None if the router agent should decide.
+    """
+    if not (one.settings.route_classifier_enabled and is_standalone_question(agents)):
+        return None
+    prediction = one.classify_route(user_input)
+    if prediction is None or prediction.route == ROUTE_DIRECT:
+        return None
+    queries = make_specialist_queries(prediction.route, user_input)
+    failed_assistants = []
+    answer = agents.run_assistants(queries, failed=failed_assistants)
+    return RoutingDecision(
+        answer=answer,
+        tools=[ROUTE_TOOLS[prediction.route]],
+        failed_assistants=failed_assistants,
+    )
+
+
+def is_final_answer(decision: RoutingDecision) -> bool:
+    """
+    Whether the report agent can be skipped, see
+    ``settings.skip_report_when_direct`` and
+    ``settings.skip_report_when_formatted``.
+    """
+    if not one.settings.skip_report_when_direct:
+        return False
+    return decision.is_final(skip_formatted=one.settings.skip_report_when_formatted)
 
 
-def run_agent(user_input: str) -> str:
+def run_agent(
+    user_input: str,
+    session_id: T.Optional[str] = None,
+) -> str:
     """
     Multi-agent orchestration workflow for handling user queries.
 
@@ -13,14 +190,22 @@ def run_agent(user_input: str) -> str:
     2. Report Agent: Synthesizes all intermediate results into a polished final answer
 
     :param user_input: The user's natural language query
+    :param session_id: Run with the agents and conversations of this session,
+        see :meth:`~music_bi_agent_poc.one.one_07_session.SessionMixin.get_session`.
+        None uses the agents shared by the whole process, concurrent calls
+        without a session then run one at a time.
 
     :return: Final synthesized answer as a string
 
     Workflow:
         User Query
+        -> Route Classifier, straight to the specialists if confident
         -> Router Agent (with sql_assistant & knowledge_assistant tools)
-        -> Report Agent
-        -> Final Answer
+        -> Report Agent, skipped if the router answered directly
+        -> Final Answer, stored in the answer cache
+
+    A question similar to one already answered gets the stored answer back,
+    see ``settings.answer_cache_enabled``.
     """
     # Step 1: Router Agent orchestrates and delegates to specialists
     # The router analyzes the query and decides:
@@ -28,18 +213,152 @@ def run_agent(user_input: str) -> str:
     # - Call sql_assistant for database/analytics queries
     # - Call knowledge_assistant for documentation/code queries
     # - Call both if needed for hybrid questions
-    router_response = one.router_agent(user_input)
+    if session_id is None:
+        agents, lock = one, _shared_agents_lock
+    else:
+        agents = one.get_session(session_id)
+        lock = agents.lock
+    with lock:
+        cacheable = is_cacheable(agents)
+        if cacheable:
+            cached = one.get_cached_answer(user_input)
+            if cached is not None:
+                remember_answer(agents, user_input, cached.answer)
+                return cached.answer
 
-    # Step 2: Report Agent synthesizes the final answer
-    # Takes the original query and router's intermediate results
-    # Produces a well-formatted, comprehensive final response
-    report_prompt = f"""The user asked: "{user_input}"
+        decision = pre_route(user_input, agents)
+        pre_routed = decision is not None
+        if not pre_routed:
+            decision = route(user_input, agents)
+        if is_final_answer(decision):
+            answer = decision.answer
+        else:
+            # Step 2: Report Agent synthesizes the final answer
+            # Takes the original query and router's intermediate results
+            # Produces a well-formatted, comprehensive final response
+            report_prompt = make_report_prompt(user_input, decision.answer)
 
-Intermediate analysis and results:
-{router_response}
+            answer = str(agents.report_agent(report_prompt))
 
-Your task: Create a polished, comprehensive final answer that addresses all aspects of the user's question. Use proper formatting, structure the information clearly, and ensure nothing important is lost."""
+        if pre_routed:
+            remember_answer(agents, user_input, answer)
+        if cacheable and not decision.failed:
+            one.put_cached_answer(user_input, answer)
+
+    return answer
+
+
+async def run_agent_async(
+    user_input: str,
+    session_id: T.Optional[str] = None,
+) -> str:
+    """
+    Async version of :func:`run_agent`, for serving many users from one
+    event loop.
+
+    Every call runs with the agents of a session, which hold the
+    conversations, so concurrent calls never share state. The specialist
+    tools run in worker threads and don't block the event loop.
+
+    :param user_input: The user's natural language query
+    :param session_id: Continue the conversation of this session. None runs
+        the query in a new session of its own.
+
+    :return: Final synthesized answer as a string
+    """
+    async with _hold(one.get_session(session_id)) as session:
+        cacheable = is_cacheable(session)
+        if cacheable:
+            cached = await asyncio.to_thread(one.get_cached_answer, user_input)
+            if cached is not None:
+                remember_answer(session, user_input, cached.answer)
+                return cached.answer
+        decision = await asyncio.to_thread(pre_route, user_input, session)
+        pre_routed = decision is not None
+        if not pre_routed:
+            decision = await route_async(user_input, session)
+        if is_final_answer(decision):
+            answer = decision.answer
+        else:
+            report_prompt = make_report_prompt(user_input, decision.answer)
+            answer = str(await session.report_agent.invoke_async(report_prompt))
+        if pre_routed:
+            remember_answer(session, user_input, answer)
+        if cacheable and not decision.failed:
+            one.put_cached_answer(user_input, answer)
+    return answer
+
+
+async def stream_agent_async(
+    user_input: str,
+    session_id: T.Optional[str] = None,
+) -> T.AsyncIterator[str]:
+    """
+    Same as :func:`run_agent_async`, but yield the final answer text chunk
+    by chunk as the report agent generates it, instead of waiting for the
+    whole answer.
+
+    Usage::
+
+        async for chunk in stream_agent_async("Which genre sells best?"):
+            print(chunk, end="", flush=True)
+    """
+    async with _hold(one.get_session(session_id)) as session:
+        cacheable = is_cacheable(session)
+        if cacheable:
+            cached = await asyncio.to_thread(one.get_cached_answer, user_input)
+            if cached is not None:
+                remember_answer(session, user_input, cached.answer)
+                yield cached.answer
+                return
+        decision = await asyncio.to_thread(pre_route, user_input, session)
+        pre_routed = decision is not None
+        if not pre_routed:
+            decision = await route_async(user_input, session)
+        if is_final_answer(decision):
+            chunks = [decision.answer]
+            yield decision.answer
+        else:
+            chunks = []
+            report_prompt = make_report_prompt(user_input, decision.answer)
+            async for event in session.report_agent.stream_async(report_prompt):
+                if "data" in event:
+                    chunks.append(event["data"])
+                    yield event["data"]
+        if pre_routed:
+            remember_answer(session, user_input, "".join(chunks))
+        if cacheable and not decision.failed:
+            one.put_cached_answer(user_input, "".join(chunks))
+
+
+_done = object()
+
+
+def stream_agent(
+    user_input: str,
+    session_id: T.Optional[str] = None,
+) -> T.Iterator[str]:
+    """
+    Blocking version of :func:`stream_agent_async`, for callers without an
+    event loop. The pipeline runs on its own event loop in a background
+    thread.
+    """
+    chunks = queue.Queue()
 
-    final_response = one.report_agent(report_prompt)
+    async def produce():
+        try:
+            async for chunk in stream_agent_async(user_input, session_id):
+                chunks.put(chunk)
+        except Exception as e:
+            chunks.put(e)
+        finally:
+            chunks.put(_done)
 
-    return str(final_response)
+    threading.Thread(target=asyncio.run, args=(produce(),), daemon=True).start()
+    while True:
+        chunk = chunks.get()
+        if chunk is _done:
+            return
+        if isinstance(chunk, Exception):
+            raise chunk
+        yield chunk
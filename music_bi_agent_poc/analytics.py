@@ -0,0 +1,522 @@
+# -*- coding: utf-8 -*-
+
+"""
+Columnar analytic snapshot of the Chinook sales data.
+
+The snapshot denormalizes the sales fact tables of ``chinook.sqlite`` into
+NumPy arrays, one array per column, stored on local disk:
+
+- the invoice line grain: ``InvoiceLine`` joined to ``Track``, ``Album``,
+  ``Artist``, ``Genre``, ``Invoice`` and ``Customer``.
+- the invoice grain: ``Invoice`` joined to ``Customer``.
+
+Aggregate queries grouped by artist, genre, customer country, billing
+country, month or year are answered from rollups computed with
+``numpy.bincount``, instead of joining the tables in SQLite. Only statements
+whose shape is known to be equivalent are answered, see
+:meth:`AnalyticSnapshot.answer`, anything else returns None and runs
+against SQLite as usual.
+"""
+
+import typing as T
+import json
+import sqlite3
+import dataclasses
+from decimal import Decimal, ROUND_HALF_UP
+from pathlib import Path
+
+import numpy as np
+
+from .cache import CacheStats
+from .sql_shape import AggregateQuery, parse_aggregate_query, canonical_expression
+from .sql_schema import get_file_version
+
+#: bump it when the snapshot layout changes
+SNAPSHOT_VERSION = 1
+
+_line_grain_sql = """
+SELECT
+    il.InvoiceLineId,
+    il.InvoiceId,
+    il.UnitPrice,
+    il.Quantity,
+    t.TrackId IS NOT NULL AS has_track,
+    al.AlbumId IS NOT NULL AS has_album,
+    ar.ArtistId IS NOT NULL AS has_artist,
+    g.GenreId IS NOT NULL AS has_genre,
+    i.InvoiceId IS NOT NULL AS has_invoice,
+    c.CustomerId IS NOT NULL AS has_customer,
+    ar.Name AS artist,
+    g.Name AS genre,
+    c.Country AS country,
+    i.BillingCountry AS billing_country,
+    strftime('%Y-%m', i.InvoiceDate) AS month,
+    strftime('%Y', i.InvoiceDate) AS year,
+    i.CustomerId
+FROM InvoiceLine il
+LEFT JOIN Track t ON il.TrackId = t.TrackId
+LEFT JOIN Album al ON t.AlbumId = al.AlbumId
+LEFT JOIN Artist ar ON al.ArtistId = ar.ArtistId
+LEFT JOIN Genre g ON t.GenreId = g.GenreId
+LEFT JOIN Invoice i ON il.InvoiceId = i.InvoiceId
+LEFT JOIN Customer c ON i.CustomerId = c.CustomerId
+ORDER BY il.InvoiceLineId
+"""
+
+_invoice_grain_sql = """
+SELECT
+    i.InvoiceId,
+    i.Total,
+    i.CustomerId,
+    c.CustomerId IS NOT NULL AS has_customer,
+    c.Country AS country,
+    i.BillingCountry AS billing_country,
+    strftime('%Y-%m', i.InvoiceDate) AS month,
+    strftime('%Y', i.InvoiceDate) AS year
+FROM Invoice i
+LEFT JOIN Customer c ON i.CustomerId = c.CustomerId
+ORDER BY i.InvoiceId
+"""
+
+#: foreign key joins allowed in a query, as canonical ``table.column`` pairs
+FOREIGN_KEYS = {
+    frozenset({"invoiceline.trackid", "track.trackid"}),
+    frozenset({"track.albumid", "album.albumid"}),
+    frozenset({"album.artistid", "artist.artistid"}),
+    frozenset({"track.genreid", "genre.genreid"}),
+    frozenset({"invoiceline.invoiceid", "invoice.invoiceid"}),
+    frozenset({"invoice.customerid", "customer.customerid"}),
+}
+
+#: grain -> fact table and the tables that can be joined to it
+GRAINS = {
+    "line": ("invoiceline", {"track", "album", "artist", "genre", "invoice", "customer"}),
+    "invoice": ("invoice", {"customer"}),
+}
+
+#: dimension -> (table, expression written with full table names)
+DIMENSIONS = {
+    "artist": ("artist", "Artist.Name"),
+    "genre": ("genre", "Genre.Name"),
+    "country": ("customer", "Customer.Country"),
+    "billing_country": ("invoice", "Invoice.BillingCountry"),
+    "month": ("invoice", "strftime('%Y-%m', Invoice.InvoiceDate)"),
+    "year": ("invoice", "strftime('%Y', Invoice.InvoiceDate)"),
+}
+
+#: grain -> measure -> equivalent expressions written with full table names
+MEASURES = {
+    "line": {
+        "revenue": [
+            "SUM(InvoiceLine.UnitPrice * InvoiceLine.Quantity)",
+            "SUM(InvoiceLine.Quantity * InvoiceLine.UnitPrice)",
+        ],
+        "quantity": ["SUM(InvoiceLine.Quantity)"],
+        "sum_unit_price": ["SUM(InvoiceLine.UnitPrice)"],
+        "avg_unit_price": ["AVG(InvoiceLine.UnitPrice)"],
+        "n_rows": ["COUNT(*)", "COUNT(InvoiceLine.InvoiceLineId)"],
+        "n_invoices": [
+            "COUNT(DISTINCT InvoiceLine.InvoiceId)",
+            "COUNT(DISTINCT Invoice.InvoiceId)",
+        ],
+        "n_customers": [
+            "COUNT(DISTINCT Invoice.CustomerId)",
+            "COUNT(DISTINCT Customer.CustomerId)",
+        ],
+    },
+    "invoice": {
+        "total": ["SUM(Invoice.Total)"],
+        "avg_total": ["AVG(Invoice.Total)"],
+        "n_rows": ["COUNT(*)", "COUNT(Invoice.InvoiceId)"],
+        "n_invoices": ["COUNT(DISTINCT Invoice.InvoiceId)"],
+        "n_customers": [
+            "COUNT(DISTINCT Invoice.CustomerId)",
+            "COUNT(DISTINCT Customer.CustomerId)",
+        ],
+    },
+}
+
+_dimension_columns = list(DIMENSIONS)
+
+
+def _encode(values: list[T.Optional[str]]) -> tuple[np.ndarray, list[T.Optional[str]]]:
+    """
+    Dictionary encode a string column, NULL is kept as the ``None`` label.
+    """
+    labels = sorted(set(values), key=lambda v: (v is not None, v or ""))
+    code_of = {label: ith for ith, label in enumerate(labels)}
+    codes = np.fromiter((code_of[v] for v in values), dtype=np.int32, count=len(values))
+    return codes, labels
+
+
+def _sqlite_round(value: float, digits: int) -> float:
+    # SQLite rounds half away from zero on the decimal representation
+    quantum = Decimal(1).scaleb(-digits)
+    return float(
+        Decimal(repr(round(float(value), 10))).quantize(quantum, rounding=ROUND_HALF_UP)
+    )
+
+
+def _sort_key(value):
+    # SQLite sorts NULL first, then numbers, then text
+    if value is None:
+        return (0, 0)
+    if isinstance(value, str):
+        return (2, value)
+    return (1, value)
+
+
+@dataclasses.dataclass
+class Rollup:
+    """
+    Aggregates of one grain, grouped by one dimension, over the fact rows
+    that survive a given set of inner joins.
+
+    :param labels: the group labels, sorted like SQLite sorts them.
+    :param measures: measure name -> one value per group.
+    """
+
+    labels: list[T.Optional[str]]
+    measures: dict[str, list]
+
+
+class AnalyticSnapshot:
+    """
+    :param source_version: version token of the database file the snapshot
+        was built from, see :func:`~music_bi_agent_poc.sql_schema.get_file_version`.
+    :param columns_by_table: lower case column names of each table.
+    :param arrays: ``{grain}.{column}`` -> NumPy array.
+    :param labels: ``{grain}.{dimension}`` -> labels of the dictionary codes.
+    """
+
+    def __init__(
+        self,
+        source_version: T.Optional[list],
+        columns_by_table: dict[str, set[str]],
+        arrays: dict[str, np.ndarray],
+        labels: dict[str, list[T.Optional[str]]],
+    ):
+        self.source_version = source_version
+        self.columns_by_table = columns_by_table
+        self.arrays = arrays
+        self.labels = labels
+        self.stats = CacheStats()
+        self._rollups: dict[tuple[str, str, frozenset], Rollup] = dict()
+        self._dimension_exprs = {
+            canonical_expression(expr, columns_by_table): name
+            for name, (_, expr) in DIMENSIONS.items()
+        }
+        self._measure_exprs = {
+            grain: {
+                canonical_expression(expr, columns_by_table): name
+                for name, exprs in measures.items()
+                for expr in exprs
+            }
+            for grain, measures in MEASURES.items()
+        }
+
+    # --------------------------------------------------------------------------
+    # build / dump / load
+    # --------------------------------------------------------------------------
+    @classmethod
+    def build(cls, path_sqlite: Path) -> "AnalyticSnapshot":
+        """
+        Build the snapshot from the SQLite database file, opened read-only.
+        """
+        source_version = get_file_version(path_sqlite)
+        uri = f"{path_sqlite.absolute().as_uri()}?mode=ro"
+        with sqlite3.connect(uri, uri=True) as conn:
+            columns_by_table = dict()
+            for (table,) in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type IN ('table', 'view')"
+            ):
+                columns_by_table[table.lower()] = {
+                    row[1].lower()
+                    for row in conn.execute(f'PRAGMA table_info("{table}")')
+                }
+            arrays = dict()
+            labels = dict()
+            for grain, sql in [("line", _line_grain_sql), ("invoice", _invoice_grain_sql)]:
+                cursor = conn.execute(sql)
+                names = [description[0].lower() for description in cursor.description]
+                columns = list(zip(*cursor.fetchall())) or [[] for _ in names]
+                for name, values in zip(names, columns):
+                    if name in DIMENSIONS:
+                        codes, dim_labels = _encode(list(values))
+                        arrays[f"{grain}.{name}"] = codes
+                        labels[f"{grain}.{name}"] = dim_labels
+                    elif name in ("unitprice", "total"):
+                        arrays[f"{grain}.{name}"] = np.array(values, dtype=np.float64)
+                    else:
+                        # NULL ids are encoded as -1
+                        arrays[f"{grain}.{name}"] = np.array(
+                            [-1 if v is None else v for v in values], dtype=np.int64
+                        )
+        return cls(
+            source_version=list(source_version) if source_version else None,
+            columns_by_table=columns_by_table,
+            arrays=arrays,
+            labels=labels,
+        )
+
+    def dump(self, dir_snapshot: Path):
+        dir_snapshot.mkdir(parents=True, exist_ok=True)
+        np.savez(dir_snapshot / "arrays.npz", **self.arrays)
+        meta = {
+            "snapshot_version": SNAPSHOT_VERSION,
+            "source_version": self.source_version,
+            "columns_by_table": {k: sorted(v) for k, v in self.columns_by_table.items()},
+            "labels": self.labels,
+        }
+        (dir_snapshot / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+
+    @classmethod
+    def load(cls, dir_snapshot: Path) -> T.Optional["AnalyticSnapshot"]:
+        """
+        :return: None if there is no snapshot or it has an older layout.
+        """
+        path_meta = dir_snapshot / "meta.json"
+        if not path_meta.exists():
+            return None
+        meta = json.loads(path_meta.read_text(encoding="utf-8"))
+        if meta.get("snapshot_version") != SNAPSHOT_VERSION:
+            return None
+        with np.load(dir_snapshot / "arrays.npz") as npz:
+            arrays = {name: npz[name] for name in npz.files}
+        return cls(
+            source_version=meta["source_version"],
+            columns_by_table={k: set(v) for k, v in meta["columns_by_table"].items()},
+            arrays=arrays,
+            labels=meta["labels"],
+        )
+
+    @classmethod
+    def load_or_build(cls, path_sqlite: Path, dir_snapshot: Path) -> "AnalyticSnapshot":
+        """
+        Load the snapshot from disk, rebuild it if the database changed.
+        """
+        snapshot = cls.load(dir_snapshot)
+        version = get_file_version(path_sqlite)
+        if snapshot is None or snapshot.source_version != (
+            list(version) if version else None
+        ):
+            snapshot = cls.build(path_sqlite)
+            snapshot.dump(dir_snapshot)
+        return snapshot
+
+    # --------------------------------------------------------------------------
+    # rollups
+    # --------------------------------------------------------------------------
+    def get_mask(self, grain: str, joined_tables: frozenset) -> np.ndarray:
+        """
+        Fact rows that survive the inner joins to ``joined_tables``.
+        """
+        n = len(self.arrays[f"{grain}.has_customer"])
+        mask = np.ones(n, dtype=bool)
+        for table in joined_tables:
+            mask &= self.arrays[f"{grain}.has_{table}"] == 1
+        return mask
+
+    def get_rollup(
+        self,
+        grain: str,
+        dimension: str,
+        joined_tables: frozenset,
+    ) -> Rollup:
+        """
+        Aggregates of ``grain`` grouped by ``dimension``, memoized.
+        """
+        key = (grain, dimension, joined_tables)
+        rollup = self._rollups.get(key)
+        if rollup is not None:
+            return rollup
+        mask = self.get_mask(grain, joined_tables)
+        codes = self.arrays[f"{grain}.{dimension}"][mask]
+        all_labels = self.labels[f"{grain}.{dimension}"]
+        n_groups = len(all_labels)
+        n_rows = np.bincount(codes, minlength=n_groups)
+        present = np.nonzero(n_rows)[0]
+
+        def per_group(weights=None):
+            return np.bincount(codes, weights=weights, minlength=n_groups)[present]
+
+        def distinct_per_group(ids: np.ndarray):
+            ids = ids[mask]
+            keep = ids >= 0  # COUNT(DISTINCT x) ignores NULL
+            pairs = np.unique(np.stack([codes[keep], ids[keep]]), axis=1)
+            return np.bincount(pairs[0], minlength=n_groups)[present]
+
+        measures = {"n_rows": n_rows[present].tolist()}
+        customer_ids = self.arrays[f"{grain}.customerid"]
+        measures["n_customers"] = distinct_per_group(customer_ids).tolist()
+        if grain == "line":
+            unit_price = self.arrays["line.unitprice"][mask]
+            quantity = self.arrays["line.quantity"][mask]
+            measures["revenue"] = per_group(unit_price * quantity).tolist()
+            measures["quantity"] = [int(v) for v in per_group(quantity)]
+            measures["sum_unit_price"] = per_group(unit_price).tolist()
+            measures["avg_unit_price"] = (
+                per_group(unit_price) / n_rows[present]
+            ).tolist()
+            measures["n_invoices"] = distinct_per_group(
+                self.arrays["line.invoiceid"]
+            ).tolist()
+        else:
+            total = self.arrays["invoice.total"][mask]
+            measures["total"] = per_group(total).tolist()
+            measures["avg_total"] = (per_group(total) / n_rows[present]).tolist()
+            measures["n_invoices"] = n_rows[present].tolist()
+        rollup = Rollup(
+            labels=[all_labels[ith] for ith in present],
+            measures=measures,
+        )
+        self._rollups[key] = rollup
+        return rollup
+
+    def warm_up(self):
+        """
+        Precompute the rollups of every dimension for the minimal joins.
+        """
+        for grain, (fact_table, joinable) in GRAINS.items():
+            for dimension, (table, _) in DIMENSIONS.items():
+                if table == fact_table:
+                    self.get_rollup(grain, dimension, frozenset())
+                elif table in joinable:
+                    self.get_rollup(grain, dimension, self._minimal_joins(grain, table))
+
+    @staticmethod
+    def _minimal_joins(grain: str, table: str) -> frozenset:
+        path = {
+            "track": {"track"},
+            "album": {"track", "album"},
+            "artist": {"track", "album", "artist"},
+            "genre": {"track", "genre"},
+            "invoice": {"invoice"},
+            "customer": {"invoice", "customer"},
+        }
+        if grain == "invoice":
+            return frozenset({"customer"}) if table == "customer" else frozenset()
+        return frozenset(path[table])
+
+    # --------------------------------------------------------------------------
+    # answer
+    # --------------------------------------------------------------------------
+    def _get_grain(self, query: AggregateQuery) -> T.Optional[str]:
+        for grain, (fact_table, joinable) in GRAINS.items():
+            if fact_table in query.tables and set(query.tables) <= joinable | {fact_table}:
+                return grain
+        return None
+
+    def _is_join_tree(self, query: AggregateQuery) -> bool:
+        """
+        Every joined table must be joined on a foreign key to a table that
+        comes before it.
+        """
+        for ith, (left, right) in enumerate(query.joins, start=1):
+            if frozenset({left, right}) not in FOREIGN_KEYS:
+                return False
+            new_table = query.tables[ith]
+            sides = {left.split(".")[0], right.split(".")[0]}
+            if new_table not in sides or not (sides - {new_table}) <= set(query.tables[:ith]):
+                return False
+        return True
+
+    def _match_measure(self, grain: str, expr: str) -> T.Optional[tuple[str, T.Optional[int]]]:
+        """
+        :return: (measure name, ROUND digits or None)
+        """
+        measure = self._measure_exprs[grain].get(expr)
+        if measure is not None:
+            return measure, None
+        prefix = "round ( "
+        if expr.startswith(prefix) and expr.endswith(" )"):
+            inner, _, digits = expr[len(prefix) : -2].rpartition(" , ")
+            measure = self._measure_exprs[grain].get(inner)
+            if measure is not None and digits.isdigit():
+                return measure, int(digits)
+        return None
+
+    def answer(
+        self,
+        sql: str,
+    ) -> T.Optional[tuple[list[str], list[list]]]:
+        """
+        Answer a SELECT statement from the rollups.
+
+        :return: (column names, rows), or None if the statement is not a
+            supported aggregate shape and must run against the database.
+        """
+        query = parse_aggregate_query(sql, self.columns_by_table)
+        result = None if query is None else self._answer(query)
+        if result is None:
+            self.stats.misses += 1
+        else:
+            self.stats.hits += 1
+        return result
+
+    def _answer(self, query: AggregateQuery) -> T.Optional[tuple[list[str], list[list]]]:
+        grain = self._get_grain(query)
+        if grain is None or not self._is_join_tree(query):
+            return None
+        if len(query.group_by) != 1:
+            return None
+        dimension = self._dimension_exprs.get(query.group_by[0])
+        if dimension is None:
+            return None
+
+        fact_table = GRAINS[grain][0]
+        joined_tables = frozenset(query.tables) - {fact_table}
+        rollup = self.get_rollup(grain, dimension, joined_tables)
+
+        # each select item is either the dimension or a measure
+        columns = []
+        for item in query.select:
+            if item.expr == query.group_by[0]:
+                columns.append(rollup.labels)
+                continue
+            matched = self._match_measure(grain, item.expr)
+            if matched is None:
+                return None
+            measure, digits = matched
+            values = rollup.measures[measure]
+            if digits is not None:
+                values = [_sqlite_round(v, digits) for v in values]
+            columns.append(values)
+
+        rows = [list(row) for row in zip(*columns)]
+        labels = rollup.labels
+        # without ORDER BY, SQLite returns the groups sorted by the group key
+        order = sorted(range(len(rows)), key=lambda ith: _sort_key(labels[ith]))
+        if len(query.order_by) > 1:
+            return None
+        if query.order_by:
+            order_item = query.order_by[0]
+            exprs = [item.expr for item in query.select]
+            if order_item.expr not in exprs:
+                return None
+            position = exprs.index(order_item.expr)
+            order = sorted(
+                order,
+                key=lambda ith: _sort_key(rows[ith][position]),
+                reverse=order_item.descending,
+            )
+        rows = [rows[ith] for ith in order]
+        if query.limit is not None:
+            rows = rows[: query.limit]
+        return [item.name for item in query.select], rows
+
+
+def format_rows(columns: list[str], rows: list[list]) -> str:
+    """
+    Format rows like ``mcp_ohmy_sql`` formats a query result.
+    """
+    from tabulate import tabulate
+
+    if len(rows) == 0:
+        return "No result"
+    return tabulate(
+        [columns, *rows],
+        headers="firstrow",
+        tablefmt="pipe",
+        floatfmt=".4f",
+    )
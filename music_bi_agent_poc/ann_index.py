@@ -0,0 +1,494 @@
+# -*- coding: utf-8 -*-
+
+"""
+Approximate nearest neighbour search over quantized embeddings, for
+knowledge bases too large for the exact float32 search of
+:class:`~music_bi_agent_poc.local_vector_index.LocalVectorIndex`.
+
+:class:`IVFIndex` is an inverted file index: the embeddings are clustered
+with k-means, a query only scans the ``n_probe`` clusters closest to it, and
+the difference between each embedding and its cluster centroid is stored
+compressed:
+
+- ``int8``: one byte per dimension, 4x smaller, scores almost exact.
+- ``pq``: product quantization, one byte per group of dimensions, e.g. 48
+  bytes for a 384-dim embedding, 32x smaller, scores approximate.
+
+The float32 embeddings are kept on disk and memory-mapped, so the best
+``refine * top_k`` candidates can be scored again exactly while only the
+rows actually read are paged in.
+"""
+
+import typing as T
+import json
+import time
+import dataclasses
+from pathlib import Path
+
+import numpy as np
+
+from .local_vector_index import SearchHit, LocalVectorIndex, normalize, top_k_indices
+
+#: max number of rows multiplied at once with the centroids
+_BATCH_SIZE = 65536
+
+
+def assign(matrix: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """
+    Index of the closest centroid, by euclidean distance, of every row.
+    """
+    half_norms = (centroids**2).sum(axis=1) / 2
+    labels = np.empty(len(matrix), dtype=np.int64)
+    for start in range(0, len(matrix), _BATCH_SIZE):
+        batch = matrix[start : start + _BATCH_SIZE]
+        labels[start : start + _BATCH_SIZE] = np.argmax(
+            batch @ centroids.T - half_norms, axis=1
+        )
+    return labels
+
+
+def kmeans(
+    matrix: np.ndarray,
+    n_clusters: int,
+    n_iter: int = 20,
+    max_train_rows: int = 256,
+    seed: int = 0,
+) -> np.ndarray:
+    """
+    Lloyd's k-means, trained on at most ``max_train_rows`` rows per cluster.
+    An empty cluster is moved to a random training row.
+
+    :return: the centroids, at most as many as rows.
+    """
+    rng = np.random.default_rng(seed)
+    n_clusters = min(n_clusters, len(matrix))
+    n_train = min(len(matrix), n_clusters * max_train_rows)
+    train = matrix[rng.choice(len(matrix), n_train, replace=False)]
+    centroids = train[rng.choice(n_train, n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        labels = assign(train, centroids)
+        counts = np.bincount(labels, minlength=n_clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, train)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        centroids[empty] = train[rng.choice(n_train, int(empty.sum()))]
+    return centroids
+
+
+class Int8Quantizer:
+    """
+    Symmetric scalar quantization, one scale per dimension.
+
+    :param scale: float value of one int8 step, per dimension.
+    """
+
+    kind = "int8"
+
+    def __init__(self, scale: np.ndarray):
+        self.scale = scale
+
+    @classmethod
+    def fit(cls, matrix: np.ndarray) -> "Int8Quantizer":
+        scale = np.abs(matrix).max(axis=0) / 127
+        scale[scale == 0] = 1.0
+        return cls(scale=scale.astype(np.float32))
+
+    def encode(self, matrix: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint(matrix / self.scale), -127, 127).astype(np.int8)
+
+    def score(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """
+        Approximate inner products between a query and encoded rows.
+        """
+        return codes.astype(np.float32) @ (query * self.scale)
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        return {"scale": self.scale}
+
+
+class ProductQuantizer:
+    """
+    The dimensions are split in ``m`` groups, each group of a row is replaced
+    by the index of the closest of 256 centroids learned for that group.
+    Inner products are computed from a ``m x 256`` lookup table per query.
+
+    :param codebooks: ``(m, n_centroids, dimension / m)`` centroids.
+    """
+
+    kind = "pq"
+
+    def __init__(self, codebooks: np.ndarray):
+        self.codebooks = codebooks
+
+    @property
+    def m(self) -> int:
+        return self.codebooks.shape[0]
+
+    @classmethod
+    def fit(
+        cls,
+        matrix: np.ndarray,
+        m: int,
+        n_iter: int = 20,
+        seed: int = 0,
+    ) -> "ProductQuantizer":
+        if matrix.shape[1] % m != 0:
+            raise ValueError(
+                f"the dimension {matrix.shape[1]} is not a multiple of m={m}"
+            )
+        groups = np.split(matrix, m, axis=1)
+        codebooks = [
+            kmeans(group, n_clusters=256, n_iter=n_iter, seed=seed) for group in groups
+        ]
+        return cls(codebooks=np.stack(codebooks).astype(np.float32))
+
+    def encode(self, matrix: np.ndarray) -> np.ndarray:
+        groups = np.split(matrix, self.m, axis=1)
+        labels = [
+            assign(group, codebook) for group, codebook in zip(groups, self.codebooks)
+        ]
+        return np.stack(labels, axis=1).astype(np.uint8)
+
+    def score(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        table = np.einsum("jkd,jd->jk", self.codebooks, query.reshape(self.m, -1))
+        return table[np.arange(self.m), codes].sum(axis=1)
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        return {"codebooks": self.codebooks}
+
+
+_quantizer_classes = {
+    Int8Quantizer.kind: Int8Quantizer,
+    ProductQuantizer.kind: ProductQuantizer,
+}
+
+
+def get_build_params(
+    quantization: str = Int8Quantizer.kind,
+    pq_m: int = 48,
+    **kwargs,
+) -> dict[str, T.Any]:
+    """
+    The :meth:`IVFIndex.build` arguments that shape an index, ``pq_m`` only
+    matters to the ``pq`` quantization.
+    """
+    build_params = dict(kwargs, quantization=quantization)
+    if quantization == ProductQuantizer.kind:
+        build_params["pq_m"] = pq_m
+    return build_params
+
+
+class IVFIndex:
+    """
+    Inverted file index over quantized, normalized embeddings, with the same
+    :meth:`query` interface as
+    :class:`~music_bi_agent_poc.local_vector_index.LocalVectorIndex`. Build it
+    with :meth:`build`.
+
+    :param keys: chunk keys.
+    :param texts: chunk contents, aligned with ``keys``.
+    :param centroids: ``(n_lists, dimension)`` cluster centroids.
+    :param offsets: ``(n_lists + 1,)`` start of each cluster in ``rows`` and
+        ``codes``.
+    :param rows: the row in ``keys`` of each encoded embedding, grouped by
+        cluster.
+    :param codes: the encoded differences between each embedding and its
+        cluster centroid, grouped by cluster.
+    :param quantizer: the :class:`Int8Quantizer` or :class:`ProductQuantizer`
+        that encoded them.
+    :param matrix: the normalized float32 embeddings aligned with ``keys``,
+        usually memory-mapped, None disables ``refine``.
+    :param n_probe: default number of clusters scanned per query.
+    :param refine: default number of candidates per result scored again
+        exactly with ``matrix``, 0 disables it.
+    :param build_params: the :meth:`build` arguments that shaped the index,
+        see :meth:`is_built_with`. Empty if unknown.
+    """
+
+    path_index_name = "ivf_index.npz"
+    path_embeddings_name = "embeddings.npy"
+    path_chunks_name = "chunks.json"
+    path_build_params_name = "build_params.json"
+
+    def __init__(
+        self,
+        keys: list[str],
+        texts: list[str],
+        centroids: np.ndarray,
+        offsets: np.ndarray,
+        rows: np.ndarray,
+        codes: np.ndarray,
+        quantizer: T.Union[Int8Quantizer, ProductQuantizer],
+        matrix: T.Optional[np.ndarray] = None,
+        n_probe: int = 8,
+        refine: int = 0,
+        build_params: T.Optional[dict[str, T.Any]] = None,
+    ):
+        self.keys = keys
+        self.texts = texts
+        self.centroids = centroids
+        self.offsets = offsets
+        self.rows = rows
+        self.codes = codes
+        self.quantizer = quantizer
+        self.matrix = matrix
+        self.n_probe = n_probe
+        self.refine = refine
+        self.build_params = dict() if build_params is None else build_params
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @property
+    def n_lists(self) -> int:
+        return len(self.centroids)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Memory used by the search structures, chunk texts and the
+        memory-mapped float32 embeddings excluded.
+        """
+        return (
+            self.centroids.nbytes
+            + self.offsets.nbytes
+            + self.rows.nbytes
+            + self.codes.nbytes
+            + sum(array.nbytes for array in self.quantizer.to_arrays().values())
+        )
+
+    @classmethod
+    def build(
+        cls,
+        keys: list[str],
+        texts: list[str],
+        embeddings: T.Union[np.ndarray, T.Sequence[T.Sequence[float]]],
+        n_lists: int = 0,
+        quantization: str = Int8Quantizer.kind,
+        pq_m: int = 48,
+        n_iter: int = 20,
+        seed: int = 0,
+        n_probe: int = 8,
+        refine: int = 0,
+    ) -> "IVFIndex":
+        """
+        :param n_lists: number of clusters, 0 picks ``4 * sqrt(n)``.
+        :param quantization: ``int8`` or ``pq``.
+        :param pq_m: number of dimension groups of the ``pq`` quantization,
+            one byte each, the dimension must be a multiple of it.
+        :param n_iter: k-means iterations.
+        """
+        if len(keys) == 0:
+            raise ValueError("can't build an index without embeddings")
+        matrix = normalize(embeddings)
+        requested_n_lists = n_lists
+        if n_lists <= 0:
+            n_lists = int(4 * np.sqrt(len(matrix)))
+        centroids = kmeans(matrix, n_clusters=n_lists, n_iter=n_iter, seed=seed)
+        labels = assign(matrix, centroids)
+        rows = np.argsort(labels, kind="stable")
+        offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(labels, minlength=len(centroids)))
+        # the residuals to the cluster centroid are much smaller than the
+        # embeddings, the same number of bits encodes them more precisely
+        residuals = matrix[rows] - centroids[labels[rows]]
+        if quantization == Int8Quantizer.kind:
+            quantizer = Int8Quantizer.fit(residuals)
+        elif quantization == ProductQuantizer.kind:
+            quantizer = ProductQuantizer.fit(
+                residuals, m=pq_m, n_iter=n_iter, seed=seed
+            )
+        else:
+            raise ValueError(f"unknown quantization {quantization!r}")
+        build_params = get_build_params(
+            n_lists=requested_n_lists,
+            quantization=quantization,
+            pq_m=pq_m,
+            n_iter=n_iter,
+            seed=seed,
+        )
+        return cls(
+            keys=list(keys),
+            texts=list(texts),
+            centroids=centroids,
+            offsets=offsets,
+            rows=rows,
+            codes=quantizer.encode(residuals),
+            quantizer=quantizer,
+            matrix=matrix,
+            n_probe=n_probe,
+            refine=refine,
+            build_params=build_params,
+        )
+
+    def is_built_with(self, **build_params) -> bool:
+        """
+        Whether the index was built with these :meth:`build` arguments, the
+        arguments that don't shape the index, like ``pq_m`` of an ``int8``
+        index, are ignored. False if the build arguments are unknown, e.g.
+        for an index dumped before they were saved.
+        """
+        return all(
+            self.build_params.get(name) == value
+            for name, value in get_build_params(**build_params).items()
+        )
+
+    def query(
+        self,
+        embedding: T.Union[np.ndarray, T.Sequence[float]],
+        top_k: int = 5,
+        n_probe: T.Optional[int] = None,
+        refine: T.Optional[int] = None,
+    ) -> list[SearchHit]:
+        """
+        Find the ``top_k`` most similar chunks, best first, among the
+        ``n_probe`` clusters closest to the query. The more clusters, the
+        higher the recall and the slower the query.
+
+        :param refine: score the best ``refine * top_k`` candidates again
+            with the exact float32 embeddings, 0 disables it.
+        """
+        n_probe = self.n_probe if n_probe is None else n_probe
+        refine = self.refine if refine is None else refine
+        query = normalize(embedding)[0]
+        centroid_scores = self.centroids @ query
+        half_norms = (self.centroids**2).sum(axis=1) / 2
+        lists = top_k_indices(centroid_scores - half_norms, n_probe)
+        sizes = self.offsets[lists + 1] - self.offsets[lists]
+        positions = np.concatenate(
+            [np.arange(self.offsets[ith], self.offsets[ith + 1]) for ith in lists]
+        )
+        # q . x = q . centroid + q . residual
+        scores = np.repeat(centroid_scores[lists], sizes) + self.quantizer.score(
+            query, self.codes[positions]
+        )
+        if refine > 0 and self.matrix is not None:
+            candidates = self.rows[positions[top_k_indices(scores, top_k * refine)]]
+            # read the rows in file order, memory-mapped pages are read once
+            candidates.sort()
+            exact_scores = np.asarray(self.matrix[candidates]) @ query
+            best = top_k_indices(exact_scores, top_k)
+            rows, scores = candidates[best], exact_scores[best]
+        else:
+            best = top_k_indices(scores, top_k)
+            rows, scores = self.rows[positions[best]], scores[best]
+        return [
+            SearchHit(key=self.keys[row], text=self.texts[row], score=float(score))
+            for row, score in zip(rows, scores)
+        ]
+
+    @classmethod
+    def exists(cls, dir_index: Path) -> bool:
+        names = [cls.path_index_name, cls.path_embeddings_name, cls.path_chunks_name]
+        return all((dir_index / name).exists() for name in names)
+
+    def dump(self, dir_index: Path):
+        """
+        Persist the index to a folder, the float32 embeddings go to their own
+        file so :meth:`load` can memory-map them.
+        """
+        dir_index.mkdir(parents=True, exist_ok=True)
+        np.savez(
+            dir_index / self.path_index_name,
+            centroids=self.centroids,
+            offsets=self.offsets,
+            rows=self.rows,
+            codes=self.codes,
+            quantization=np.array(self.quantizer.kind),
+            **self.quantizer.to_arrays(),
+        )
+        np.save(dir_index / self.path_embeddings_name, self.matrix)
+        chunks = [
+            {"key": key, "text": text} for key, text in zip(self.keys, self.texts)
+        ]
+        (dir_index / self.path_chunks_name).write_text(
+            json.dumps(chunks), encoding="utf-8"
+        )
+        (dir_index / self.path_build_params_name).write_text(
+            json.dumps(self.build_params), encoding="utf-8"
+        )
+
+    @classmethod
+    def load(
+        cls,
+        dir_index: Path,
+        n_probe: int = 8,
+        refine: int = 0,
+    ) -> "IVFIndex":
+        arrays = np.load(dir_index / cls.path_index_name)
+        quantizer_class = _quantizer_classes[str(arrays["quantization"])]
+        if quantizer_class is Int8Quantizer:
+            quantizer = Int8Quantizer(scale=arrays["scale"])
+        else:
+            quantizer = ProductQuantizer(codebooks=arrays["codebooks"])
+        chunks = json.loads(
+            (dir_index / cls.path_chunks_name).read_text(encoding="utf-8")
+        )
+        path_build_params = dir_index / cls.path_build_params_name
+        if path_build_params.exists():
+            build_params = json.loads(path_build_params.read_text(encoding="utf-8"))
+        else:
+            build_params = dict()
+        return cls(
+            keys=[chunk["key"] for chunk in chunks],
+            texts=[chunk["text"] for chunk in chunks],
+            centroids=arrays["centroids"],
+            offsets=arrays["offsets"],
+            rows=arrays["rows"],
+            codes=arrays["codes"],
+            quantizer=quantizer,
+            matrix=np.load(dir_index / cls.path_embeddings_name, mmap_mode="r"),
+            n_probe=n_probe,
+            refine=refine,
+            build_params=build_params,
+        )
+
+
+@dataclasses.dataclass
+class RecallReport:
+    """
+    Result of :func:`measure_recall`.
+
+    :param recall: average fraction of the exact ``top_k`` found by the
+        approximate search.
+    :param ann_ms: average approximate query latency in milliseconds.
+    :param exact_ms: average exact query latency in milliseconds.
+    """
+
+    recall: float
+    ann_ms: float
+    exact_ms: float
+
+
+def measure_recall(
+    ann_index: IVFIndex,
+    exact_index: LocalVectorIndex,
+    queries: np.ndarray,
+    top_k: int = 10,
+    n_probe: T.Optional[int] = None,
+    refine: T.Optional[int] = None,
+) -> RecallReport:
+    """
+    Compare the approximate and the exact top ``top_k`` of each query, both
+    indexes must hold the same chunks.
+    """
+    exact_results = []
+    start = time.perf_counter()
+    for query in queries:
+        exact_results.append({hit.key for hit in exact_index.query(query, top_k=top_k)})
+    exact_ms = (time.perf_counter() - start) / len(queries) * 1000
+    ann_results = []
+    start = time.perf_counter()
+    for query in queries:
+        hits = ann_index.query(query, top_k=top_k, n_probe=n_probe, refine=refine)
+        ann_results.append({hit.key for hit in hits})
+    ann_ms = (time.perf_counter() - start) / len(queries) * 1000
+    recall = np.mean(
+        [
+            len(exact & ann) / len(exact)
+            for exact, ann in zip(exact_results, ann_results)
+            if exact
+        ]
+    )
+    return RecallReport(recall=float(recall), ann_ms=ann_ms, exact_ms=exact_ms)
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+"""
+Semantic cache of final answers. A question close enough to one already
+answered, by cosine similarity of the question embeddings, gets the stored
+answer back without running the agents.
+
+Every entry belongs to a version of the data, see
+:meth:`~music_bi_agent_poc.one.one_08_answer_cache.AnswerCacheMixin.get_answer_cache_version`,
+the whole cache is dropped when the version changes.
+"""
+
+import typing as T
+import re
+import time
+import threading
+import dataclasses
+
+import numpy as np
+
+from .cache import CacheStats
+from .local_vector_index import normalize
+
+_number_pattern = re.compile(r"\d+(?:\.\d+)?")
+
+
+def get_numbers(text: str) -> tuple[str, ...]:
+    """
+    The numbers in a question, sorted. Embeddings barely tell
+    "top 5 artists" from "top 10 artists", or one year from another, so two
+    questions only share an answer if they have the same numbers.
+    """
+    return tuple(sorted(_number_pattern.findall(text)))
+
+
+@dataclasses.dataclass(frozen=True)
+class CachedAnswer:
+    """
+    A hit of :meth:`SemanticAnswerCache.get`.
+
+    :param question: the question the answer was stored for.
+    :param answer: the stored final answer.
+    :param score: cosine similarity between the two questions.
+    """
+
+    question: str
+    answer: str
+    score: float
+
+
+class SemanticAnswerCache:
+    """
+    In-memory index of question embeddings next to their final answers,
+    searched exactly with one matrix product, which is fast enough for the
+    thousands of entries it holds.
+
+    :param threshold: min cosine similarity between two questions to reuse
+        the answer.
+    :param max_items: max number of entries, the oldest ones are dropped
+        first.
+    :param ttl: seconds an entry stays valid after it is put, None means
+        until the version changes.
+    """
+
+    def __init__(
+        self,
+        threshold: float,
+        max_items: int,
+        ttl: T.Optional[float] = None,
+    ):
+        self.threshold = threshold
+        self.max_items = max_items
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self.version: T.Optional[T.Hashable] = None
+        self._questions: list[str] = []
+        self._answers: list[str] = []
+        self._numbers: list[tuple[str, ...]] = []
+        self._expire_at: list[float] = []
+        self._matrix: T.Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._questions)
+
+    def _clear(self):
+        self._questions.clear()
+        self._answers.clear()
+        self._numbers.clear()
+        self._expire_at.clear()
+        self._matrix = None
+
+    def _check_version(self, version: T.Hashable):
+        if version != self.version:
+            self._clear()
+            self.version = version
+
+    def _drop_first(self, n: int):
+        del self._questions[:n]
+        del self._answers[:n]
+        del self._numbers[:n]
+        del self._expire_at[:n]
+        self._matrix = self._matrix[n:] if len(self._questions) else None
+
+    def get(
+        self,
+        question: str,
+        embedding: T.Union[np.ndarray, T.Sequence[float]],
+        version: T.Hashable,
+    ) -> T.Optional[CachedAnswer]:
+        """
+        Find the most similar stored question with the same numbers, None if
+        it is below the threshold, expired, or there is none.
+
+        :param version: the current data version, a different one than the
+            entries were stored with clears the cache.
+        """
+        with self._lock:
+            self._check_version(version)
+            if self._matrix is None:
+                self.stats.misses += 1
+                return None
+            scores = self._matrix @ normalize(embedding)[0]
+            numbers = get_numbers(question)
+            now = time.monotonic()
+            for ith in np.argsort(-scores, kind="stable"):
+                score = float(scores[ith])
+                if score < self.threshold:
+                    break
+                if self._numbers[ith] == numbers and self._expire_at[ith] >= now:
+                    self.stats.hits += 1
+                    return CachedAnswer(
+                        question=self._questions[ith],
+                        answer=self._answers[ith],
+                        score=score,
+                    )
+            self.stats.misses += 1
+            return None
+
+    def put(
+        self,
+        question: str,
+        embedding: T.Union[np.ndarray, T.Sequence[float]],
+        answer: str,
+        version: T.Hashable,
+    ):
+        """
+        Store the final answer of a question for the given data version.
+        """
+        expire_at = float("inf") if self.ttl is None else time.monotonic() + self.ttl
+        row = normalize(embedding)
+        with self._lock:
+            self._check_version(version)
+            self._questions.append(question)
+            self._answers.append(answer)
+            self._numbers.append(get_numbers(question))
+            self._expire_at.append(expire_at)
+            if self._matrix is None:
+                self._matrix = row
+            else:
+                self._matrix = np.concatenate([self._matrix, row])
+            n_extra = len(self._questions) - self.max_items
+            if n_extra > 0:
+                self._drop_first(n_extra)
+                self.stats.evictions += n_extra
+
+    def clear(self):
+        with self._lock:
+            self._clear()
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+"""
+In-process caches shared by the RAG and SQL code paths.
+"""
+
+import typing as T
+import os
+import time
+import threading
+import dataclasses
+from pathlib import Path
+from collections import OrderedDict
+
+_NOTHING = object()
+
+
+@dataclasses.dataclass
+class CacheStats:
+    """
+    Hit / miss counters of a cache.
+    """
+
+    hits: int = dataclasses.field(default=0)
+    misses: int = dataclasses.field(default=0)
+    evictions: int = dataclasses.field(default=0)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return (self.hits / total) if total else 0.0
+
+
+class LRUCache:
+    """
+    Thread-safe least recently used cache, bounded by number of items and / or
+    total size of the values, with an optional per entry time to live.
+
+    :param max_items: max number of entries, None means unbounded.
+    :param max_bytes: max total size of the values measured by ``sizeof``,
+        None means unbounded.
+    :param ttl: seconds an entry stays valid after it is put, None means forever.
+    :param sizeof: function that returns the size of a value in bytes.
+    """
+
+    def __init__(
+        self,
+        max_items: T.Optional[int] = None,
+        max_bytes: T.Optional[int] = None,
+        ttl: T.Optional[float] = None,
+        sizeof: T.Callable[[T.Any], int] = lambda value: 0,
+    ):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self.stats = CacheStats()
+        self.total_bytes = 0
+        self._data: OrderedDict[T.Hashable, tuple[T.Any, int, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: T.Hashable) -> bool:
+        return self.get(key, _NOTHING, record_stats=False) is not _NOTHING
+
+    def _pop(self, key: T.Hashable):
+        _, size, _ = self._data.pop(key)
+        self.total_bytes -= size
+
+    def get(
+        self,
+        key: T.Hashable,
+        default: T.Any = None,
+        record_stats: bool = True,
+    ) -> T.Any:
+        with self._lock:
+            try:
+                value, _, expire_at = self._data[key]
+            except KeyError:
+                if record_stats:
+                    self.stats.misses += 1
+                return default
+            if expire_at < time.monotonic():
+                self._pop(key)
+                if record_stats:
+                    self.stats.misses += 1
+                return default
+            self._data.move_to_end(key)
+            if record_stats:
+                self.stats.hits += 1
+            return value
+
+    def put(self, key: T.Hashable, value: T.Any):
+        size = self.sizeof(value)
+        # a value that can never fit is not cached at all
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        expire_at = float("inf") if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+            self._data[key] = (value, size, expire_at)
+            self.total_bytes += size
+            while (
+                self.max_items is not None and len(self._data) > self.max_items
+            ) or (self.max_bytes is not None and self.total_bytes > self.max_bytes):
+                self._pop(next(iter(self._data)))
+                self.stats.evictions += 1
+
+    def pop(self, key: T.Hashable, default: T.Any = None) -> T.Any:
+        with self._lock:
+            if key not in self._data:
+                return default
+            value = self._data[key][0]
+            self._pop(key)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.total_bytes = 0
+
+
+def _sizeof_text(text: str) -> int:
+    return len(text.encode("utf-8"))
+
+
+class ChunkCache:
+    """
+    Two tier cache for knowledge base chunk bodies: an in-memory LRU bounded
+    by bytes, backed by an optional on-disk folder.
+
+    Chunk keys are the md5 of the chunk content, a key can never point to a
+    different body, so entries never need to be invalidated.
+
+    :param max_bytes: max total size of chunk bodies kept in memory.
+    :param dir_cache: folder of the on-disk tier, None disables it.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        dir_cache: T.Optional[Path] = None,
+    ):
+        self.memory = LRUCache(max_bytes=max_bytes, sizeof=_sizeof_text)
+        self.dir_cache = dir_cache
+        self.stats = CacheStats()
+        self.disk_hits = 0
+        self._lock = threading.Lock()
+
+    def _get_path(self, key: str) -> Path:
+        return self.dir_cache / f"{key}.txt"
+
+    def get(self, key: str) -> T.Optional[str]:
+        text = self.memory.get(key)
+        if text is not None:
+            with self._lock:
+                self.stats.hits += 1
+            return text
+        if self.dir_cache is not None:
+            try:
+                text = self._get_path(key).read_text(encoding="utf-8")
+            except FileNotFoundError:
+                pass
+            else:
+                self.memory.put(key, text)
+                with self._lock:
+                    self.stats.hits += 1
+                    self.disk_hits += 1
+                return text
+        with self._lock:
+            self.stats.misses += 1
+        return None
+
+    def put(self, key: str, text: str):
+        self.memory.put(key, text)
+        if self.dir_cache is not None:
+            path = self._get_path(key)
+            if not path.exists():
+                self.dir_cache.mkdir(parents=True, exist_ok=True)
+                # write then rename, so concurrent readers never see a partial file
+                path_tmp = path.with_name(
+                    f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+                )
+                path_tmp.write_text(text, encoding="utf-8")
+                os.replace(path_tmp, path)
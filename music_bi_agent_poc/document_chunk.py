@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+
+"""
+The S3 Vectors vector model of a knowledge base chunk.
+
+It lives in its own module so that ``s3vectorm`` and ``pydantic`` are only
+imported when the S3 Vectors retrieval backend is actually used.
+"""
+
+import typing as T
+
+from s3vectorm.api import Vector
+from pydantic import Field
+
+
+class DocumentChunk(Vector):
+    """
+    :param text: optional chunk content stored as non-filterable metadata,
+        it is None when the content is only stored in S3.
+    """
+
+    text: T.Optional[str] = Field(default=None)
+
+    def to_put_vectors_dict(self, data_type):
+        dct = super().to_put_vectors_dict(data_type=data_type)
+        dct["metadata"] = {k: v for k, v in dct["metadata"].items() if v is not None}
+        return dct
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+"""
+Persistent embedding cache keyed by ``(model name, sha256 of text)``.
+
+Each model has its own folder with two append-only files:
+
+- ``embeddings.f32``: raw float32 rows, memory-mapped for reads.
+- ``keys.txt``: the sha256 of the text of each row, one per line.
+"""
+
+import typing as T
+import hashlib
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from .cache import CacheStats
+
+
+def get_text_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    :param dir_root: root folder of the cache, a sub folder is used per model.
+    :param model_name: name of the embedding model.
+    :param dimension: dimension of the embeddings.
+    """
+
+    path_embeddings_name = "embeddings.f32"
+    path_keys_name = "keys.txt"
+
+    def __init__(
+        self,
+        dir_root: Path,
+        model_name: str,
+        dimension: int,
+    ):
+        self.dir_cache = dir_root / model_name.replace("/", "--")
+        self.model_name = model_name
+        self.dimension = dimension
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._rows: dict[str, int] = dict()
+        self._matrix: T.Optional[np.memmap] = None
+        self._load()
+
+    @property
+    def path_embeddings(self) -> Path:
+        return self.dir_cache / self.path_embeddings_name
+
+    @property
+    def path_keys(self) -> Path:
+        return self.dir_cache / self.path_keys_name
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _load(self):
+        if not (self.path_keys.exists() and self.path_embeddings.exists()):
+            return
+        text = self.path_keys.read_text(encoding="utf-8")
+        keys = text.splitlines()
+        if text and not text.endswith("\n"):
+            keys.pop()  # partially written key
+        row_size = self.dimension * 4
+        n_rows = self.path_embeddings.stat().st_size // row_size
+        # rows are written before keys, a row without its key means the last
+        # write was interrupted
+        n = min(len(keys), n_rows)
+        # drop the leftovers of the interrupted write, otherwise the next
+        # rows would be appended after them and misnumbered
+        if self.path_embeddings.stat().st_size != n * row_size:
+            with self.path_embeddings.open("r+b") as f:
+                f.truncate(n * row_size)
+        if len(keys) != n or not text.endswith("\n"):
+            self.path_keys.write_text(
+                "".join(f"{key}\n" for key in keys[:n]), encoding="utf-8"
+            )
+        self._rows = {key: ith for ith, key in enumerate(keys[:n])}
+        self._remap(n)
+
+    def _remap(self, n: int):
+        if n:
+            self._matrix = np.memmap(
+                self.path_embeddings,
+                dtype=np.float32,
+                mode="r",
+                shape=(n, self.dimension),
+            )
+        else:
+            self._matrix = None
+
+    def get_many(self, texts: list[str]) -> list[T.Optional[np.ndarray]]:
+        """
+        :return: the cached embedding of each text, None if not cached.
+        """
+        results = []
+        with self._lock:
+            for text in texts:
+                row = self._rows.get(get_text_sha256(text))
+                if row is None:
+                    self.stats.misses += 1
+                    results.append(None)
+                else:
+                    self.stats.hits += 1
+                    results.append(np.array(self._matrix[row]))
+        return results
+
+    def put_many(self, texts: list[str], embeddings: list[np.ndarray]):
+        keys = []
+        rows = []
+        with self._lock:
+            for text, embedding in zip(texts, embeddings):
+                key = get_text_sha256(text)
+                if key in self._rows or key in keys:
+                    continue
+                keys.append(key)
+                rows.append(np.asarray(embedding, dtype=np.float32))
+            if not keys:
+                return
+            self.dir_cache.mkdir(parents=True, exist_ok=True)
+            n = len(self._rows)
+            with self.path_embeddings.open("ab") as f:
+                f.write(np.stack(rows).tobytes())
+            with self.path_keys.open("a", encoding="utf-8") as f:
+                f.write("".join(f"{key}\n" for key in keys))
+            for ith, key in enumerate(keys, start=n):
+                self._rows[key] = ith
+            self._remap(len(self._rows))
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+"""
+Run independent assistant calls concurrently, each with its own time limit,
+and keep the results of the branches that succeed when another one fails.
+"""
+
+import typing as T
+import time
+import dataclasses
+from concurrent.futures import Executor, Future, TimeoutError
+
+
+@dataclasses.dataclass
+class BranchResult:
+    """
+    :param name: branch name, e.g. the assistant tool name.
+    :param output: the branch output, None if it failed or timed out.
+    :param error: why the branch failed, None if it succeeded.
+    :param elapsed: seconds until the branch finished or was given up.
+    """
+
+    name: str
+    output: T.Optional[str] = dataclasses.field(default=None)
+    error: T.Optional[str] = dataclasses.field(default=None)
+    elapsed: float = dataclasses.field(default=0.0)
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def fan_out(
+    executor: Executor,
+    branches: dict[str, T.Callable[[], str]],
+    timeouts: dict[str, float],
+) -> list[BranchResult]:
+    """
+    Start every branch on ``executor`` at once and wait for each one until
+    its own deadline, so the total latency is the one of the slowest branch,
+    bounded by the largest timeout.
+
+    A branch that times out keeps running in the background, since Python
+    threads can't be killed, but its result is dropped.
+
+    :param branches: branch name -> function that returns the branch output.
+    :param timeouts: branch name -> seconds, 0 or missing means no limit.
+    """
+    start = time.monotonic()
+    futures: dict[str, Future] = {
+        name: executor.submit(func) for name, func in branches.items()
+    }
+    results = []
+    for name, future in futures.items():
+        timeout = timeouts.get(name) or None
+        remaining = None
+        if timeout is not None:
+            remaining = max(0.0, start + timeout - time.monotonic())
+        try:
+            output = future.result(timeout=remaining)
+        except TimeoutError:  # not the builtin one before Python 3.11
+            future.cancel()
+            results.append(
+                BranchResult(
+                    name=name,
+                    error=f"timed out after {timeout} seconds",
+                    elapsed=time.monotonic() - start,
+                )
+            )
+        except Exception as e:
+            results.append(
+                BranchResult(
+                    name=name,
+                    error=f"{type(e).__name__}: {e}",
+                    elapsed=time.monotonic() - start,
+                )
+            )
+        else:
+            results.append(
+                BranchResult(
+                    name=name,
+                    output=output,
+                    elapsed=time.monotonic() - start,
+                )
+            )
+    return results
+
+
+def format_branch_results(results: list[BranchResult]) -> str:
+    """
+    One section per branch; a failed branch says so, so the caller can
+    answer with the other branches and mention what is missing.
+    """
+    sections = []
+    for result in results:
+        if result.ok:
+            body = result.output
+        else:
+            body = (
+                f"FAILED ({result.error}). This part of the answer is not "
+                f"available, answer with the other results and say what is missing."
+            )
+        sections.append(f"# {result.name}\n{body}")
+    return "\n\n".join(sections)
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+"""
+Keyword search next to the vector search of the knowledge base: an
+in-memory BM25 inverted index over the chunk texts, and reciprocal rank
+fusion of the keyword and vector rankings.
+
+Exact identifiers like ``one_03_agent`` or ``router_agent`` matter more than
+semantic similarity for code location questions, the tokenizer keeps them
+whole and also indexes their parts, so both ``router_agent`` and ``router``
+match.
+"""
+
+import typing as T
+import re
+import dataclasses
+
+import numpy as np
+
+from .local_vector_index import top_k_indices
+
+_word_pattern = re.compile(r"[A-Za-z0-9_]+")
+_part_pattern = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Lower case words, identifiers are kept whole and followed by their
+    snake_case / CamelCase parts: ``SqlMixin.run_select`` gives
+    ``sqlmixin, sql, mixin, run_select, run, select``.
+    """
+    tokens = []
+    for word in _word_pattern.findall(text):
+        tokens.append(word.lower())
+        parts = _part_pattern.findall(word)
+        if len(parts) > 1:
+            tokens.extend(part.lower() for part in parts)
+    return tokens
+
+
+@dataclasses.dataclass(frozen=True)
+class KeywordHit:
+    """
+    A single result of :meth:`BM25Index.query`.
+
+    :param key: the chunk key.
+    :param text: the chunk content.
+    :param score: the BM25 score.
+    """
+
+    key: str
+    text: str
+    score: float
+
+
+class BM25Index:
+    """
+    Okapi BM25 over an in-memory inverted index, the postings of each term
+    are NumPy arrays so a query term is scored in one vectorized step.
+
+    :param keys: chunk keys.
+    :param texts: chunk contents, aligned with ``keys``.
+    :param k1: term frequency saturation.
+    :param b: document length normalization.
+    """
+
+    def __init__(
+        self,
+        keys: list[str],
+        texts: list[str],
+        k1: float = 1.2,
+        b: float = 0.75,
+    ):
+        if len(keys) != len(texts):
+            raise ValueError(
+                f"keys and texts must have the same length, "
+                f"got {len(keys)}, {len(texts)}"
+            )
+        self.keys = list(keys)
+        self.texts = list(texts)
+        self.k1 = k1
+        self.b = b
+        postings: dict[str, dict[int, int]] = dict()
+        lengths = np.zeros(len(keys), dtype=np.float32)
+        for ith, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths[ith] = len(tokens)
+            for token in tokens:
+                frequencies = postings.setdefault(token, dict())
+                frequencies[ith] = frequencies.get(ith, 0) + 1
+        average_length = float(lengths.mean()) if len(keys) else 0.0
+        # the length normalization part of the BM25 denominator, per chunk
+        self._norms = k1 * (1 - b + b * lengths / (average_length or 1.0))
+        n = len(keys)
+        self._postings: dict[str, tuple[np.ndarray, np.ndarray, float]] = dict()
+        for token, frequencies in postings.items():
+            df = len(frequencies)
+            self._postings[token] = (
+                np.fromiter(frequencies.keys(), dtype=np.int64, count=df),
+                np.fromiter(frequencies.values(), dtype=np.float32, count=df),
+                float(np.log(1 + (n - df + 0.5) / (df + 0.5))),
+            )
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def query(self, text: str, top_k: int = 5) -> list[KeywordHit]:
+        """
+        Find the ``top_k`` chunks with the highest BM25 score, best first.
+        Chunks without any query term are never returned.
+        """
+        scores = np.zeros(len(self.keys), dtype=np.float32)
+        for token in set(tokenize(text)):
+            posting = self._postings.get(token)
+            if posting is None:
+                continue
+            rows, frequencies, idf = posting
+            scores[rows] += (
+                idf * frequencies * (self.k1 + 1) / (frequencies + self._norms[rows])
+            )
+        return [
+            KeywordHit(
+                key=self.keys[ith],
+                text=self.texts[ith],
+                score=float(scores[ith]),
+            )
+            for ith in top_k_indices(scores, top_k)
+            if scores[ith] > 0
+        ]
+
+
+def reciprocal_rank_fusion(
+    rankings: list[list[str]],
+    k: int = 60,
+) -> list[tuple[str, float]]:
+    """
+    Merge rankings of chunk keys, best first, by the sum of ``1 / (k + rank)``
+    over the rankings each key appears in. Only ranks matter, so BM25 scores
+    and cosine similarities don't need to be on the same scale.
+
+    :return: ``(key, fused score)`` pairs, best first, ties in order of first
+        appearance.
+    """
+    scores: dict[str, float] = dict()
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: -item[1])
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+"""
+Building blocks of the knowledge base indexing pipeline: batching, retry with
+exponential backoff and progress / throughput reporting.
+"""
+
+import typing as T
+import time
+import random
+import dataclasses
+
+_T = T.TypeVar("_T")
+
+#: AWS error codes that are worth retrying.
+RETRYABLE_ERROR_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "RequestLimitExceeded",
+    "SlowDown",
+    "ServiceUnavailableException",
+    "ServiceUnavailable",
+    "InternalServerException",
+    "InternalError",
+}
+
+
+def iter_batches(
+    iterable: T.Iterable[_T],
+    batch_size: int,
+) -> T.Iterator[list[_T]]:
+    """
+    Group an iterable into lists of at most ``batch_size`` items.
+    """
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_sized_batches(
+    items: T.Iterable[_T],
+    sizeof: T.Callable[[_T], int],
+    max_count: int,
+    max_bytes: int,
+) -> T.Iterator[list[_T]]:
+    """
+    Group items into lists that hold at most ``max_count`` items and at most
+    ``max_bytes`` in total measured by ``sizeof``. An item larger than
+    ``max_bytes`` is sent alone.
+    """
+    batch = []
+    batch_bytes = 0
+    for item in items:
+        size = sizeof(item)
+        if batch and (len(batch) >= max_count or batch_bytes + size > max_bytes):
+            yield batch
+            batch = []
+            batch_bytes = 0
+        batch.append(item)
+        batch_bytes += size
+    if batch:
+        yield batch
+
+
+def is_retryable_error(e: Exception) -> bool:
+    """
+    Whether an AWS error is a throttling, server side or network error.
+    """
+    import botocore.exceptions
+
+    if isinstance(e, botocore.exceptions.ClientError):
+        error = e.response.get("Error", {})
+        status_code = e.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+        return error.get("Code") in RETRYABLE_ERROR_CODES or status_code >= 500
+    return isinstance(
+        e,
+        (
+            botocore.exceptions.ConnectionError,
+            botocore.exceptions.ReadTimeoutError,
+        ),
+    )
+
+
+def call_with_retry(
+    func: T.Callable[[], _T],
+    max_attempts: int = 5,
+    base_delay: float = 0.5,
+    max_delay: float = 20.0,
+    is_retryable: T.Callable[[Exception], bool] = is_retryable_error,
+) -> _T:
+    """
+    Call ``func``, retry with exponential backoff and full jitter when it
+    raises a retryable error.
+    """
+    for attempt in range(1, max_attempts + 1):
+        try:
+            return func()
+        except Exception as e:
+            if attempt == max_attempts or not is_retryable(e):
+                raise
+            delay = min(max_delay, base_delay * (2 ** (attempt - 1)))
+            time.sleep(random.uniform(0, delay))
+
+
+@dataclasses.dataclass
+class IndexingProgress:
+    """
+    Progress and throughput of an indexing run.
+
+    :param total: number of chunks to index.
+    :param verbose: print a progress line on every update.
+    """
+
+    total: int
+    verbose: bool = dataclasses.field(default=True)
+    done: int = dataclasses.field(default=0)
+    start_time: float = dataclasses.field(default_factory=time.perf_counter)
+    end_time: T.Optional[float] = dataclasses.field(default=None)
+
+    @property
+    def elapsed(self) -> float:
+        end_time = time.perf_counter() if self.end_time is None else self.end_time
+        return end_time - self.start_time
+
+    @property
+    def chunks_per_sec(self) -> float:
+        elapsed = self.elapsed
+        return (self.done / elapsed) if elapsed > 0 else 0.0
+
+    def update(self, n: int):
+        self.done += n
+        if self.verbose:
+            print(
+                f"indexed {self.done}/{self.total} chunks, "
+                f"{self.elapsed:.2f} sec, {self.chunks_per_sec:.1f} chunks/sec"
+            )
+
+    def finish(self):
+        self.end_time = time.perf_counter()
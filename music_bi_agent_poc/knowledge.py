@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+
+"""
+Streaming parser of the all-in-one knowledge base file generated by
+``genai/generate_knowledge_base.py``.
+
+The file is a sequence of ``<document>`` blocks, each block starts with the
+metadata fields, one per line, followed by the file content::
+
+    <document>
+      <source_type>GitHub Repository</source_type>
+      <github_url>https://github.com/...</github_url>
+      ...
+      <path>music_bi_agent_poc/agent.py</path>
+      <content>
+    ...
+      </content>
+    </document>
+"""
+
+import typing as T
+import re
+import dataclasses
+from pathlib import Path
+
+TAB = "  "
+
+_metadata_line_pattern = re.compile(r"^\s*<(\w+)>(.*)</\1>\s*$")
+
+
+@dataclasses.dataclass
+class KnowledgeDocument:
+    """
+    A parsed ``<document>`` block.
+
+    :param xml: the complete ``<document>...</document>`` block.
+    :param start_offset: for a chunk of a long file, the character offset
+        where the chunk starts in the file content.
+    :param end_offset: for a chunk of a long file, the character offset
+        where the chunk ends in the file content (exclusive).
+    :param content: the file content inside ``<content>``.
+    """
+
+    xml: str
+    source_type: T.Optional[str] = dataclasses.field(default=None)
+    github_url: T.Optional[str] = dataclasses.field(default=None)
+    account: T.Optional[str] = dataclasses.field(default=None)
+    repo: T.Optional[str] = dataclasses.field(default=None)
+    branch: T.Optional[str] = dataclasses.field(default=None)
+    path: T.Optional[str] = dataclasses.field(default=None)
+    title: T.Optional[str] = dataclasses.field(default=None)
+    start_offset: T.Optional[int] = dataclasses.field(default=None)
+    end_offset: T.Optional[int] = dataclasses.field(default=None)
+    content: T.Optional[str] = dataclasses.field(default=None)
+
+    @property
+    def is_chunk(self) -> bool:
+        return self.start_offset is not None and self.end_offset is not None
+
+    @property
+    def source(self) -> T.Optional[str]:
+        """
+        Identifier of the file this document comes from.
+        """
+        return self.github_url or self.path
+
+    def to_xml(self) -> str:
+        """
+        Render the document in the same layout as the knowledge base file.
+        """
+        lines = ["<document>"]
+        for field in _metadata_fields:
+            value = getattr(self, field)
+            if value is not None:
+                lines.append(f"{TAB}<{field}>{value}</{field}>")
+        if self.content is not None:
+            lines.append(f"{TAB}<content>")
+            lines.append(self.content)
+            lines.append(f"{TAB}</content>")
+        lines.append("</document>")
+        return "\n".join(lines)
+
+
+_metadata_fields = [
+    field.name
+    for field in dataclasses.fields(KnowledgeDocument)
+    if field.name not in ("xml", "content")
+]
+_int_metadata_fields = {"start_offset", "end_offset"}
+
+
+def parse_document_lines(lines: list[str]) -> KnowledgeDocument:
+    """
+    Parse the lines of a ``<document>`` block, including the opening and
+    closing tag lines.
+    """
+    kwargs = dict()
+    content_start = None
+    content_end = None
+    for ith, line in enumerate(lines):
+        stripped = line.strip()
+        if content_start is None:
+            if stripped == "<content>":
+                content_start = ith + 1
+                continue
+            match = _metadata_line_pattern.match(line)
+            if match and match.group(1) in _metadata_fields:
+                field, value = match.group(1), match.group(2)
+                kwargs[field] = int(value) if field in _int_metadata_fields else value
+        elif stripped == "</content>":
+            content_end = ith
+    if content_start is not None and content_end is not None:
+        kwargs["content"] = "\n".join(lines[content_start:content_end])
+    return KnowledgeDocument(xml="\n".join(lines), **kwargs)
+
+
+def iter_knowledge_documents(path: Path) -> T.Iterator[KnowledgeDocument]:
+    """
+    Read the knowledge base file line by line and yield the ``<document>``
+    blocks one at a time, memory usage doesn't grow with the file size.
+    """
+    lines = None
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\r\n")
+            if lines is None:
+                if line.strip() == "<document>":
+                    lines = [line]
+            else:
+                lines.append(line)
+                if line.strip() == "</document>":
+                    yield parse_document_lines(lines)
+                    lines = None
+
+
+def _split_text(
+    text: str,
+    max_tokens: int,
+    count_tokens: T.Callable[[str], int],
+) -> list[str]:
+    """
+    Recursively halve a text, preferably at a whitespace, until every piece
+    fits in ``max_tokens``.
+    """
+    if len(text) <= 1 or count_tokens(text) <= max_tokens:
+        return [text]
+    mid = len(text) // 2
+    space = text.rfind(" ", 0, mid)
+    if space > 0:
+        mid = space + 1
+    return _split_text(text[:mid], max_tokens, count_tokens) + _split_text(
+        text[mid:], max_tokens, count_tokens
+    )
+
+
+def split_document(
+    document: KnowledgeDocument,
+    max_tokens: int,
+    overlap_tokens: int,
+    count_tokens: T.Callable[[str], int],
+) -> list[KnowledgeDocument]:
+    """
+    Split a document whose content doesn't fit in the embedding model window
+    into overlapping chunks. Each chunk keeps the document metadata and
+    records its character range in the file content, so adjacent chunks can
+    be stitched back together with :func:`merge_adjacent_chunks`.
+
+    Chunks are made of whole lines, only a single line longer than the budget
+    is cut in pieces.
+
+    :param max_tokens: token budget of a chunk, including the metadata header.
+    :param overlap_tokens: max number of tokens repeated at the start of the
+        next chunk.
+    :param count_tokens: function that counts the tokens of a text.
+
+    :return: ``[document]`` unchanged if it already fits, otherwise the chunks.
+    """
+    if document.content is None:
+        return [document]
+    header = dataclasses.replace(
+        document,
+        start_offset=len(document.content),
+        end_offset=len(document.content),
+        content="",
+    ).to_xml()
+    # keep at least some room for the content even with a very long header
+    budget = max(max_tokens - count_tokens(header), max_tokens // 4, 1)
+    if count_tokens(document.xml) <= max_tokens:
+        return [document]
+
+    # (start offset, end offset, n tokens) of each unit
+    units: list[tuple[int, int, int]] = []
+    offset = 0
+    for line in document.content.splitlines(keepends=True):
+        for piece in _split_text(line, budget, count_tokens):
+            units.append((offset, offset + len(piece), count_tokens(piece)))
+            offset += len(piece)
+
+    chunks = []
+    i = 0
+    while i < len(units):
+        j = i
+        n_tokens = 0
+        while j < len(units) and (j == i or n_tokens + units[j][2] <= budget):
+            n_tokens += units[j][2]
+            j += 1
+        start_offset, end_offset = units[i][0], units[j - 1][1]
+        chunks.append(
+            dataclasses.replace(
+                document,
+                start_offset=start_offset,
+                end_offset=end_offset,
+                content=document.content[start_offset:end_offset],
+            )
+        )
+        if j >= len(units):
+            break
+        # step back for the overlap, but always move forward
+        k = j
+        n_overlap = 0
+        while k - 1 > i and n_overlap + units[k - 1][2] <= overlap_tokens:
+            k -= 1
+            n_overlap += units[k][2]
+        i = k
+    for chunk in chunks:
+        chunk.xml = chunk.to_xml()
+    return chunks
+
+
+def merge_adjacent_chunks(texts: list[str]) -> list[str]:
+    """
+    Merge retrieved chunks that come from the same file and overlap or touch
+    each other into a single ``<document>``, removing the repeated overlap.
+
+    The merged chunk takes the rank of its best ranked member, texts that are
+    not chunks of a long file are returned as they are.
+    """
+    # (rank, document) of each file
+    groups: dict[str, list[tuple[int, KnowledgeDocument]]] = dict()
+    ranked: list[tuple[int, str]] = []
+    for rank, text in enumerate(texts):
+        document = parse_document_lines(text.split("\n"))
+        if document.is_chunk and document.source and document.content is not None:
+            groups.setdefault(document.source, []).append((rank, document))
+        else:
+            ranked.append((rank, text))
+
+    for members in groups.values():
+        members.sort(key=lambda x: x[1].start_offset)
+        rank, merged = members[0]
+        for next_rank, document in members[1:]:
+            if document.start_offset <= merged.end_offset:
+                if document.end_offset > merged.end_offset:
+                    cut = merged.end_offset - document.start_offset
+                    merged = dataclasses.replace(
+                        merged,
+                        end_offset=document.end_offset,
+                        content=merged.content + document.content[cut:],
+                    )
+                rank = min(rank, next_rank)
+            else:
+                ranked.append((rank, merged.to_xml()))
+                rank, merged = next_rank, document
+        ranked.append((rank, merged.to_xml()))
+
+    ranked.sort(key=lambda x: x[0])
+    return [text for _, text in ranked]
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+"""
+In-process exact cosine similarity index. It is the local alternative of the
+S3 Vectors index for knowledge base retrieval, the whole corpus is held in
+memory as a single float32 matrix next to the chunk texts.
+"""
+
+import typing as T
+import json
+import dataclasses
+from pathlib import Path
+
+import numpy as np
+
+
+@dataclasses.dataclass(frozen=True)
+class SearchHit:
+    """
+    A single result of :meth:`LocalVectorIndex.query`.
+
+    :param key: the chunk key, md5 of the chunk content.
+    :param text: the chunk content.
+    :param score: cosine similarity between the query and the chunk.
+    """
+
+    key: str
+    text: str
+    score: float
+
+
+def normalize(embeddings: T.Union[np.ndarray, T.Sequence[T.Sequence[float]]]) -> np.ndarray:
+    """
+    Convert embeddings into a 2D float32 matrix of unit length rows.
+    """
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """
+    Return the indices of the ``top_k`` highest scores, best first.
+
+    ``argpartition`` selects the candidates in O(n), only the ``top_k``
+    candidates are sorted.
+    """
+    n = scores.shape[0]
+    top_k = min(top_k, n)
+    if top_k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if top_k < n:
+        indices = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        indices = np.arange(n)
+    return indices[np.argsort(-scores[indices], kind="stable")]
+
+
+class LocalVectorIndex:
+    """
+    Exact cosine top-k search over normalized embeddings.
+
+    :param keys: chunk keys.
+    :param texts: chunk contents, aligned with ``keys``.
+    :param embeddings: chunk embeddings, aligned with ``keys``.
+    """
+
+    path_embeddings_name = "embeddings.npy"
+    path_chunks_name = "chunks.json"
+
+    def __init__(
+        self,
+        keys: list[str],
+        texts: list[str],
+        embeddings: T.Union[np.ndarray, T.Sequence[T.Sequence[float]]],
+    ):
+        if not (len(keys) == len(texts) == len(embeddings)):
+            raise ValueError(
+                f"keys, texts and embeddings must have the same length, "
+                f"got {len(keys)}, {len(texts)}, {len(embeddings)}"
+            )
+        self.keys = list(keys)
+        self.texts = list(texts)
+        if len(self.keys):
+            self.matrix = normalize(embeddings)
+        else:
+            self.matrix = np.zeros((0, 0), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def query(
+        self,
+        embedding: T.Union[np.ndarray, T.Sequence[float]],
+        top_k: int = 5,
+    ) -> list[SearchHit]:
+        """
+        Find the ``top_k`` most similar chunks, best first.
+        """
+        if len(self.keys) == 0:
+            return []
+        scores = self.matrix @ normalize(embedding)[0]
+        return [
+            SearchHit(
+                key=self.keys[ith],
+                text=self.texts[ith],
+                score=float(scores[ith]),
+            )
+            for ith in top_k_indices(scores, top_k)
+        ]
+
+    @classmethod
+    def exists(cls, dir_index: Path) -> bool:
+        return (dir_index / cls.path_embeddings_name).exists() and (
+            dir_index / cls.path_chunks_name
+        ).exists()
+
+    def dump(self, dir_index: Path):
+        """
+        Persist the index to a folder, so it can be loaded without re-embedding.
+        """
+        dir_index.mkdir(parents=True, exist_ok=True)
+        np.save(dir_index / self.path_embeddings_name, self.matrix)
+        chunks = [
+            {"key": key, "text": text} for key, text in zip(self.keys, self.texts)
+        ]
+        (dir_index / self.path_chunks_name).write_text(
+            json.dumps(chunks), encoding="utf-8"
+        )
+
+    @classmethod
+    def load(cls, dir_index: Path) -> "LocalVectorIndex":
+        matrix = np.load(dir_index / cls.path_embeddings_name)
+        chunks = json.loads(
+            (dir_index / cls.path_chunks_name).read_text(encoding="utf-8")
+        )
+        return cls(
+            keys=[chunk["key"] for chunk in chunks],
+            texts=[chunk["text"] for chunk in chunks],
+            embeddings=matrix,
+        )
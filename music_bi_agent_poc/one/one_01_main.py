@@ -1,9 +1,17 @@
 # -*- coding: utf-8 -*-
 
+import typing as T
+
+from ..settings import Settings
+
 from .one_02_aws import AwsMixin
 from .one_03_agent import AgentMixin
 from .one_04_sql import SqlMixin
 from .one_05_rag import RagMixin
+from .one_06_warmup import WarmupMixin
+from .one_07_session import SessionMixin
+from .one_08_answer_cache import AnswerCacheMixin
+from .one_09_route_classifier import RouteClassifierMixin
 
 
 class One(
@@ -11,16 +19,17 @@ class One(
     AgentMixin,
     SqlMixin,
     RagMixin,
+    WarmupMixin,
+    SessionMixin,
+    AnswerCacheMixin,
+    RouteClassifierMixin,
 ):
-    pass
+    def __init__(self, settings: T.Optional[Settings] = None):
+        if settings is None:
+            settings = Settings.from_env()
+        self.settings = settings
+        if settings.warm_up_on_init:
+            self.warm_up()
 
 
 one = One()
-
-from ..utils import get_description
-
-one.list_databases.tool_spec["description"] = get_description(one.ohmy_sql_adapter.tool_list_databases)
-one.list_tables.tool_spec["description"] = get_description(one.ohmy_sql_adapter.tool_list_tables)
-one.get_all_database_details.tool_spec["description"] = get_description(one.ohmy_sql_adapter.tool_get_all_database_details)
-one.get_schema_details.tool_spec["description"] = get_description(one.ohmy_sql_adapter.tool_get_schema_details)
-one.execute_select_statement.tool_spec["description"] = get_description(one.ohmy_sql_adapter.tool_execute_select_statement)
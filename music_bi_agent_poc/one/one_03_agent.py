@@ -1,19 +1,37 @@
 # -*- coding: utf-8 -*-
 
 import typing as T
-from functools import cached_property
-
-import strands
+import threading
+from pathlib import Path
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 
 from ..paths import path_enum
+from ..utils import lazy_tool, locked_cached_property
+from ..fan_out import fan_out, format_branch_results
+from ..routing import ToolCallRecorder, get_failed_assistants
 
 if T.TYPE_CHECKING:  # pragma: no cover
+    import strands
+    from strands.agent.conversation_manager import ConversationManager
+
     from .one_01_main import One
 
 
+@lru_cache(maxsize=None)
+def read_prompt(path: Path) -> str:
+    """
+    Read a system prompt file once, every agent and session shares it.
+    """
+    return path.read_text()
+
+
 class AgentMixin:
-    @strands.tool
-    def sql_assistant(self, query: str) -> str:
+    #: print the output of the SQL, knowledge and report agents as they run
+    print_agent_output: bool = True
+
+    @lazy_tool(context=True)
+    def sql_assistant(self, query: str, tool_context: T.Any = None) -> str:
         """
         SQL database analysis assistant for querying the Chinook music store database.
 
@@ -36,11 +54,13 @@ class AgentMixin:
         Example usage:
             query = "Run SQL if needed: 'Which artist has the highest sales?'. Use your available tools to write SQL (SELECT ONLY), run SQL, and interpret SQL results properly."
         """
-        response = self.sql_agent(query)
-        return str(response)
+        return self.run_assistants(
+            {"sql_assistant": query},
+            failed=get_failed_assistants(tool_context),
+        )
 
-    @strands.tool
-    def knowledge_assistant(self, query: str) -> str:
+    @lazy_tool(context=True)
+    def knowledge_assistant(self, query: str, tool_context: T.Any = None) -> str:
         """
         Knowledge base retrieval assistant for project documentation and codebase information.
 
@@ -63,52 +83,256 @@ class AgentMixin:
         Example usage:
             query = "Retrieve knowledge if needed: 'How to run the test suite?'. Use your available tools to retrieve relevant information from knowledge base."
         """
-        response = self.knowledge_agent(query)
+        return self.run_assistants(
+            {"knowledge_assistant": query},
+            failed=get_failed_assistants(tool_context),
+        )
+
+    @lazy_tool(context=True)
+    def hybrid_assistant(
+        self,
+        sql_query: str,
+        knowledge_query: str,
+        tool_context: T.Any = None,
+    ) -> str:
+        """
+        Run sql_assistant and knowledge_assistant at the same time, for hybrid
+        questions whose data part and knowledge part don't depend on each
+        other. Faster than calling the two assistants one after the other.
+
+        If one assistant fails or times out, the result of the other one is
+        still returned and the failed part is marked as FAILED.
+
+        :param sql_query: query for sql_assistant, same format as its ``query``
+            parameter ("Run SQL if needed: ...").
+        :param knowledge_query: query for knowledge_assistant, same format as
+            its ``query`` parameter ("Retrieve knowledge if needed: ...").
+
+        :return: One section per assistant with its answer.
+        """
+        return self.run_assistants(
+            {
+                "sql_assistant": sql_query,
+                "knowledge_assistant": knowledge_query,
+            },
+            failed=get_failed_assistants(tool_context),
+        )
+
+    def ask_sql_agent(self: "One", query: str) -> str:
+        # common questions have a vetted SQL statement, no LLM call needed
+        answer = self.answer_with_sql_template(query)
+        if answer is not None:
+            return answer
+        self.refresh_sql_agent_system_prompt()
+        # a strands agent keeps its conversation, it can't run twice at once
+        with self.sql_agent_lock:
+            response = self.sql_agent(query)
+        return str(response)
+
+    def ask_knowledge_agent(self: "One", query: str) -> str:
+        with self.knowledge_agent_lock:
+            response = self.knowledge_agent(query)
         return str(response)
 
-    @cached_property
-    def router_agent(self: "One") -> strands.Agent:
+    @locked_cached_property
+    def sql_agent_lock(self: "One") -> threading.Lock:
+        return threading.Lock()
+
+    @locked_cached_property
+    def knowledge_agent_lock(self: "One") -> threading.Lock:
+        return threading.Lock()
+
+    @locked_cached_property
+    def assistant_executor(self: "One") -> ThreadPoolExecutor:
+        """
+        Threads the assistants run on, see :meth:`run_assistants`.
+        """
+        return ThreadPoolExecutor(
+            max_workers=self.settings.assistant_max_workers,
+            thread_name_prefix="assistant",
+        )
+
+    def run_assistants(
+        self: "One",
+        queries: dict[str, str],
+        failed: T.Optional[list[str]] = None,
+    ) -> str:
+        """
+        Run the given assistants concurrently, each one bounded by its time
+        limit, ``settings.sql_assistant_timeout`` or
+        ``settings.knowledge_assistant_timeout``.
+
+        :param queries: ``"sql_assistant"`` and / or ``"knowledge_assistant"``
+            -> the query to send to it.
+        :param failed: if given, the names of the assistants that failed or
+            timed out are appended to it.
+
+        :return: the assistant answer if there is a single one that succeeded,
+            otherwise one section per assistant, failed ones marked as FAILED.
+        """
+        funcs = {
+            "sql_assistant": self.ask_sql_agent,
+            "knowledge_assistant": self.ask_knowledge_agent,
+        }
+        timeouts = {
+            "sql_assistant": self.settings.sql_assistant_timeout,
+            "knowledge_assistant": self.settings.knowledge_assistant_timeout,
+        }
+        results = fan_out(
+            executor=self.assistant_executor,
+            branches={
+                name: (lambda func=funcs[name], query=query: func(query))
+                for name, query in queries.items()
+            },
+            timeouts=timeouts,
+        )
+        if failed is not None:
+            failed.extend(result.name for result in results if not result.ok)
+        if len(results) == 1 and results[0].ok:
+            return results[0].output
+        return format_branch_results(results)
+
+    def make_conversation_manager(self: "One") -> "ConversationManager":
+        """
+        Keep only the last ``settings.conversation_window_size`` messages of
+        a conversation, so the prompt of a long lived agent doesn't grow
+        with every call.
+        """
+        from strands.agent.conversation_manager import (
+            SlidingWindowConversationManager,
+        )
+
+        return SlidingWindowConversationManager(
+            window_size=self.settings.conversation_window_size,
+            # trim old messages, don't blank out the latest tool result
+            should_truncate_results=False,
+        )
+
+    def make_router_agent(self: "One") -> "strands.Agent":
+        """
+        Build a new router agent, with an empty conversation.
+        """
+        import strands
+        from strands.tools.executors import ConcurrentToolExecutor
+
         return strands.Agent(
             model=self.model,
-            system_prompt=path_enum.path_prompts_router.read_text(),
+            system_prompt=read_prompt(path_enum.path_prompts_router),
+            conversation_manager=self.make_conversation_manager(),
             callback_handler=None,  # Suppress intermediate output for cleaner UX
             tools=[
                 self.sql_assistant,
                 self.knowledge_assistant,
+                self.hybrid_assistant,
             ],
+            # tool calls of the same turn run at the same time
+            tool_executor=ConcurrentToolExecutor(),
+            # tells route() which specialists were called
+            hooks=[ToolCallRecorder()],
         )
 
-    @cached_property
-    def sql_agent(self: "One") -> strands.Agent:
+    @locked_cached_property
+    def router_agent(self: "One") -> "strands.Agent":
+        return self.make_router_agent()
+
+    def get_sql_agent_system_prompt(self: "One") -> str:
+        """
+        The SQL agent prompt, followed by the schema digest when
+        ``settings.sql_schema_in_prompt`` is on, so the agent can write SQL
+        without a ``get_schema_details`` round trip.
+        """
+        system_prompt = read_prompt(path_enum.path_prompts_sql_agent)
+        if self.settings.sql_schema_in_prompt:
+            system_prompt = (
+                f"{system_prompt}\n\n"
+                f"## Database Schema\n\n"
+                f"Up to date schema, one line per table, same notation as "
+                f"`get_schema_details`:\n\n"
+                f"```\n{self.get_schema_digest()}\n```\n"
+            )
+        return system_prompt
+
+    def refresh_sql_agent_system_prompt(self: "One"):
+        """
+        Rebuild the SQL agent system prompt if the database changed since the
+        schema digest was injected.
+        """
+        if not self.settings.sql_schema_in_prompt:
+            return
+        if "sql_agent" not in self.__dict__:
+            return
+        version = self.get_schema_version()
+        if version != self.__dict__.get("sql_agent_schema_version"):
+            self.sql_agent.system_prompt = self.get_sql_agent_system_prompt()
+            self.__dict__["sql_agent_schema_version"] = version
+
+    @locked_cached_property
+    def sql_agent(self: "One") -> "strands.Agent":
+        import strands
+
+        self.__dict__["sql_agent_schema_version"] = self.get_schema_version()
         return strands.Agent(
             model=self.model,
-            system_prompt=path_enum.path_prompts_sql_agent.read_text(),
-            # callback_handler=None,
+            system_prompt=self.get_sql_agent_system_prompt(),
+            conversation_manager=self.make_conversation_manager(),
             tools=[
                 self.list_databases,
                 self.list_tables,
                 self.get_all_database_details,
                 self.get_schema_details,
                 self.execute_select_statement,
+                self.fetch_more_rows,
             ],
+            **self.get_callback_handler_kwargs(),
         )
 
-    @cached_property
-    def knowledge_agent(self: "One") -> strands.Agent:
+    @locked_cached_property
+    def knowledge_agent(self: "One") -> "strands.Agent":
+        import strands
+
         return strands.Agent(
             model=self.model,
-            system_prompt=path_enum.path_prompts_knowledge.read_text(),
-            # callback_handler=None,
+            system_prompt=read_prompt(path_enum.path_prompts_knowledge),
+            conversation_manager=self.make_conversation_manager(),
             tools=[
                 self.retrieve_knowledge,
             ],
+            **self.get_callback_handler_kwargs(),
         )
 
-    @cached_property
-    def report_agent(self: "One") -> strands.Agent:
+    def get_callback_handler_kwargs(
+        self: "One",
+        quiet: T.Optional[bool] = None,
+    ) -> dict[str, T.Any]:
+        """
+        ``strands.Agent`` arguments that stop the agent from printing its
+        output when ``quiet``, by default when :attr:`print_agent_output` is
+        off.
+        """
+        if quiet is None:
+            quiet = not self.print_agent_output
+        return {"callback_handler": None} if quiet else {}
+
+    def make_report_agent(
+        self: "One",
+        quiet: T.Optional[bool] = None,
+    ) -> "strands.Agent":
+        """
+        Build a new report agent, with an empty conversation.
+
+        :param quiet: don't print the report as it is generated, for callers
+            that stream it themselves.
+        """
+        import strands
+
         return strands.Agent(
             model=self.model,
-            system_prompt=path_enum.path_prompts_report.read_text(),
-            # callback_handler=None,
+            system_prompt=read_prompt(path_enum.path_prompts_report),
+            conversation_manager=self.make_conversation_manager(),
             tools=[],
+            **self.get_callback_handler_kwargs(quiet),
         )
+
+    @locked_cached_property
+    def report_agent(self: "One") -> "strands.Agent":
+        return self.make_report_agent()
@@ -1,30 +1,76 @@
 # -*- coding: utf-8 -*-
 
 import typing as T
-from functools import cached_property
-
-import strands
-
-from mcp_ohmy_sql.config.api import (
-    TableFilter,
-    Schema,
-    SqlalchemyConnection,
-    Database,
-    Config,
-)
-from mcp_ohmy_sql.adapter.api import Adapter
+import sys
+import time
+import threading
+from pathlib import Path
 
 from ..paths import path_enum
+from ..settings import FullScanPolicyEnum
+from ..utils import get_description, lazy_tool, locked_cached_property
+from ..cache import LRUCache
+from ..sql_schema import get_sqlite_path, get_file_version, make_schema_digest
+from ..sql_query import normalize_sql, make_params_key, is_error_result
+from ..sql_execution import (
+    paginate,
+    execute_select_page,
+    make_query_digest,
+    make_cursor,
+    parse_cursor,
+    format_page,
+    format_select_result,
+)
+from ..sqlite_engine import (
+    make_sqlite_url,
+    make_sqlite_engine_kwargs,
+    install_sqlite_pragmas,
+)
 
 if T.TYPE_CHECKING:  # pragma: no cover
+    from mcp_ohmy_sql.adapter.api import Adapter
+
+    from ..analytics import AnalyticSnapshot
+    from ..sql_plan import TableStats, PlanCheck, QueryAdvisor, IndexProposal
     from .one_01_main import One
 
 
+def _get_adapter_tool_description(name: str) -> T.Callable[[], str]:
+    """
+    The tools reuse the descriptions of the ``mcp_ohmy_sql`` adapter tools,
+    read from the ``Adapter`` class when the tool is built.
+    """
+
+    def get():
+        from mcp_ohmy_sql.adapter.api import Adapter
+
+        return get_description(getattr(Adapter, name))
+
+    return get
+
+
+_analytic_snapshot_lock = threading.Lock()
+
+
 class SqlMixin:
 
-    @cached_property
+    @locked_cached_property
     def ohmy_sql_config(self: "One"):
-        return Config(
+        from mcp_ohmy_sql.config.api import (
+            TableFilter,
+            Schema,
+            SqlalchemyConnection,
+            Database,
+            Config,
+        )
+
+        if self.settings.sqlite_read_only:
+            create_engine_kwargs = make_sqlite_engine_kwargs(
+                pool_size=self.settings.sqlite_pool_size,
+            )
+        else:
+            create_engine_kwargs = dict()
+        config = Config(
             version="0.1.1",
             databases=[
                 Database(
@@ -32,7 +78,12 @@ class SqlMixin:
                     description="Chinook is a sample database available for SQL Server, Oracle, MySQL, etc. It can be created by running a single SQL script. Chinook database is an alternative to the Northwind database, being ideal for demos and testing ORM tools targeting single and multiple database servers.",
                     db_type="sqlite",
                     connection=SqlalchemyConnection(
-                        url=f"sqlite:///{path_enum.path_sqlite}",
+                        url=make_sqlite_url(
+                            path_enum.path_sqlite,
+                            read_only=self.settings.sqlite_read_only,
+                            immutable=self.settings.sqlite_immutable,
+                        ),
+                        create_engine_kwargs=create_engine_kwargs,
                     ),
                     schemas=[
                         Schema(
@@ -46,56 +97,624 @@ class SqlMixin:
                 )
             ],
         )
+        if self.settings.sqlite_read_only:
+            for database in config.databases:
+                install_sqlite_pragmas(
+                    database.connection.sa_engine,
+                    mmap_size=self.settings.sqlite_mmap_size,
+                    cache_size=self.settings.sqlite_cache_size,
+                )
+        return config
+
+    @locked_cached_property
+    def ohmy_sql_adapter(self: "One") -> "Adapter":
+        from mcp_ohmy_sql.adapter.api import Adapter
 
-    @cached_property
-    def ohmy_sql_adapter(self: "One") -> Adapter:
         return Adapter(
             config=self.ohmy_sql_config,
         )
 
-    @strands.tool
+    def get_database_version(
+        self: "One",
+        database_identifier: str,
+    ) -> T.Optional[T.Hashable]:
+        """
+        A token that changes whenever the content of the database changes,
+        for a SQLite file it is the file mtime and size. None if the database
+        is unknown or not a SQLite file, then the database is assumed to
+        never change during the life of the process.
+        """
+        database = self.ohmy_sql_config.databases_mapping.get(database_identifier)
+        if database is None or database.db_type != "sqlite":
+            return None
+        path = get_sqlite_path(str(database.connection.url))
+        if path is None:
+            return None
+        return get_file_version(path)
+
+    @locked_cached_property
+    def schema_cache(self: "One") -> LRUCache:
+        """
+        Cache of schema introspection results, keyed by database identifier
+        and schema name. Each entry remembers the database version it was
+        built for, see :meth:`get_cached_schema_details`.
+        """
+        return LRUCache(max_items=64)
+
+    @locked_cached_property
+    def seen_database_versions(self: "One") -> dict[str, T.Hashable]:
+        """
+        Last seen version of each database, see :meth:`refresh_stale_database`.
+        """
+        return dict()
+
+    def refresh_stale_database(
+        self: "One",
+        database_identifier: str,
+        version: T.Optional[T.Hashable],
+    ):
+        """
+        If the database changed since it was last seen, drop the SQLAlchemy
+        metadata that ``mcp_ohmy_sql`` caches on the database object, and
+        the pooled connections, which an ``immutable`` SQLite connection
+        requires to see the change.
+        """
+        database = self.ohmy_sql_config.databases_mapping[database_identifier]
+        seen_version = self.seen_database_versions.get(database_identifier, version)
+        if seen_version != version:
+            database.__dict__.pop("sa_metadata", None)
+            # don't close connections that other threads may be using
+            database.connection.sa_engine.dispose(close=False)
+        self.seen_database_versions[database_identifier] = version
+
+    def get_cached_schema_details(
+        self: "One",
+        database_identifier: str,
+        schema_name: T.Optional[str] = None,
+    ) -> str:
+        """
+        Same as ``ohmy_sql_adapter.tool_get_schema_details``, but the database
+        is only reflected again when :meth:`get_database_version` changes.
+        """
+        if database_identifier not in self.ohmy_sql_config.databases_mapping:
+            return self.ohmy_sql_adapter.tool_get_schema_details(
+                database_identifier=database_identifier,
+                schema_name=schema_name,
+            )
+        key = (database_identifier, schema_name)
+        version = self.get_database_version(database_identifier)
+        cached = self.schema_cache.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        self.refresh_stale_database(database_identifier, version)
+        schema_details = self.ohmy_sql_adapter.tool_get_schema_details(
+            database_identifier=database_identifier,
+            schema_name=schema_name,
+        )
+        self.schema_cache.put(key, (version, schema_details))
+        return schema_details
+
+    def get_schema_digest(self: "One") -> str:
+        """
+        Compact, one line per table, schema of every configured database, to
+        be injected into the SQL agent system prompt.
+        """
+        sections = []
+        for database in self.ohmy_sql_config.databases:
+            for schema in database.schemas:
+                schema_details = self.get_cached_schema_details(
+                    database_identifier=database.identifier,
+                    schema_name=schema.name,
+                )
+                sections.append(
+                    f"Database {database.identifier!r}, schema {schema.name or 'default'!r}:\n"
+                    f"{make_schema_digest(schema_details)}"
+                )
+        return "\n\n".join(sections)
+
+    def get_schema_version(self: "One") -> tuple:
+        return tuple(
+            self.get_database_version(database.identifier)
+            for database in self.ohmy_sql_config.databases
+        )
+
+    @lazy_tool(description=_get_adapter_tool_description("tool_list_databases"))
     def list_databases(
         self,
     ):
         return self.ohmy_sql_adapter.tool_list_databases()
 
-    @strands.tool
+    @lazy_tool(description=_get_adapter_tool_description("tool_list_tables"))
     def list_tables(
         self,
         database_identifier: str,
         schema_name: T.Optional[str] = None,
     ):
+        if database_identifier in self.ohmy_sql_config.databases_mapping:
+            self.refresh_stale_database(
+                database_identifier,
+                self.get_database_version(database_identifier),
+            )
         return self.ohmy_sql_adapter.tool_list_tables(
             database_identifier=database_identifier,
             schema_name=schema_name,
         )
 
-    @strands.tool
+    @lazy_tool(description=_get_adapter_tool_description("tool_get_all_database_details"))
     def get_all_database_details(
         self,
     ):
-        return self.ohmy_sql_adapter.tool_get_all_database_details()
+        versions = self.get_schema_version()
+        cached = self.schema_cache.get("__all__")
+        if cached is not None and cached[0] == versions:
+            return cached[1]
+        for database, version in zip(self.ohmy_sql_config.databases, versions):
+            self.refresh_stale_database(database.identifier, version)
+        all_database_details = self.ohmy_sql_adapter.tool_get_all_database_details()
+        self.schema_cache.put("__all__", (versions, all_database_details))
+        return all_database_details
 
-    @strands.tool
+    @lazy_tool(description=_get_adapter_tool_description("tool_get_schema_details"))
     def get_schema_details(
         self,
         database_identifier: str,
         schema_name: T.Optional[str] = None,
     ):
-        return self.ohmy_sql_adapter.tool_get_schema_details(
+        return self.get_cached_schema_details(
             database_identifier=database_identifier,
             schema_name=schema_name,
         )
 
-    @strands.tool
+    @locked_cached_property
+    def query_result_cache(self: "One") -> LRUCache:
+        """
+        Cache of ``execute_select_statement`` query result texts, see
+        :meth:`execute_cached_select_statement`. Hit / miss metrics are in
+        ``query_result_cache.stats``.
+        """
+        return LRUCache(
+            max_items=self.settings.query_result_cache_max_items,
+            max_bytes=self.settings.query_result_cache_max_bytes,
+            ttl=self.settings.query_result_cache_ttl,
+            sizeof=lambda result: len(result.encode("utf-8")),
+        )
+
+    @locked_cached_property
+    def result_cursor_queries(self: "One") -> LRUCache:
+        """
+        Queries of the cursor tokens handed out with truncated results,
+        keyed by query digest, see :meth:`fetch_more_rows`.
+        """
+        return LRUCache(max_items=1024)
+
+    def execute_cached_select_statement(
+        self: "One",
+        database_identifier: str,
+        sql: str,
+        params: T.Optional[dict[str, T.Any]] = None,
+        offset: int = 0,
+    ) -> str:
+        """
+        Same as ``ohmy_sql_adapter.tool_execute_select_statement``, but
+        bounded by :meth:`run_select_statement` and cached, keyed by the
+        normalized SQL, the bound parameters, the page offset and the
+        database version, so a result is never served after the database
+        changed. Errors are not cached.
+
+        The cache holds the query result text only, the execution time is
+        measured on every call and a cache hit is marked as such.
+        """
+        start_time = time.time()
+        version = self.get_database_version(database_identifier)
+        # cached or not, pooled immutable connections must not outlive a change
+        if database_identifier in self.ohmy_sql_config.databases_mapping:
+            self.refresh_stale_database(database_identifier, version)
+        digest = make_query_digest(
+            database_identifier,
+            normalize_sql(sql),
+            make_params_key(params),
+            version,
+        )
+        if self.settings.sql_result_pagination:
+            # refreshed on every call, cached first pages hand out the cursor too
+            self.result_cursor_queries.put(
+                digest, (database_identifier, sql, params, version)
+            )
+        if self.settings.query_result_cache_max_items <= 0:
+            return self.run_select_statement(
+                database_identifier=database_identifier,
+                sql=sql,
+                params=params,
+                offset=offset,
+                digest=digest,
+            )
+        key = (
+            database_identifier,
+            normalize_sql(sql),
+            make_params_key(params),
+            offset,
+            version,
+        )
+        query_result_text = self.query_result_cache.get(key)
+        if query_result_text is not None:
+            return format_select_result(
+                duration=time.time() - start_time,
+                query_result_text=query_result_text,
+                cached=True,
+            )
+        query_result_text = self.run_select_query(
+            database_identifier=database_identifier,
+            sql=sql,
+            params=params,
+            offset=offset,
+            digest=digest,
+        )
+        if not is_error_result(query_result_text):
+            self.query_result_cache.put(key, query_result_text)
+        return format_select_result(
+            duration=time.time() - start_time,
+            query_result_text=query_result_text,
+        )
+
+    def get_analytic_snapshot(
+        self: "One",
+        database_identifier: str,
+    ) -> T.Optional["AnalyticSnapshot"]:
+        """
+        The columnar snapshot of the database, rebuilt when the database
+        file changed. None if the snapshot is disabled or the database is not
+        the Chinook SQLite file.
+        """
+        if not self.settings.analytic_snapshot_enabled:
+            return None
+        database = self.ohmy_sql_config.databases_mapping.get(database_identifier)
+        if database is None:
+            return None
+        path = get_sqlite_path(str(database.connection.url))
+        if path is None or path.absolute() != path_enum.path_sqlite.absolute():
+            return None
+
+        from ..analytics import AnalyticSnapshot
+
+        version = get_file_version(path)
+        with _analytic_snapshot_lock:
+            snapshot = self.__dict__.get("analytic_snapshot")
+            if snapshot is None or snapshot.source_version != (
+                list(version) if version else None
+            ):
+                snapshot = AnalyticSnapshot.load_or_build(
+                    path_sqlite=path,
+                    dir_snapshot=path_enum.dir_analytic_snapshot,
+                )
+                snapshot.warm_up()
+                self.__dict__["analytic_snapshot"] = snapshot
+        return snapshot
+
+    def run_select_statement(
+        self: "One",
+        database_identifier: str,
+        sql: str,
+        params: T.Optional[dict[str, T.Any]] = None,
+        offset: int = 0,
+        digest: T.Optional[str] = None,
+    ) -> str:
+        """
+        Run a SELECT statement, uncached, and format one page of its result
+        like ``ohmy_sql_adapter.tool_execute_select_statement`` does, see
+        :meth:`run_select_query`.
+        """
+        start_time = time.time()
+        query_result_text = self.run_select_query(
+            database_identifier=database_identifier,
+            sql=sql,
+            params=params,
+            offset=offset,
+            digest=digest,
+        )
+        return format_select_result(
+            duration=time.time() - start_time,
+            query_result_text=query_result_text,
+        )
+
+    def run_select_query(
+        self: "One",
+        database_identifier: str,
+        sql: str,
+        params: T.Optional[dict[str, T.Any]] = None,
+        offset: int = 0,
+        digest: T.Optional[str] = None,
+    ) -> str:
+        """
+        Run a SELECT statement, uncached, and return one page of its result,
+        or an error message starting with ``Error``, without the execution
+        time.
+
+        The query is interrupted after ``settings.sql_query_timeout`` seconds
+        and at most ``settings.sql_max_rows`` rows are returned, a truncated
+        result says so and, if ``settings.sql_result_pagination`` is on, ends
+        with the cursor of the next page. Aggregate statements the analytic
+        snapshot supports are answered from it, see
+        :meth:`music_bi_agent_poc.analytics.AnalyticSnapshot.answer`,
+        everything else goes to the database.
+
+        :param offset: number of result rows to skip.
+        :param digest: query digest used to build the cursor token, see
+            :func:`~music_bi_agent_poc.sql_execution.make_query_digest`.
+        """
+        from mcp_ohmy_sql.sa.query import ensure_valid_select_query
+
+        max_rows = self.settings.sql_max_rows
+        if max_rows <= 0:
+            max_rows = sys.maxsize
+        database = self.ohmy_sql_config.databases_mapping.get(database_identifier)
+        if database is None:
+            return (
+                f"Error: Database '{database_identifier}' not found in configuration."
+            )
+        try:
+            ensure_valid_select_query(sql)
+        except ValueError as e:
+            return f"Error: {e}"
+
+        page = None
+        if not params:
+            snapshot = self.get_analytic_snapshot(database_identifier)
+            answer = None if snapshot is None else snapshot.answer(sql)
+            if answer is not None:
+                columns, rows = answer
+                page = paginate(columns, rows, offset=offset, max_rows=max_rows)
+        plan_check = None
+        if page is None:
+            policy = self.settings.sql_full_scan_policy
+            if policy != FullScanPolicyEnum.off.value:
+                plan_check = self.check_select_plan(database_identifier, sql, params)
+            if (
+                plan_check is not None
+                and not plan_check.is_ok
+                and policy == FullScanPolicyEnum.reject.value
+            ):
+                return (
+                    f"Error: query rejected before running it. "
+                    f"{plan_check.format_warning()}"
+                )
+            query_start_time = time.time()
+            try:
+                page = execute_select_page(
+                    engine=database.connection.sa_engine,
+                    sql=sql,
+                    params=params,
+                    offset=offset,
+                    max_rows=max_rows,
+                    timeout=self.settings.sql_query_timeout,
+                )
+            except Exception as e:
+                message = e._message() if hasattr(e, "_message") else str(e)
+                return f"Error executing query: {message}"
+            self.record_select_duration(
+                database_identifier=database_identifier,
+                sql=sql,
+                params=params,
+                seconds=time.time() - query_start_time,
+                plan_check=plan_check,
+            )
+        cursor = None
+        if self.settings.sql_result_pagination and digest is not None:
+            cursor = make_cursor(digest, page.next_offset)
+        query_result_text = format_page(page, cursor=cursor)
+        if plan_check is not None and not plan_check.is_ok:
+            query_result_text = (
+                f"{query_result_text}\n\n"
+                f"# Query Plan Warning\n"
+                f"{plan_check.format_warning()}\n"
+                f"This is expected if the question needs every row, "
+                f"for example a total over all sales."
+            )
+        return query_result_text
+
+    def get_table_stats(
+        self: "One",
+        database_identifier: str,
+    ) -> "TableStats":
+        """
+        Row counts, columns and indexes of the tables of a SQLite database,
+        introspected again only when :meth:`get_database_version` changes.
+        """
+        from ..sql_plan import get_table_stats
+
+        key = (database_identifier, "__table_stats__")
+        version = self.get_database_version(database_identifier)
+        cached = self.schema_cache.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        database = self.ohmy_sql_config.databases_mapping[database_identifier]
+        with database.connection.sa_engine.connect() as connection:
+            table_stats = get_table_stats(connection.connection.dbapi_connection)
+        self.schema_cache.put(key, (version, table_stats))
+        return table_stats
+
+    def check_select_plan(
+        self: "One",
+        database_identifier: str,
+        sql: str,
+        params: T.Optional[dict[str, T.Any]] = None,
+    ) -> T.Optional["PlanCheck"]:
+        """
+        Run ``EXPLAIN QUERY PLAN`` on a SELECT statement and flag the full
+        scans of tables with at least ``settings.sql_full_scan_min_rows``
+        rows. None if the database is not SQLite or the statement can't be
+        planned, running it then reports the error.
+        """
+        from ..sql_plan import explain_query_plan, check_query_plan
+
+        database = self.ohmy_sql_config.databases_mapping[database_identifier]
+        if database.db_type != "sqlite":
+            return None
+        try:
+            table_stats = self.get_table_stats(database_identifier)
+            with database.connection.sa_engine.connect() as connection:
+                steps = explain_query_plan(connection, sql, params)
+        except Exception:
+            return None
+        return check_query_plan(
+            steps=steps,
+            sql=sql,
+            row_counts=table_stats.row_counts,
+            min_rows=self.settings.sql_full_scan_min_rows,
+        )
+
+    @locked_cached_property
+    def query_advisor(self: "One") -> "QueryAdvisor":
+        """
+        Slow SELECT statement shapes, see :meth:`propose_indexes`.
+        """
+        from ..sql_plan import QueryAdvisor
+
+        return QueryAdvisor(slow_seconds=self.settings.sql_slow_query_seconds)
+
+    def record_select_duration(
+        self: "One",
+        database_identifier: str,
+        sql: str,
+        params: T.Optional[dict[str, T.Any]],
+        seconds: float,
+        plan_check: T.Optional["PlanCheck"] = None,
+    ):
+        """
+        Record a slow statement in the :attr:`query_advisor`, with the tables
+        its plan fully scans.
+        """
+        if seconds < self.settings.sql_slow_query_seconds:
+            return
+        if plan_check is None:
+            plan_check = self.check_select_plan(database_identifier, sql, params)
+        self.query_advisor.record(
+            sql=sql,
+            seconds=seconds,
+            full_scans=[] if plan_check is None else plan_check.full_scans,
+        )
+
+    def propose_indexes(
+        self: "One",
+        database_identifier: str = "chinook sqlite",
+    ) -> list["IndexProposal"]:
+        """
+        Covering indexes that would avoid the full scans of the slow
+        statements recorded so far, the most time saving first.
+        """
+        return self.query_advisor.propose_indexes(
+            self.get_table_stats(database_identifier)
+        )
+
+    def create_indexed_sqlite_copy(
+        self: "One",
+        proposals: T.Optional[list["IndexProposal"]] = None,
+        path: Path = path_enum.path_sqlite_indexed,
+    ) -> Path:
+        """
+        Build a writable copy of ``chinook.sqlite`` with the proposed indexes,
+        to measure them before adding them to the original database.
+
+        :param proposals: default to :meth:`propose_indexes`.
+        """
+        from ..sql_plan import create_indexed_copy
+
+        if proposals is None:
+            proposals = self.propose_indexes()
+        return create_indexed_copy(
+            path_src=path_enum.path_sqlite,
+            path_dst=path,
+            proposals=proposals,
+        )
+
+    def get_chinook_database_identifier(self: "One") -> T.Optional[str]:
+        """
+        Identifier of the configured database that is the Chinook SQLite
+        file, None if there is none.
+        """
+        for database in self.ohmy_sql_config.databases:
+            path = get_sqlite_path(str(database.connection.url))
+            if path is not None and path.absolute() == path_enum.path_sqlite.absolute():
+                return database.identifier
+        return None
+
+    def answer_with_sql_template(self: "One", query: str) -> T.Optional[str]:
+        """
+        Answer a ``sql_assistant`` query with a vetted SQL template, without
+        any SQL agent LLM call, see :mod:`music_bi_agent_poc.sql_templates`.
+
+        :return: the answer, None if ``settings.sql_templates_enabled`` is
+            off, no template matches the question, or the statement failed;
+            the SQL agent should answer then.
+        """
+        if not self.settings.sql_templates_enabled:
+            return None
+        from ..sql_templates import (
+            extract_question,
+            match_sql_template,
+            format_template_answer,
+        )
+
+        match = match_sql_template(extract_question(query))
+        if match is None:
+            return None
+        database_identifier = self.get_chinook_database_identifier()
+        if database_identifier is None:
+            return None
+        result = self.execute_cached_select_statement(
+            database_identifier=database_identifier,
+            sql=match.template.sql,
+            params=match.params,
+        )
+        if is_error_result(result):
+            return None
+        return format_template_answer(match, result)
+
+    @lazy_tool(description=_get_adapter_tool_description("tool_execute_select_statement"))
     def execute_select_statement(
         self,
         database_identifier: str,
         sql: str,
         params: T.Optional[dict[str, T.Any]] = None,
     ):
-        return self.ohmy_sql_adapter.tool_execute_select_statement(
+        return self.execute_cached_select_statement(
+            database_identifier=database_identifier,
+            sql=sql,
+            params=params,
+        )
+
+    @lazy_tool
+    def fetch_more_rows(
+        self,
+        cursor: str,
+    ) -> str:
+        """
+        Fetch the next page of a truncated ``execute_select_statement``
+        result.
+
+        :param cursor: the cursor given at the end of the truncated result,
+            for example ``"3f2a9c0e1b7d4a65:200"``.
+        :returns: Execution time and the next rows in Markdown table format,
+            followed by the cursor of the page after it, if any.
+        """
+        parsed = parse_cursor(cursor)
+        if parsed is None:
+            return f"Error: invalid cursor {cursor!r}."
+        digest, offset = parsed
+        query = self.result_cursor_queries.get(digest)
+        if query is None:
+            return (
+                "Error: the cursor expired, "
+                "run the query again with execute_select_statement."
+            )
+        database_identifier, sql, params, version = query
+        if self.get_database_version(database_identifier) != version:
+            return (
+                "Error: the database changed since the query ran, "
+                "run the query again with execute_select_statement."
+            )
+        return self.execute_cached_select_statement(
             database_identifier=database_identifier,
             sql=sql,
             params=params,
+            offset=offset,
         )
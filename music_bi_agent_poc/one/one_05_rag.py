@@ -1,18 +1,40 @@
 # -*- coding: utf-8 -*-
 
 import typing as T
-import re
+import json
 import hashlib
-from functools import cached_property
-
-import strands
-from s3pathlib import S3Path
-from s3vectorm.api import Vector
-from fastembed import TextEmbedding
+import threading
+import dataclasses
+from concurrent.futures import ThreadPoolExecutor
 
 from ..paths import path_enum
+from ..settings import RetrievalBackendEnum, RetrievalModeEnum, LocalIndexTypeEnum
+from ..utils import lazy_tool, locked_cached_property
+from ..cache import LRUCache, ChunkCache
+from ..sql_schema import get_file_version
+from ..knowledge import (
+    iter_knowledge_documents,
+    split_document,
+    merge_adjacent_chunks,
+)
+from ..indexing import (
+    iter_batches,
+    iter_sized_batches,
+    call_with_retry,
+    IndexingProgress,
+)
 
 if T.TYPE_CHECKING:  # pragma: no cover
+    from s3pathlib import S3Path
+    from fastembed import TextEmbedding
+    from fastembed.rerank.cross_encoder import TextCrossEncoder
+    from tokenizers import Tokenizer
+
+    from ..local_vector_index import LocalVectorIndex
+    from ..ann_index import IVFIndex
+    from ..embedding_cache import EmbeddingCache
+    from ..document_chunk import DocumentChunk
+    from ..hybrid_retrieval import BM25Index
     from .one_01_main import One
 
 
@@ -20,99 +42,827 @@ def parse_all_in_one_knowledge() -> list[str]:
     """
     Parse the XML file and extract all <document> elements.
 
-    :param file_path: Path to the XML file containing <document> elements
     :return: List of strings, each containing a complete <document>...</document> block
     """
-    # Read the entire file content
-    content = path_enum.path_knowledge_base_txt.read_text()
-    # Use regex to find all <document>...</document> blocks
-    # re.DOTALL flag allows . to match newlines
-    pattern = r"<document>.*?</document>"
-    documents = re.findall(pattern, content, re.DOTALL)
+    return [
+        document.xml
+        for document in iter_knowledge_documents(path_enum.path_knowledge_base_txt)
+    ]
+
+
+def get_chunk_key(chunk_content: str) -> str:
+    """
+    Chunk key is the md5 of the content, so a key always maps to the same body.
+    """
+    return hashlib.md5(chunk_content.encode("utf-8")).hexdigest()
 
-    return documents
 
+@dataclasses.dataclass
+class KnowledgeBaseSyncReport:
+    """
+    What :meth:`RagMixin.prepare_knowledge_base` did.
+
+    :param n_chunks: number of chunks in the knowledge base after the sync.
+    :param added_keys: keys of the chunks that were embedded and indexed.
+    :param deleted_keys: keys of the chunks that were removed from the index.
+    :param elapsed: seconds spent on embedding and indexing the added chunks.
+    """
 
-class DocumentChunk(Vector):
-    pass
+    n_chunks: int
+    added_keys: list[str]
+    deleted_keys: list[str]
+    elapsed: float = dataclasses.field(default=0.0)
+
+    @property
+    def n_unchanged(self) -> int:
+        return self.n_chunks - len(self.added_keys)
+
+    @property
+    def chunks_per_sec(self) -> float:
+        return (len(self.added_keys) / self.elapsed) if self.elapsed > 0 else 0.0
+
+    @classmethod
+    def new(
+        cls,
+        current_keys: list[str],
+        indexed_keys: set[str],
+    ):
+        current_key_set = set(current_keys)
+        return cls(
+            n_chunks=len(current_keys),
+            added_keys=[key for key in current_keys if key not in indexed_keys],
+            deleted_keys=sorted(indexed_keys.difference(current_key_set)),
+        )
+
+
+#: S3 Vectors allows 40KB of metadata per vector, keep some headroom.
+MAX_METADATA_TEXT_BYTES = 32 * 1024
+#: S3 Vectors accepts at most 500 keys per put / delete request.
+S3VECTORS_MAX_BATCH_SIZE = 500
+#: S3 Vectors accepts at most 20MB per put request, keep some headroom.
+S3VECTORS_MAX_REQUEST_BYTES = 16 * 1024 * 1024
+MAX_LIST_VECTORS_ITEMS = 1_000_000
+
+
+EMBEDDING_MODEL_NAME = "BAAI/bge-small-en-v1.5"
+EMBEDDING_DIMENSION = 384
+
+_bm25_index_lock = threading.Lock()
 
 
 class RagMixin:
-    @cached_property
-    def embedding_model(self: "One") -> TextEmbedding:
+    @locked_cached_property
+    def embedding_model(self: "One") -> "TextEmbedding":
+        from fastembed import TextEmbedding
+
         return TextEmbedding(
-            model_name="BAAI/bge-small-en-v1.5",  # dim = 384
+            model_name=EMBEDDING_MODEL_NAME,
+        )
+
+    @locked_cached_property
+    def embedding_cache(self: "One") -> T.Optional["EmbeddingCache"]:
+        """
+        On-disk embedding cache shared by indexing and retrieval, None if
+        disabled by ``settings.embedding_cache_enabled``.
+        """
+        if not self.settings.embedding_cache_enabled:
+            return None
+        from ..embedding_cache import EmbeddingCache
+
+        return EmbeddingCache(
+            dir_root=path_enum.dir_embedding_cache,
+            model_name=EMBEDDING_MODEL_NAME,
+            dimension=EMBEDDING_DIMENSION,
         )
 
+    @locked_cached_property
+    def query_embedding_cache(self: "One") -> LRUCache:
+        """
+        In-memory cache of query embeddings, keyed by the query text.
+        """
+        return LRUCache(max_items=self.settings.query_embedding_cache_size)
+
     def batch_embedding(
         self: "One",
         documents: list[str],
     ) -> list[list[float]]:
-        return list(self.embedding_model.embed(documents=documents))
+        """
+        Embed documents, only the ones missing in :attr:`embedding_cache` go
+        through the model, the model isn't even loaded when all are cached.
+        """
+        if self.embedding_cache is None:
+            return list(self.embedding_model.embed(documents=documents))
+        embeddings = self.embedding_cache.get_many(documents)
+        missing = [ith for ith, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            missing_documents = [documents[ith] for ith in missing]
+            new_embeddings = list(self.embedding_model.embed(documents=missing_documents))
+            self.embedding_cache.put_many(missing_documents, new_embeddings)
+            for ith, embedding in zip(missing, new_embeddings):
+                embeddings[ith] = embedding
+        return embeddings
 
     def single_embedding(self: "One", document: str) -> list[float]:
-        return self.batch_embedding([document])[0]
+        """
+        Embed a user query. Repeated queries are served from
+        :attr:`query_embedding_cache`, new queries are not written to the
+        on-disk cache to keep it bounded by the knowledge base size.
+        """
+        embedding = self.query_embedding_cache.get(document)
+        if embedding is not None:
+            return embedding
+        if self.embedding_cache is not None:
+            embedding = self.embedding_cache.get_many([document])[0]
+        if embedding is None:
+            embedding = list(self.embedding_model.embed(documents=[document]))[0]
+        self.query_embedding_cache.put(document, embedding)
+        return embedding
+
+    @locked_cached_property
+    def chunk_tokenizer(self: "One") -> "Tokenizer":
+        """
+        Copy of the embedding model tokenizer without truncation and padding,
+        used to measure chunk sizes.
+        """
+        from tokenizers import Tokenizer
+
+        tokenizer = Tokenizer.from_str(self.embedding_model.model.tokenizer.to_str())
+        tokenizer.no_truncation()
+        tokenizer.no_padding()
+        return tokenizer
+
+    def count_tokens(self: "One", text: str) -> int:
+        return len(self.chunk_tokenizer.encode(text, add_special_tokens=False).ids)
+
+    def iter_knowledge_chunks(self: "One") -> T.Iterator[tuple[str, str]]:
+        """
+        Stream the knowledge base as ``(chunk key, chunk content)`` pairs,
+        duplicated chunks are only yielded once.
+
+        Documents longer than ``settings.chunk_max_tokens`` are split into
+        overlapping chunks, so their tail is not silently truncated by the
+        embedding model.
+        """
+        seen = set()
+        for document in iter_knowledge_documents(path_enum.path_knowledge_base_txt):
+            if self.settings.chunk_max_tokens > 0:
+                chunks = split_document(
+                    document,
+                    # leave room for the [CLS] and [SEP] special tokens
+                    max_tokens=self.settings.chunk_max_tokens - 2,
+                    overlap_tokens=self.settings.chunk_overlap_tokens,
+                    count_tokens=self.count_tokens,
+                )
+            else:
+                chunks = [document]
+            for chunk in chunks:
+                key = get_chunk_key(chunk.xml)
+                if key not in seen:
+                    seen.add(key)
+                    yield key, chunk.xml
+
+    def parse_knowledge_chunks(self: "One") -> dict[str, str]:
+        """
+        Parse the knowledge base into a mapping of chunk key to chunk content.
+        """
+        return dict(self.iter_knowledge_chunks())
+
+    @locked_cached_property
+    def s3dir_documents(self: "One") -> "S3Path":
+        from s3pathlib import S3Path
 
-    @cached_property
-    def s3dir_documents(self: "One") -> S3Path:
         return S3Path(
             f"{self.bsm.aws_account_alias}-{self.bsm.aws_region}-data/projects/music_bi_agent_poc/documents/"
         ).to_dir()
 
-    def get_s3path_doc(self: "One", key: str) -> S3Path:
+    def get_s3path_doc(self: "One", key: str) -> "S3Path":
         return self.s3dir_documents / f"{key}.txt"
 
-    def prepare_knowledge_base(self: "One"):
-        self.vector_bucket.create(s3_vectors_client=self.s3vectors_client)
-        self.vector_index.create(s3_vectors_client=self.s3vectors_client)
-        self.vector_index.delete_all_vectors(s3_vectors_client=self.s3vectors_client)
-        chunk_contents = parse_all_in_one_knowledge()
-        embeddings_list = self.batch_embedding(chunk_contents)
-        vectors = []
-        for chunk_content, embedding in zip(chunk_contents, embeddings_list):
-            key = hashlib.md5(chunk_content.encode("utf-8")).hexdigest()
-            vector = DocumentChunk(
-                key=key,
-                data=embedding,
+    @locked_cached_property
+    def s3_client_for_chunk_fetch(self: "One"):
+        """
+        S3 client dedicated to chunk body downloads, with per request timeout
+        and a connection pool as large as the thread pool.
+        """
+        import botocore.config
+
+        return self.bsm.boto_ses.client(
+            "s3",
+            config=botocore.config.Config(
+                connect_timeout=self.settings.chunk_fetch_timeout,
+                read_timeout=self.settings.chunk_fetch_timeout,
+                retries={"max_attempts": 2},
+                max_pool_connections=self.settings.chunk_fetch_max_workers,
+            ),
+        )
+
+    @locked_cached_property
+    def chunk_fetch_executor(self: "One") -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(
+            max_workers=self.settings.chunk_fetch_max_workers,
+            thread_name_prefix="chunk_fetch",
+        )
+
+    @locked_cached_property
+    def chunk_cache(self: "One") -> ChunkCache:
+        """
+        Cache of chunk bodies in front of :meth:`get_s3path_doc` reads.
+        """
+        if self.settings.chunk_cache_on_disk:
+            dir_cache = path_enum.dir_chunk_cache
+        else:
+            dir_cache = None
+        return ChunkCache(
+            max_bytes=self.settings.chunk_cache_max_bytes,
+            dir_cache=dir_cache,
+        )
+
+    def read_chunk_content(self: "One", key: str) -> str:
+        s3path = self.get_s3path_doc(key=key)
+        content = s3path.read_text(bsm=self.s3_client_for_chunk_fetch)
+        self.chunk_cache.put(key, content)
+        return content
+
+    def fetch_chunk_contents(self: "One", keys: list[str]) -> list[T.Optional[str]]:
+        """
+        Get chunk bodies from :attr:`chunk_cache`, download the missing ones
+        concurrently on :attr:`chunk_fetch_executor`.
+
+        :return: chunk contents in the same order as ``keys``, the content is
+            None if the download failed or timed out.
+        """
+        contents = [self.chunk_cache.get(key) for key in keys]
+        futures = {
+            ith: self.chunk_fetch_executor.submit(self.read_chunk_content, key)
+            for ith, (key, content) in enumerate(zip(keys, contents))
+            if content is None
+        }
+        for ith, future in futures.items():
+            try:
+                contents[ith] = future.result()
+            except Exception:
+                pass
+        return contents
+
+    def prepare_knowledge_base(
+        self: "One",
+        full_rebuild: bool = False,
+        verbose: bool = True,
+    ) -> "KnowledgeBaseSyncReport":
+        """
+        Index the knowledge base into the configured retrieval backend.
+
+        By default only the diff is applied: chunks that are new since the last
+        sync are embedded and indexed, chunks that disappeared are deleted, and
+        the unchanged ones are left untouched. Because chunk keys are content
+        hashes, a changed file shows up as one deleted and one added chunk.
+
+        :param full_rebuild: if True, delete everything and index all chunks
+            from scratch.
+        :param verbose: print indexing progress and throughput.
+        """
+        if self.settings.retrieval_backend == RetrievalBackendEnum.local.value:
+            return self.prepare_local_knowledge_base(
+                full_rebuild=full_rebuild,
+                verbose=verbose,
+            )
+        else:
+            return self.prepare_s3vectors_knowledge_base(
+                full_rebuild=full_rebuild,
+                verbose=verbose,
             )
-            vectors.append(vector)
-            s3path = self.get_s3path_doc(key=key)
-            s3path.write_text(chunk_content, bsm=self.bsm, content_type="text/plain")
-        self.vector_index.put_vectors(
+
+    def load_s3vectors_manifest(self: "One") -> T.Optional[set[str]]:
+        """
+        Load the chunk keys indexed by the last sync, None if there is no manifest.
+        """
+        path = path_enum.path_s3vectors_manifest_json
+        if path.exists():
+            return set(json.loads(path.read_text(encoding="utf-8"))["keys"])
+        return None
+
+    def dump_s3vectors_manifest(self: "One", keys: T.Iterable[str]):
+        path = path_enum.path_s3vectors_manifest_json
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({"keys": sorted(keys)}), encoding="utf-8")
+
+    def list_s3vectors_keys(self: "One") -> set[str]:
+        from ..document_chunk import DocumentChunk
+
+        keys = set()
+        for page in self.vector_index.list_vectors(
             s3_vectors_client=self.s3vectors_client,
-            vectors=vectors,
+            max_items=MAX_LIST_VECTORS_ITEMS,
+        ):
+            for vector in page.as_vector_objects(DocumentChunk):
+                keys.add(vector.key)
+        return keys
+
+    @locked_cached_property
+    def s3_client_for_chunk_upload(self: "One"):
+        """
+        S3 client dedicated to chunk body uploads, with a connection pool as
+        large as the upload thread pool.
+        """
+        import botocore.config
+
+        return self.bsm.boto_ses.client(
+            "s3",
+            config=botocore.config.Config(
+                retries={"max_attempts": 5, "mode": "standard"},
+                max_pool_connections=self.settings.upload_max_workers,
+            ),
         )
 
-    def retrieve(
+    def write_chunk_content(self: "One", key: str, content: str):
+        s3path = self.get_s3path_doc(key=key)
+        s3path.write_text(
+            content,
+            bsm=self.s3_client_for_chunk_upload,
+            content_type="text/plain",
+        )
+
+    def new_document_chunk(
         self: "One",
-        query: str,
+        key: str,
+        content: str,
+        embedding,
+    ) -> "DocumentChunk":
+        from ..document_chunk import DocumentChunk
+
+        if (
+            self.settings.store_chunk_text_in_metadata
+            and len(content.encode("utf-8")) <= MAX_METADATA_TEXT_BYTES
+        ):
+            text = content
+        else:
+            text = None
+        return DocumentChunk(
+            key=key,
+            data=embedding,
+            text=text,
+        )
+
+    def put_s3vectors(self: "One", vectors: list["DocumentChunk"]):
+        """
+        Put vectors in batches that respect the S3 Vectors per request limits,
+        retrying throttled requests with exponential backoff.
+        """
+        data_type = self.vector_index.data_type
+        for batch in iter_sized_batches(
+            vectors,
+            sizeof=lambda vector: len(
+                json.dumps(vector.to_put_vectors_dict(data_type=data_type))
+            ),
+            max_count=S3VECTORS_MAX_BATCH_SIZE,
+            max_bytes=S3VECTORS_MAX_REQUEST_BYTES,
+        ):
+            call_with_retry(
+                lambda: self.vector_index.put_vectors(
+                    s3_vectors_client=self.s3vectors_client,
+                    vectors=batch,
+                ),
+                max_attempts=self.settings.put_vectors_max_attempts,
+            )
+
+    def put_s3vectors_chunks(
+        self: "One",
+        chunks: T.Iterable[tuple[str, str]],
+        progress: T.Optional[IndexingProgress] = None,
+    ):
+        """
+        Index chunks into S3 Vectors with a staged pipeline, one batch of
+        ``settings.embedding_batch_size`` chunks at a time:
+
+        1. the chunk bodies of the batch are uploaded concurrently on a bounded
+           thread pool, in the background.
+        2. meanwhile the batch is embedded.
+        3. once the bodies are uploaded, the vectors are put in size capped
+           requests with retry.
+
+        Only one batch is held in memory, so ``chunks`` can be a generator that
+        streams from the knowledge base file.
+
+        :param chunks: ``(chunk key, chunk content)`` pairs.
+        """
+        if progress is None:
+            progress = IndexingProgress(total=0)
+        with ThreadPoolExecutor(
+            max_workers=self.settings.upload_max_workers,
+            thread_name_prefix="chunk_upload",
+        ) as executor:
+            for batch in iter_batches(chunks, self.settings.embedding_batch_size):
+                uploads = [
+                    executor.submit(self.write_chunk_content, key, content)
+                    for key, content in batch
+                ]
+                try:
+                    embeddings = self.batch_embedding(
+                        [content for _, content in batch]
+                    )
+                    vectors = [
+                        self.new_document_chunk(key, content, embedding)
+                        for (key, content), embedding in zip(batch, embeddings)
+                    ]
+                    # a vector must never point to a missing chunk body
+                    for future in uploads:
+                        future.result()
+                except BaseException:
+                    for future in uploads:
+                        future.cancel()
+                    raise
+                self.put_s3vectors(vectors)
+                progress.update(len(batch))
+
+    def delete_s3vectors_chunks(self: "One", keys: list[str]):
+        """
+        Delete the vectors and the S3 bodies of the given chunk keys.
+        """
+        for batch in iter_batches(keys, S3VECTORS_MAX_BATCH_SIZE):
+            call_with_retry(
+                lambda: self.vector_index.delete_vectors(
+                    s3_vectors_client=self.s3vectors_client,
+                    keys=batch,
+                ),
+                max_attempts=self.settings.put_vectors_max_attempts,
+            )
+            self.bsm.s3_client.delete_objects(
+                Bucket=self.s3dir_documents.bucket,
+                Delete={
+                    "Objects": [
+                        {"Key": self.get_s3path_doc(key=key).key} for key in batch
+                    ],
+                    "Quiet": True,
+                },
+            )
+
+    def prepare_s3vectors_knowledge_base(
+        self: "One",
+        full_rebuild: bool = False,
+        verbose: bool = True,
+    ) -> "KnowledgeBaseSyncReport":
+        self.vector_bucket.create(s3_vectors_client=self.s3vectors_client)
+        self.vector_index.create(
+            s3_vectors_client=self.s3vectors_client,
+            metadata_configuration={"nonFilterableMetadataKeys": ["text"]},
+        )
+        # only keep the keys in memory, chunk contents are streamed twice
+        current_keys = [key for key, _ in self.iter_knowledge_chunks()]
+        if full_rebuild:
+            self.vector_index.delete_all_vectors(
+                s3_vectors_client=self.s3vectors_client
+            )
+            indexed_keys = set()
+        else:
+            indexed_keys = self.load_s3vectors_manifest()
+            # no manifest yet, e.g. on a new machine, ask the index itself
+            if indexed_keys is None:
+                indexed_keys = self.list_s3vectors_keys()
+        report = KnowledgeBaseSyncReport.new(
+            current_keys=current_keys,
+            indexed_keys=indexed_keys,
+        )
+        progress = IndexingProgress(total=len(report.added_keys), verbose=verbose)
+        added_keys = set(report.added_keys)
+        # add before delete, so the index is never empty in the middle of a sync
+        self.put_s3vectors_chunks(
+            (
+                (key, content)
+                for key, content in self.iter_knowledge_chunks()
+                if key in added_keys
+            ),
+            progress=progress,
+        )
+        self.delete_s3vectors_chunks(report.deleted_keys)
+        self.dump_s3vectors_manifest(current_keys)
+        progress.finish()
+        report.elapsed = progress.elapsed
+        return report
+
+    def prepare_local_knowledge_base(
+        self: "One",
+        full_rebuild: bool = False,
+        verbose: bool = True,
+    ) -> "KnowledgeBaseSyncReport":
+        from ..local_vector_index import LocalVectorIndex
+
+        dir_index = path_enum.dir_local_vector_index
+        chunks = self.parse_knowledge_chunks()
+        if (full_rebuild is False) and LocalVectorIndex.exists(dir_index):
+            old_index = LocalVectorIndex.load(dir_index)
+        else:
+            old_index = LocalVectorIndex(keys=[], texts=[], embeddings=[])
+        old_rows = {key: ith for ith, key in enumerate(old_index.keys)}
+        report = KnowledgeBaseSyncReport.new(
+            current_keys=list(chunks),
+            indexed_keys=set(old_rows),
+        )
+        progress = IndexingProgress(total=len(report.added_keys), verbose=verbose)
+        new_embeddings = dict()
+        for batch in iter_batches(report.added_keys, self.settings.embedding_batch_size):
+            embeddings = self.batch_embedding([chunks[key] for key in batch])
+            new_embeddings.update(zip(batch, embeddings))
+            progress.update(len(batch))
+        embeddings = [
+            old_index.matrix[old_rows[key]] if key in old_rows else new_embeddings[key]
+            for key in chunks
+        ]
+        local_vector_index = LocalVectorIndex(
+            keys=list(chunks),
+            texts=list(chunks.values()),
+            embeddings=embeddings,
+        )
+        local_vector_index.dump(dir_index)
+        self.__dict__["local_vector_index"] = local_vector_index
+        if self.settings.local_index_type == LocalIndexTypeEnum.ivf.value:
+            ann_index = self.build_ann_index()
+            ann_index.dump(path_enum.dir_ann_index)
+            self.__dict__["ann_index"] = ann_index
+        progress.finish()
+        report.elapsed = progress.elapsed
+        return report
+
+    def get_knowledge_base_version(self: "One") -> T.Optional[tuple[int, ...]]:
+        """
+        A token that changes whenever the indexed knowledge base changes: the
+        version of the S3 Vectors manifest, or of the local index files, or
+        of the knowledge base file the local index is built from when it was
+        never dumped.
+        """
+        from ..local_vector_index import LocalVectorIndex
+
+        if self.settings.retrieval_backend == RetrievalBackendEnum.local.value:
+            dir_index = path_enum.dir_local_vector_index
+            if LocalVectorIndex.exists(dir_index):
+                path = dir_index / LocalVectorIndex.path_chunks_name
+            else:
+                path = path_enum.path_knowledge_base_txt
+        else:
+            path = path_enum.path_s3vectors_manifest_json
+        return get_file_version(path)
+
+    def build_local_vector_index(self: "One") -> "LocalVectorIndex":
+        from ..local_vector_index import LocalVectorIndex
+
+        chunks = self.parse_knowledge_chunks()
+        return LocalVectorIndex(
+            keys=list(chunks),
+            texts=list(chunks.values()),
+            embeddings=self.batch_embedding(list(chunks.values())),
+        )
+
+    @locked_cached_property
+    def local_vector_index(self: "One") -> "LocalVectorIndex":
+        """
+        The in-memory index used by the ``local`` retrieval backend. It is
+        loaded from :attr:`~music_bi_agent_poc.paths.PathEnum.dir_local_vector_index`
+        if :meth:`prepare_knowledge_base` has been run, otherwise it is built
+        from the knowledge base file on first access.
+        """
+        from ..local_vector_index import LocalVectorIndex
+
+        if LocalVectorIndex.exists(path_enum.dir_local_vector_index):
+            return LocalVectorIndex.load(path_enum.dir_local_vector_index)
+        return self.build_local_vector_index()
+
+    def get_ann_build_params(self: "One") -> dict[str, T.Any]:
+        """
+        The ``ann_*`` settings that shape the approximate index, a dumped
+        index built with other ones is built again.
+        """
+        return dict(
+            n_lists=self.settings.ann_n_lists,
+            quantization=self.settings.ann_quantization,
+            pq_m=self.settings.ann_pq_m,
+        )
+
+    def build_ann_index(self: "One") -> "IVFIndex":
+        """
+        Build the approximate index from the embeddings of
+        :attr:`local_vector_index`, with the ``ann_*`` settings.
+        """
+        from ..ann_index import IVFIndex
+
+        local_vector_index = self.local_vector_index
+        return IVFIndex.build(
+            keys=local_vector_index.keys,
+            texts=local_vector_index.texts,
+            embeddings=local_vector_index.matrix,
+            n_probe=self.settings.ann_n_probe,
+            refine=self.settings.ann_refine,
+            **self.get_ann_build_params(),
+        )
+
+    @locked_cached_property
+    def ann_index(self: "One") -> "IVFIndex":
+        """
+        The approximate index used by the ``local`` retrieval backend when
+        ``local_index_type`` is ``ivf``. It is loaded from
+        :attr:`~music_bi_agent_poc.paths.PathEnum.dir_ann_index` unless the
+        local index has been rebuilt since, or the index was built with other
+        ``ann_*`` settings, see :meth:`get_ann_build_params`, otherwise it is
+        built from :attr:`local_vector_index`, and dumped if that one is.
+        """
+        from ..local_vector_index import LocalVectorIndex
+        from ..ann_index import IVFIndex
+
+        dir_index = path_enum.dir_ann_index
+        dir_local_index = path_enum.dir_local_vector_index
+        local_index_version = get_file_version(
+            dir_local_index / LocalVectorIndex.path_chunks_name
+        )
+        if IVFIndex.exists(dir_index) and local_index_version is not None:
+            ann_index = IVFIndex.load(
+                dir_index,
+                n_probe=self.settings.ann_n_probe,
+                refine=self.settings.ann_refine,
+            )
+            ann_index_version = get_file_version(dir_index / IVFIndex.path_chunks_name)
+            if (
+                ann_index_version[0] >= local_index_version[0]
+                and ann_index.is_built_with(**self.get_ann_build_params())
+            ):
+                return ann_index
+        ann_index = self.build_ann_index()
+        if LocalVectorIndex.exists(dir_local_index):
+            ann_index.dump(dir_index)
+        return ann_index
+
+    @property
+    def local_index(self: "One") -> T.Union["LocalVectorIndex", "IVFIndex"]:
+        """
+        The index searched by the ``local`` retrieval backend, exact or
+        approximate depending on ``local_index_type``.
+        """
+        if self.settings.local_index_type == LocalIndexTypeEnum.ivf.value:
+            return self.ann_index
+        return self.local_vector_index
+
+    def retrieve_from_s3vectors(
+        self: "One",
+        query_embedding,
+        top_k: int = 5,
     ) -> list[str]:
-        query_embedding = self.single_embedding(query)
+        from ..document_chunk import DocumentChunk
+
         results = self.vector_index.query_vectors(
             s3_vectors_client=self.s3vectors_client,
             data=query_embedding.tolist(),
-            top_k=5,
+            top_k=top_k,
             return_metadata=True,
         )
         vectors = results.as_vector_objects(DocumentChunk)
+        # chunk text stored as metadata doesn't need the S3 round trip
+        missing_keys = [vector.key for vector in vectors if vector.text is None]
+        fetched = dict(zip(missing_keys, self.fetch_chunk_contents(missing_keys)))
         chunks = []
         for vector in vectors:
-            s3path = self.get_s3path_doc(key=vector.key)
-            content = s3path.read_text(bsm=self.bsm)
-            chunks.append(content)
+            content = vector.text if vector.text is not None else fetched[vector.key]
+            if content is not None:
+                chunks.append(content)
+        return chunks
+
+    def retrieve_from_local(
+        self: "One",
+        query_embedding,
+        top_k: int = 5,
+    ) -> list[str]:
+        hits = self.local_index.query(query_embedding, top_k=top_k)
+        return [hit.text for hit in hits]
+
+    def search_dense(
+        self: "One",
+        query_embedding,
+        top_k: int = 5,
+    ) -> list[tuple[str, T.Optional[str]]]:
+        """
+        Vector search in the retrieval backend.
+
+        :return: ``(chunk key, chunk content)`` pairs, best first, the
+            content is None when S3 Vectors doesn't store it as metadata.
+        """
+        if self.settings.retrieval_backend == RetrievalBackendEnum.local.value:
+            hits = self.local_index.query(query_embedding, top_k=top_k)
+            return [(hit.key, hit.text) for hit in hits]
+        from ..document_chunk import DocumentChunk
+
+        results = self.vector_index.query_vectors(
+            s3_vectors_client=self.s3vectors_client,
+            data=query_embedding.tolist(),
+            top_k=top_k,
+            return_metadata=True,
+        )
+        return [
+            (vector.key, vector.text)
+            for vector in results.as_vector_objects(DocumentChunk)
+        ]
+
+    def get_bm25_index(self: "One") -> "BM25Index":
+        """
+        Keyword index over the same chunks as the vector index, rebuilt when
+        the knowledge base changes. With the S3 Vectors backend it is built
+        from the knowledge base file, empty if the file is missing.
+        """
+        from ..hybrid_retrieval import BM25Index
+
+        version = (
+            self.get_knowledge_base_version(),
+            get_file_version(path_enum.path_knowledge_base_txt),
+        )
+        with _bm25_index_lock:
+            cached = self.__dict__.get("bm25_index")
+            if cached is not None and cached[0] == version:
+                return cached[1]
+            if self.settings.retrieval_backend == RetrievalBackendEnum.local.value:
+                keys = self.local_index.keys
+                texts = self.local_index.texts
+            elif version[1] is None:
+                keys, texts = [], []
+            else:
+                chunks = self.parse_knowledge_chunks()
+                keys, texts = list(chunks), list(chunks.values())
+            bm25_index = BM25Index(keys=keys, texts=texts)
+            self.__dict__["bm25_index"] = (version, bm25_index)
+        return bm25_index
+
+    @locked_cached_property
+    def rerank_model(self: "One") -> "TextCrossEncoder":
+        from fastembed.rerank.cross_encoder import TextCrossEncoder
+
+        return TextCrossEncoder(model_name=self.settings.rerank_model)
+
+    def retrieve_hybrid(
+        self: "One",
+        query: str,
+        query_embedding,
+        top_k: int = 5,
+    ) -> list[str]:
+        """
+        Fuse the vector and the BM25 rankings of ``settings.hybrid_candidates``
+        chunks each with reciprocal rank fusion, optionally rerank the fused
+        candidates with ``settings.rerank_model``, and return the ``top_k``
+        best chunk contents.
+        """
+        from ..hybrid_retrieval import reciprocal_rank_fusion
+
+        n_candidates = max(top_k, self.settings.hybrid_candidates)
+        dense_hits = self.search_dense(query_embedding, top_k=n_candidates)
+        keyword_hits = self.get_bm25_index().query(query, top_k=n_candidates)
+        texts = {key: text for key, text in dense_hits if text is not None}
+        texts.update((hit.key, hit.text) for hit in keyword_hits)
+        fused = reciprocal_rank_fusion(
+            [[key for key, _ in dense_hits], [hit.key for hit in keyword_hits]],
+            k=self.settings.rrf_k,
+        )
+        keys = [key for key, _ in fused]
+        if self.settings.rerank_model:
+            keys = keys[:n_candidates]
+        else:
+            keys = keys[:top_k]
+        missing_keys = [key for key in keys if key not in texts]
+        texts.update(zip(missing_keys, self.fetch_chunk_contents(missing_keys)))
+        # a chunk whose download failed is left out
+        keys = [key for key in keys if texts[key] is not None]
+        if self.settings.rerank_model and keys:
+            scores = list(
+                self.rerank_model.rerank(query, [texts[key] for key in keys])
+            )
+            order = sorted(range(len(keys)), key=lambda ith: -scores[ith])
+            keys = [keys[ith] for ith in order[:top_k]]
+        return [texts[key] for key in keys]
+
+    def retrieve(
+        self: "One",
+        query: str,
+        top_k: int = 5,
+    ) -> list[str]:
+        """
+        Return the ``top_k`` most relevant chunk contents for the query,
+        from the retrieval backend selected by ``settings.retrieval_backend``,
+        ranked as selected by ``settings.retrieval_mode``.
+        """
+        query_embedding = self.single_embedding(query)
+        if self.settings.retrieval_mode == RetrievalModeEnum.hybrid.value:
+            chunks = self.retrieve_hybrid(query, query_embedding, top_k=top_k)
+        elif self.settings.retrieval_backend == RetrievalBackendEnum.local.value:
+            chunks = self.retrieve_from_local(query_embedding, top_k=top_k)
+        else:
+            chunks = self.retrieve_from_s3vectors(query_embedding, top_k=top_k)
+        if self.settings.merge_adjacent_chunks:
+            chunks = merge_adjacent_chunks(chunks)
         return chunks
 
-    @strands.tool
+    @lazy_tool
     def retrieve_knowledge(
         self,
         query: str,
     ) -> list[str]:
         """
-        Retrieve relevant document chunks from the knowledge base using semantic search.
+        Retrieve relevant document chunks from the knowledge base.
 
         This tool searches through a comprehensive knowledge base containing project
-        documentation, source code, and repository information. It uses vector embeddings
-        to find the most semantically similar documents to your query.
+        documentation, source code, and repository information, and returns the
+        documents most relevant to your query.
 
         :param query: Natural language query describing what information you need.
                      Examples: "How to define an agent?", "Database schema information",
@@ -126,12 +876,14 @@ class RagMixin:
                 - repo: Repository name
                 - branch: Git branch name
                 - path: File path within the repository
+                - start_offset / end_offset: Character range of the chunk in the
+                  file, only present when a long file is split into chunks
                 - content: The actual document content
 
         **Usage Tips:**
         - Use specific, descriptive queries for better results
         - Ask questions as you would naturally phrase them
-        - The search returns semantically similar content, not exact keyword matches
+        - Include exact module, class or function names when you know them
         - Review multiple returned chunks as related information may span several documents
 
         **Example Queries:**
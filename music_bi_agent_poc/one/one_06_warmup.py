@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+import typing as T
+import time
+import threading
+import dataclasses
+from concurrent.futures import Future, wait
+
+from ..settings import RetrievalBackendEnum
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    from .one_01_main import One
+
+
+@dataclasses.dataclass
+class WarmupStep:
+    """
+    Outcome of one warm-up step.
+
+    :param name: name of the step.
+    :param elapsed: seconds the step took.
+    :param error: the exception raised by the step, None if it succeeded.
+    """
+
+    name: str
+    elapsed: float = dataclasses.field(default=0.0)
+    error: T.Optional[Exception] = dataclasses.field(default=None)
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class WarmupStatus:
+    """
+    Handle of a background warm-up started by :meth:`WarmupMixin.warm_up`.
+    """
+
+    def __init__(self, futures: dict[str, Future]):
+        self.futures = futures
+
+    def is_ready(self) -> bool:
+        return all(future.done() for future in self.futures.values())
+
+    def wait(self, timeout: T.Optional[float] = None) -> bool:
+        """
+        Block until every step finished or ``timeout`` seconds passed.
+
+        :return: True if every step finished, whether it succeeded or not.
+        """
+        wait(list(self.futures.values()), timeout=timeout)
+        return self.is_ready()
+
+    @property
+    def steps(self) -> list[WarmupStep]:
+        """
+        The finished steps.
+        """
+        return [
+            future.result() for future in self.futures.values() if future.done()
+        ]
+
+
+def _run_step(
+    name: str,
+    func: T.Callable[[], T.Any],
+    future: Future,
+):
+    start_time = time.perf_counter()
+    error = None
+    try:
+        func()
+    except Exception as e:  # a failed step only means the first request pays for it
+        error = e
+    future.set_result(
+        WarmupStep(name=name, elapsed=time.perf_counter() - start_time, error=error)
+    )
+
+
+_warmup_lock = threading.Lock()
+
+
+class WarmupMixin:
+    def _warm_up_embedding(self: "One"):
+        # the first inference initializes the ONNX session, not just the load
+        list(self.embedding_model.embed(documents=["warm up"]))
+        if self.settings.retrieval_backend == RetrievalBackendEnum.local.value:
+            self.local_index
+
+    def _warm_up_agents(self: "One"):
+        self.model
+        self.router_agent
+        self.sql_agent
+        self.knowledge_agent
+        self.report_agent
+
+    def _warm_up_schema(self: "One"):
+        self.get_schema_digest()
+
+    def warm_up(
+        self: "One",
+        wait: bool = False,
+        timeout: T.Optional[float] = None,
+    ) -> WarmupStatus:
+        """
+        Load the embedding model, build the agents (which reads the prompts)
+        and introspect the database schema in background threads, so the
+        first request doesn't pay for the cold start.
+
+        Calling it again returns the same :class:`WarmupStatus`. The
+        resources are :class:`~music_bi_agent_poc.utils.locked_cached_property`
+        attributes, a request that needs one the warm-up is still building
+        waits for it instead of building a second copy.
+
+        :param wait: block until the warm-up finished.
+        :param timeout: max seconds to block when ``wait`` is True.
+        """
+        with _warmup_lock:
+            status = self.__dict__.get("warmup_status")
+            if status is None:
+                steps = [
+                    ("embedding", self._warm_up_embedding),
+                    ("agents", self._warm_up_agents),
+                    ("schema", self._warm_up_schema),
+                ]
+                status = WarmupStatus(futures={name: Future() for name, _ in steps})
+                for name, func in steps:
+                    threading.Thread(
+                        target=_run_step,
+                        args=(name, func, status.futures[name]),
+                        name=f"warm-up-{name}",
+                        daemon=True,
+                    ).start()
+                self.__dict__["warmup_status"] = status
+        if wait:
+            status.wait(timeout=timeout)
+        return status
+
+    def wait_until_ready(
+        self: "One",
+        timeout: T.Optional[float] = None,
+    ) -> bool:
+        """
+        Block until the warm-up finished, start it if it was not started.
+
+        :return: True if the warm-up finished within ``timeout``.
+        """
+        return self.warm_up().wait(timeout=timeout)
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+import typing as T
+import uuid
+import asyncio
+import weakref
+import threading
+
+from ..cache import LRUCache
+from ..utils import locked_cached_property
+
+from .one_03_agent import AgentMixin
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    from .one_01_main import One
+
+
+class AgentSession(AgentMixin):
+    """
+    The agents of one user session.
+
+    Each session has its own router, SQL, knowledge and report agents, and so
+    its own conversations, bounded by ``settings.conversation_window_size``.
+    Everything else is shared with the ``one`` object it comes from: the
+    model client, the tool specs, the system prompts, the SQL adapter, the
+    retrieval backend and the caches.
+
+    Requests of the same session must not run at the same time, hold
+    :attr:`lock` while using the agents. Async requests first queue on
+    :meth:`get_async_lock`, so at most one of them per event loop waits for
+    :attr:`lock`.
+
+    :param one: the object that owns the shared resources.
+    :param session_id: unique id of the session.
+    """
+
+    # a session serves a caller that handles the output itself
+    print_agent_output = False
+
+    def __init__(self, one: "One", session_id: str):
+        self.one = one
+        self.session_id = session_id
+        self.lock = threading.Lock()
+        self._async_locks: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    def __getattr__(self, name: str):
+        # only called for attributes the session doesn't define itself
+        if name in ("one", "session_id", "lock", "_async_locks"):
+            raise AttributeError(name)
+        return getattr(self.one, name)
+
+    def get_async_lock(self) -> asyncio.Lock:
+        """
+        The lock of the async requests of this session on the running event
+        loop. An ``asyncio.Lock`` belongs to one event loop, and
+        :func:`~music_bi_agent_poc.agent.stream_agent` runs each call on an
+        event loop of its own.
+        """
+        loop = asyncio.get_running_loop()
+        return self._async_locks.setdefault(loop, asyncio.Lock())
+
+    @property
+    def assistant_executor(self):
+        # one thread pool for all the sessions
+        return self.one.assistant_executor
+
+    def get_message_counts(self) -> dict[str, int]:
+        """
+        Number of messages in the conversation of each agent built so far.
+        """
+        return {
+            name: len(self.__dict__[name].messages)
+            for name in ("router_agent", "sql_agent", "knowledge_agent", "report_agent")
+            if name in self.__dict__
+        }
+
+
+class SessionMixin:
+    @locked_cached_property
+    def sessions(self: "One") -> LRUCache:
+        """
+        Live sessions by id, the least recently used ones are dropped beyond
+        ``settings.max_sessions`` and after ``settings.session_ttl`` seconds.
+        """
+        return LRUCache(
+            max_items=self.settings.max_sessions,
+            ttl=self.settings.session_ttl or None,
+        )
+
+    @locked_cached_property
+    def _sessions_lock(self: "One") -> threading.Lock:
+        return threading.Lock()
+
+    def get_session(
+        self: "One",
+        session_id: T.Optional[str] = None,
+    ) -> AgentSession:
+        """
+        Get the session with this id, create it if it doesn't exist or
+        expired.
+
+        :param session_id: None creates a new, unregistered session, for a
+            single request.
+        """
+        if session_id is None:
+            return AgentSession(one=self, session_id=uuid.uuid4().hex)
+        with self._sessions_lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = AgentSession(one=self, session_id=session_id)
+                self.sessions.put(session_id, session)
+        return session
+
+    def end_session(self: "One", session_id: str):
+        """
+        Forget a session and its conversations.
+        """
+        with self._sessions_lock:
+            self.sessions.pop(session_id)
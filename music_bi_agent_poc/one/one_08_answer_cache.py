@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+import typing as T
+
+from ..utils import locked_cached_property
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    from ..answer_cache import SemanticAnswerCache, CachedAnswer
+    from .one_01_main import One
+
+
+class AnswerCacheMixin:
+    @locked_cached_property
+    def answer_cache(self: "One") -> "SemanticAnswerCache":
+        """
+        Final answers of :func:`~music_bi_agent_poc.agent.run_agent` by
+        question embedding, see ``settings.answer_cache_enabled``.
+        """
+        from ..answer_cache import SemanticAnswerCache
+
+        return SemanticAnswerCache(
+            threshold=self.settings.answer_cache_threshold,
+            max_items=self.settings.answer_cache_max_items,
+            ttl=self.settings.answer_cache_ttl or None,
+        )
+
+    def get_answer_cache_version(self: "One") -> tuple:
+        """
+        A token that changes whenever an answer may change: the version of
+        every configured database and of the indexed knowledge base.
+        """
+        database_versions = tuple(
+            self.get_database_version(database.identifier)
+            for database in self.ohmy_sql_config.databases
+        )
+        return database_versions, self.get_knowledge_base_version()
+
+    def get_cached_answer(
+        self: "One",
+        question: str,
+    ) -> T.Optional["CachedAnswer"]:
+        """
+        The stored answer of a question similar enough to this one, None if
+        there is none or the cache is disabled.
+        """
+        if not self.settings.answer_cache_enabled:
+            return None
+        return self.answer_cache.get(
+            question=question,
+            embedding=self.single_embedding(question),
+            version=self.get_answer_cache_version(),
+        )
+
+    def put_cached_answer(
+        self: "One",
+        question: str,
+        answer: str,
+    ):
+        """
+        Store the final answer of a question, no-op if the cache is disabled.
+        """
+        if not self.settings.answer_cache_enabled:
+            return
+        self.answer_cache.put(
+            question=question,
+            embedding=self.single_embedding(question),
+            answer=answer,
+            version=self.get_answer_cache_version(),
+        )
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+import typing as T
+from pathlib import Path
+
+from ..paths import path_enum
+from ..utils import locked_cached_property
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    from ..route_classifier import NearestCentroidClassifier, RoutePrediction
+    from .one_01_main import One
+
+
+class RouteClassifierMixin:
+    def get_route_classifier_examples_path(self: "One") -> Path:
+        if self.settings.route_classifier_examples:
+            return Path(self.settings.route_classifier_examples)
+        return path_enum.path_prompts_router_examples
+
+    @locked_cached_property
+    def route_classifier(self: "One") -> "NearestCentroidClassifier":
+        """
+        Route classifier trained from ``settings.route_classifier_examples``.
+        The example embeddings go through :meth:`batch_embedding`, so they
+        are only computed once thanks to the embedding cache.
+        """
+        from ..route_classifier import load_labelled_queries, NearestCentroidClassifier
+
+        labelled_queries = load_labelled_queries(
+            self.get_route_classifier_examples_path()
+        )
+        return NearestCentroidClassifier.fit(
+            embeddings=self.batch_embedding(
+                [labelled_query.query for labelled_query in labelled_queries]
+            ),
+            routes=[labelled_query.route for labelled_query in labelled_queries],
+        )
+
+    def classify_route(self: "One", question: str) -> T.Optional["RoutePrediction"]:
+        """
+        Predict the route of a question, None if the prediction is below
+        ``settings.route_classifier_min_score`` or
+        ``settings.route_classifier_min_margin``, the router LLM should
+        decide then.
+        """
+        prediction = self.route_classifier.predict(self.single_embedding(question))
+        if prediction.is_confident(
+            min_score=self.settings.route_classifier_min_score,
+            min_margin=self.settings.route_classifier_min_margin,
+        ):
+            return prediction
+        return None
@@ -57,12 +57,20 @@ class PathEnum:
 
     # App
     path_sqlite = dir_project_root / "chinook.sqlite"
+    path_sqlite_indexed = dir_tmp / "chinook_indexed.sqlite"
     path_prompts_sql_agent = dir_package / "prompts" / "sql_agent.md"
     path_prompts_knowledge = dir_package / "prompts" / "knowledge.md"
     path_prompts_router = dir_package / "prompts" / "router.md"
     path_prompts_report = dir_package / "prompts" / "report.md"
+    path_prompts_router_examples = dir_package / "prompts" / "router_examples.jsonl"
 
     path_knowledge_base_txt = dir_project_root / "genai" / "tmp" / "all_in_one_knowledge_base.txt"
+    dir_local_vector_index = dir_tmp / "local_vector_index"
+    dir_ann_index = dir_tmp / "ann_index"
+    dir_chunk_cache = dir_tmp / "chunk_cache"
+    dir_embedding_cache = dir_tmp / "embedding_cache"
+    dir_analytic_snapshot = dir_tmp / "analytic_snapshot"
+    path_s3vectors_manifest_json = dir_tmp / "s3vectors_manifest.json"
     # fmt: on
 
 path_enum = PathEnum()
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+"""
+Nearest centroid classifier of user questions into router routes, over the
+question embeddings, so a confident prediction can dispatch a question to
+its specialist without the router LLM turn.
+
+It is trained from a JSON lines file of labelled questions::
+
+    {"query": "Which artist has the highest sales?", "route": "sql"}
+    {"query": "Where is the agent code?", "route": "knowledge"}
+
+and evaluated offline with leave-one-out cross validation, see
+:func:`cross_validate` and ``scripts/evaluate_route_classifier.py``.
+"""
+
+import typing as T
+import json
+import dataclasses
+from pathlib import Path
+
+import numpy as np
+
+from .local_vector_index import normalize
+from .routing import ROUTE_DIRECT, ROUTES
+
+
+@dataclasses.dataclass(frozen=True)
+class LabelledQuery:
+    """
+    :param query: the user question.
+    :param route: one of :data:`~music_bi_agent_poc.routing.ROUTES`.
+    """
+
+    query: str
+    route: str
+
+
+def load_labelled_queries(path: Path) -> list[LabelledQuery]:
+    """
+    Read a JSON lines file of ``{"query": ..., "route": ...}`` objects,
+    blank lines are skipped.
+    """
+    labelled_queries = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        if not line.strip():
+            continue
+        data = json.loads(line)
+        if data["route"] not in ROUTES:
+            raise ValueError(f"unknown route {data['route']!r} in {line!r}")
+        labelled_queries.append(LabelledQuery(query=data["query"], route=data["route"]))
+    return labelled_queries
+
+
+@dataclasses.dataclass(frozen=True)
+class RoutePrediction:
+    """
+    :param route: the route of the closest centroid.
+    :param score: cosine similarity between the question and that centroid.
+    :param margin: difference with the score of the second closest centroid,
+        the larger the more confident.
+    """
+
+    route: str
+    score: float
+    margin: float
+
+    def is_confident(self, min_score: float, min_margin: float) -> bool:
+        return self.score >= min_score and self.margin >= min_margin
+
+
+class NearestCentroidClassifier:
+    """
+    One centroid per route: the normalized mean of the normalized embeddings
+    of its examples. A question goes to the route of the most similar
+    centroid.
+
+    :param routes: route of each centroid.
+    :param centroids: unit length centroids, aligned with ``routes``.
+    """
+
+    def __init__(self, routes: list[str], centroids: np.ndarray):
+        if len(routes) < 2:
+            raise ValueError("at least two routes are needed to classify")
+        self.routes = routes
+        self.centroids = centroids
+
+    @classmethod
+    def fit(
+        cls,
+        embeddings: T.Union[np.ndarray, T.Sequence[T.Sequence[float]]],
+        routes: T.Sequence[str],
+    ) -> "NearestCentroidClassifier":
+        matrix = normalize(embeddings)
+        labels = np.asarray(routes)
+        route_names = [route for route in ROUTES if route in set(routes)]
+        centroids = np.stack(
+            [matrix[labels == route].mean(axis=0) for route in route_names]
+        )
+        return cls(routes=route_names, centroids=normalize(centroids))
+
+    def predict(
+        self,
+        embedding: T.Union[np.ndarray, T.Sequence[float]],
+    ) -> RoutePrediction:
+        scores = self.centroids @ normalize(embedding)[0]
+        second, first = np.argsort(scores)[-2:]
+        return RoutePrediction(
+            route=self.routes[first],
+            score=float(scores[first]),
+            margin=float(scores[first] - scores[second]),
+        )
+
+
+@dataclasses.dataclass
+class EvaluationRow:
+    """
+    Routing quality at one confidence threshold, see :func:`cross_validate`.
+
+    :param min_margin: the threshold.
+    :param coverage: fraction of the questions predicted confidently.
+    :param accuracy: fraction of the confident predictions that are right.
+    :param skipped: fraction of the questions that skip the router LLM, the
+        confident predictions of a specialist route.
+    :param wrong_dispatch: fraction of the questions sent to the wrong
+        specialist without the router LLM.
+    """
+
+    min_margin: float
+    coverage: float
+    accuracy: float
+    skipped: float
+    wrong_dispatch: float
+
+    def get_seconds_saved(self, router_seconds: float) -> float:
+        """
+        Average seconds saved per question for a router LLM turn of
+        ``router_seconds``.
+        """
+        return self.skipped * router_seconds
+
+
+def cross_validate(
+    embeddings: T.Union[np.ndarray, T.Sequence[T.Sequence[float]]],
+    routes: T.Sequence[str],
+    min_margins: T.Sequence[float],
+    min_score: float = 0.0,
+) -> list[EvaluationRow]:
+    """
+    Leave-one-out evaluation: every question is classified by centroids
+    computed without it, then the predictions are scored at each threshold.
+    """
+    matrix = normalize(embeddings)
+    labels = np.asarray(routes)
+    route_names = [route for route in ROUTES if route in set(routes)]
+    sums = {route: matrix[labels == route].sum(axis=0) for route in route_names}
+    counts = {route: int((labels == route).sum()) for route in route_names}
+    predictions = []
+    for ith, route in enumerate(labels):
+        held_out_routes = []
+        centroids = []
+        for name in route_names:
+            total = sums[name] - matrix[ith] if name == route else sums[name]
+            count = counts[name] - 1 if name == route else counts[name]
+            if count > 0:
+                held_out_routes.append(name)
+                centroids.append(total / count)
+        classifier = NearestCentroidClassifier(
+            routes=held_out_routes,
+            centroids=normalize(np.stack(centroids)),
+        )
+        predictions.append(classifier.predict(matrix[ith]))
+    n = len(predictions)
+    rows = []
+    for min_margin in min_margins:
+        confident = [
+            (prediction, route)
+            for prediction, route in zip(predictions, labels)
+            if prediction.is_confident(min_score=min_score, min_margin=min_margin)
+        ]
+        n_right = sum(prediction.route == route for prediction, route in confident)
+        dispatched = [
+            (prediction, route)
+            for prediction, route in confident
+            if prediction.route != ROUTE_DIRECT
+        ]
+        rows.append(
+            EvaluationRow(
+                min_margin=min_margin,
+                coverage=len(confident) / n,
+                accuracy=(n_right / len(confident)) if confident else 1.0,
+                skipped=len(dispatched) / n,
+                wrong_dispatch=sum(
+                    prediction.route != route for prediction, route in dispatched
+                )
+                / n,
+            )
+        )
+    return rows
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+"""
+What the router agent did for one user query, used to skip the report agent
+when the router answer is already final.
+"""
+
+import typing as T
+import re
+import dataclasses
+
+#: router tools that delegate to a specialist agent
+SPECIALIST_TOOLS = {"sql_assistant", "knowledge_assistant", "hybrid_assistant"}
+
+#: answered by the router itself
+ROUTE_DIRECT = "direct"
+#: ``sql_assistant``
+ROUTE_SQL = "sql"
+#: ``knowledge_assistant``
+ROUTE_KNOWLEDGE = "knowledge"
+#: both specialists, ``hybrid_assistant``
+ROUTE_HYBRID = "hybrid"
+ROUTES = (ROUTE_DIRECT, ROUTE_SQL, ROUTE_KNOWLEDGE, ROUTE_HYBRID)
+
+#: router tool of each specialist route
+ROUTE_TOOLS = {
+    ROUTE_SQL: "sql_assistant",
+    ROUTE_KNOWLEDGE: "knowledge_assistant",
+    ROUTE_HYBRID: "hybrid_assistant",
+}
+
+_heading_pattern = re.compile(r"^#{1,6} \S", re.MULTILINE)
+_table_pattern = re.compile(r"^\|.*\|\s*\n\|[\s:|-]+\|\s*$", re.MULTILINE)
+_list_item_pattern = re.compile(r"^\s*(?:[-*]|\d+\.) \S", re.MULTILINE)
+
+
+class ToolCallRecorder:
+    """
+    strands hook provider that records the name of every tool an agent
+    calls during one invocation, in the ``tool_calls`` list of the
+    invocation state, when the caller passes one::
+
+        tool_calls = []
+        agent(prompt, invocation_state={"tool_calls": tool_calls})
+
+    Unlike the conversation messages, the list isn't affected by the
+    conversation manager trimming the history at the end of the invocation.
+    """
+
+    def register_hooks(self, registry: T.Any, **kwargs: T.Any):
+        from strands.hooks import BeforeToolCallEvent
+
+        registry.add_callback(BeforeToolCallEvent, self.on_before_tool_call)
+
+    def on_before_tool_call(self, event: T.Any):
+        tool_calls = event.invocation_state.get("tool_calls")
+        if tool_calls is not None:
+            tool_calls.append(event.tool_use["name"])
+
+
+def get_failed_assistants(tool_context: T.Any) -> T.Optional[list[str]]:
+    """
+    The ``failed_assistants`` list of the invocation state of a tool call,
+    where :meth:`~music_bi_agent_poc.one.one_03_agent.AgentMixin.run_assistants`
+    records the assistants that failed or timed out, None if the caller
+    didn't pass one::
+
+        tool_calls, failed_assistants = [], []
+        agent(
+            prompt,
+            invocation_state={
+                "tool_calls": tool_calls,
+                "failed_assistants": failed_assistants,
+            },
+        )
+
+    The router LLM may rephrase a failure in its answer, the list doesn't
+    depend on it.
+
+    :param tool_context: the strands ``ToolContext`` of the call, None when
+        the tool is called directly.
+    """
+    if tool_context is None:
+        return None
+    return tool_context.invocation_state.get("failed_assistants")
+
+
+def is_formatted_answer(text: str) -> bool:
+    """
+    Whether a text already looks like a structured final answer: it has a
+    markdown heading, a table or a list of at least three items.
+    """
+    return bool(
+        _heading_pattern.search(text)
+        or _table_pattern.search(text)
+        or len(_list_item_pattern.findall(text)) >= 3
+    )
+
+
+@dataclasses.dataclass
+class RoutingDecision:
+    """
+    :param answer: the router answer.
+    :param tools: names of the tools the router called, in call order.
+    :param failed_assistants: names of the assistants that failed or timed
+        out, see :func:`get_failed_assistants`.
+    """
+
+    answer: str
+    tools: list[str] = dataclasses.field(default_factory=list)
+    failed_assistants: list[str] = dataclasses.field(default_factory=list)
+
+    @property
+    def specialists(self) -> list[str]:
+        return [name for name in self.tools if name in SPECIALIST_TOOLS]
+
+    @property
+    def delegated(self) -> bool:
+        return len(self.specialists) > 0
+
+    @property
+    def failed(self) -> bool:
+        """
+        Whether a specialist call failed or timed out, whatever the router
+        answer says about it.
+        """
+        return len(self.failed_assistants) > 0
+
+    def is_final(self, skip_formatted: bool = False) -> bool:
+        """
+        Whether the router answer can be returned without the report agent:
+        the router answered directly, or, if ``skip_formatted``, it
+        delegated to a single specialist call that worked and its answer is
+        already formatted. Never when a specialist call failed.
+        """
+        if self.failed:
+            return False
+        if not self.delegated:
+            return True
+        if not skip_formatted:
+            return False
+        return (
+            len(self.specialists) == 1
+            and self.specialists[0] != "hybrid_assistant"
+            and is_formatted_answer(self.answer)
+        )
+
+
+def make_specialist_queries(route: str, user_input: str) -> dict[str, str]:
+    """
+    The assistant queries the router would write for a question of a
+    specialist route, in the format ``router.md`` asks for, see
+    :meth:`~music_bi_agent_poc.one.one_03_agent.AgentMixin.run_assistants`.
+    """
+    queries = dict()
+    if route in (ROUTE_SQL, ROUTE_HYBRID):
+        queries["sql_assistant"] = (
+            f"Run SQL if needed: '{user_input}'. Use your available tools to "
+            f"write SQL (SELECT ONLY), run SQL, and interpret SQL results properly."
+        )
+    if route in (ROUTE_KNOWLEDGE, ROUTE_HYBRID):
+        queries["knowledge_assistant"] = (
+            f"Retrieve knowledge if needed: '{user_input}'. Use your available "
+            f"tools to retrieve relevant information from knowledge base."
+        )
+    return queries
+
+
+def make_routing_decision(
+    answer: T.Any,
+    tool_calls: list[str],
+    failed_assistants: T.Sequence[str] = (),
+) -> RoutingDecision:
+    """
+    :param answer: the router agent result.
+    :param tool_calls: the tools the router called for this query, recorded
+        by :class:`ToolCallRecorder`.
+    :param failed_assistants: the assistants that failed, see
+        :func:`get_failed_assistants`.
+    """
+    return RoutingDecision(
+        answer=str(answer),
+        tools=list(tool_calls),
+        failed_assistants=list(failed_assistants),
+    )
@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+
+"""
+Runtime settings for the ``One`` singleton.
+
+Every field can be overridden without code changes by setting the environment
+variable ``MUSIC_BI_AGENT_POC_${FIELD_NAME_IN_UPPER_CASE}``, for example::
+
+    export MUSIC_BI_AGENT_POC_RETRIEVAL_BACKEND=local
+"""
+
+import typing as T
+import os
+import enum
+import dataclasses
+
+ENV_VAR_PREFIX = "MUSIC_BI_AGENT_POC_"
+
+
+class RetrievalBackendEnum(str, enum.Enum):
+    """
+    Where :meth:`~music_bi_agent_poc.one.one_05_rag.RagMixin.retrieve`
+    looks up the knowledge base.
+    """
+
+    s3vectors = "s3vectors"
+    local = "local"
+
+
+class RetrievalModeEnum(str, enum.Enum):
+    """
+    How :meth:`~music_bi_agent_poc.one.one_05_rag.RagMixin.retrieve` ranks
+    the knowledge base chunks.
+    """
+
+    dense = "dense"
+    hybrid = "hybrid"
+
+
+class LocalIndexTypeEnum(str, enum.Enum):
+    """
+    How the ``local`` retrieval backend searches the embeddings.
+    """
+
+    exact = "exact"
+    ivf = "ivf"
+
+
+class AnnQuantizationEnum(str, enum.Enum):
+    """
+    How the ``ivf`` local index compresses the embeddings, see
+    :mod:`music_bi_agent_poc.ann_index`.
+    """
+
+    int8 = "int8"
+    pq = "pq"
+
+
+class FullScanPolicyEnum(str, enum.Enum):
+    """
+    What to do with a SELECT statement whose query plan scans every row of
+    a large table, see :func:`~music_bi_agent_poc.sql_plan.check_query_plan`.
+    """
+
+    off = "off"
+    warn = "warn"
+    reject = "reject"
+
+
+def _parse_bool(value: str) -> bool:
+    return value.strip().lower() in ("1", "true", "yes", "y", "on")
+
+
+_converters: dict[type, T.Callable[[str], T.Any]] = {
+    str: str,
+    int: int,
+    float: float,
+    bool: _parse_bool,
+}
+
+
+@dataclasses.dataclass
+class Settings:
+    """
+    :param retrieval_backend: value of :class:`RetrievalBackendEnum`.
+    :param chunk_fetch_max_workers: max number of threads used to download
+        retrieved chunk bodies from S3 concurrently.
+    :param chunk_fetch_timeout: connect / read timeout in seconds for each
+        chunk body download, a chunk that times out is left out of the result.
+    :param store_chunk_text_in_metadata: if True, ``prepare_knowledge_base``
+        also stores the chunk text as vector metadata, so ``retrieve`` gets
+        the text from ``query_vectors`` and skips the S3 round trip.
+    :param chunk_cache_max_bytes: max total size of chunk bodies kept in the
+        in-memory chunk cache.
+    :param chunk_cache_on_disk: if True, chunk bodies are also cached on disk
+        so the cache survives process restarts.
+    :param embedding_batch_size: number of chunks embedded at once when
+        indexing the knowledge base.
+    :param upload_max_workers: max number of threads used to upload chunk
+        bodies to S3 when indexing the knowledge base.
+    :param put_vectors_max_attempts: max attempts of a throttled or failed
+        put / delete vectors request.
+    :param chunk_max_tokens: token window of the embedding model, documents
+        longer than that are split into chunks. 0 disables chunking.
+    :param chunk_overlap_tokens: max number of tokens repeated between two
+        consecutive chunks of the same document.
+    :param merge_adjacent_chunks: merge retrieved chunks of the same document
+        that overlap or touch each other.
+    :param embedding_cache_enabled: cache chunk embeddings on disk, keyed by
+        model name and hash of the text, so re-indexing unchanged text never
+        runs the embedding model again.
+    :param query_embedding_cache_size: max number of query embeddings kept
+        in memory.
+    :param warm_up_on_init: start :meth:`~music_bi_agent_poc.one.one_06_warmup.WarmupMixin.warm_up`
+        in the background as soon as ``One`` is created.
+    :param sql_schema_in_prompt: inject a compact digest of the database
+        schema into the SQL agent system prompt, so it doesn't need to call
+        ``get_schema_details`` before every query.
+    :param query_result_cache_max_items: max number of SELECT results kept
+        in the query result cache. 0 disables the cache.
+    :param query_result_cache_max_bytes: max total size of the cached
+        SELECT results.
+    :param query_result_cache_ttl: seconds a cached SELECT result stays valid.
+    :param sqlite_read_only: open the SQLite database read-only, with
+        pooled connections, tuning pragmas and ``query_only``.
+    :param sqlite_immutable: in read-only mode, also open the file with
+        ``immutable=1``, SQLite then skips locking. Connections are reopened
+        when the file changes.
+    :param sqlite_pool_size: number of connections kept open.
+    :param sqlite_mmap_size: bytes of the database file to memory map.
+    :param sqlite_cache_size: SQLite page cache size, in KiB if negative.
+    :param analytic_snapshot_enabled: answer supported sales aggregate
+        queries from a columnar snapshot of the Chinook database instead of
+        SQLite, see :mod:`music_bi_agent_poc.analytics`.
+    :param sql_query_timeout: seconds after which a SELECT statement is
+        interrupted, 0 disables the limit.
+    :param sql_max_rows: max number of rows returned by one
+        ``execute_select_statement`` call, 0 disables the limit.
+    :param sql_result_pagination: end truncated results with a cursor token
+        that ``fetch_more_rows`` accepts to return the next page.
+    :param sql_full_scan_policy: run ``EXPLAIN QUERY PLAN`` before each
+        SELECT statement and ``warn`` about or ``reject`` full scans of large
+        tables, or ``off``. Aggregates without a WHERE clause need every row
+        and are never flagged.
+    :param sql_full_scan_min_rows: tables with fewer rows are never flagged.
+    :param sql_slow_query_seconds: statements slower than that are recorded
+        by the index advisor, see :meth:`~music_bi_agent_poc.one.one_04_sql.SqlMixin.propose_indexes`.
+    :param assistant_max_workers: max number of assistant calls that run at
+        the same time, see :meth:`~music_bi_agent_poc.one.one_03_agent.AgentMixin.run_assistants`.
+    :param sql_assistant_timeout: seconds after which the router stops
+        waiting for ``sql_assistant``, 0 disables the limit.
+    :param knowledge_assistant_timeout: same for ``knowledge_assistant``.
+    :param skip_report_when_direct: return the router answer as is, without
+        the report agent, when the router didn't call any specialist.
+    :param skip_report_when_formatted: also skip the report agent when the
+        router called a single specialist and its answer is already
+        formatted (headings, tables or lists).
+    :param conversation_window_size: max number of messages an agent keeps
+        in its conversation, older ones are dropped.
+    :param max_sessions: max number of live sessions, see
+        :meth:`~music_bi_agent_poc.one.one_07_session.SessionMixin.get_session`.
+    :param session_ttl: seconds after which a session is dropped, 0 keeps
+        sessions until they are evicted by ``max_sessions``.
+    :param answer_cache_enabled: return the stored final answer of a
+        question similar enough to one already answered, see
+        :mod:`music_bi_agent_poc.answer_cache`.
+    :param answer_cache_threshold: min cosine similarity between the
+        embeddings of two questions to reuse the answer.
+    :param answer_cache_max_items: max number of stored answers.
+    :param answer_cache_ttl: seconds a stored answer stays valid, 0 keeps it
+        until the database or the knowledge base changes.
+    :param sql_templates_enabled: answer the ``sql_assistant`` questions
+        that match a vetted SQL template (top N artists by revenue, genre
+        performance, monthly trend, ...) without the SQL agent, see
+        :mod:`music_bi_agent_poc.sql_templates`.
+    :param route_classifier_enabled: dispatch a question straight to its
+        specialists, without the router LLM turn, when the embedding route
+        classifier is confident, see :mod:`music_bi_agent_poc.route_classifier`.
+    :param route_classifier_examples: path of the JSON lines file of labelled
+        questions the classifier is trained from, empty for the bundled
+        ``prompts/router_examples.jsonl``.
+    :param route_classifier_min_score: min cosine similarity between the
+        question and the closest route centroid to trust the prediction.
+    :param route_classifier_min_margin: min difference between the scores of
+        the closest and the second closest route centroids to trust the
+        prediction, tune it with ``scripts/evaluate_route_classifier.py``.
+    :param retrieval_mode: value of :class:`RetrievalModeEnum`, ``dense``
+        by default, the vector search only. ``hybrid`` fuses it with a BM25
+        keyword search, see :mod:`music_bi_agent_poc.hybrid_retrieval`.
+    :param hybrid_candidates: number of chunks taken from each of the vector
+        and keyword rankings before fusing them, and reranked if
+        ``rerank_model`` is set.
+    :param rrf_k: constant of the reciprocal rank fusion, the larger the
+        less the top ranks dominate.
+    :param rerank_model: fastembed cross-encoder model that reranks the fused
+        candidates, e.g. ``Xenova/ms-marco-MiniLM-L-6-v2``, empty disables
+        reranking.
+    :param local_index_type: value of :class:`LocalIndexTypeEnum`, ``ivf``
+        searches the ``local`` backend with an approximate, quantized index,
+        for knowledge bases too large for the exact search.
+    :param ann_quantization: value of :class:`AnnQuantizationEnum`, ``int8``
+        keeps one byte per dimension, ``pq`` one byte per ``ann_pq_m`` group.
+    :param ann_n_lists: number of k-means clusters of the ``ivf`` index, 0
+        picks ``4 * sqrt(number of chunks)``.
+    :param ann_n_probe: number of clusters scanned per query, higher is
+        slower with a better recall, tune it with
+        ``scripts/benchmark_ann_index.py``.
+    :param ann_pq_m: number of dimension groups of the ``pq`` quantization,
+        the embedding dimension must be a multiple of it.
+    :param ann_refine: score the best ``ann_refine * top_k`` candidates again
+        with the exact embeddings, 0 disables it.
+    """
+
+    retrieval_backend: str = dataclasses.field(
+        default=RetrievalBackendEnum.s3vectors.value
+    )
+    chunk_fetch_max_workers: int = dataclasses.field(default=8)
+    chunk_fetch_timeout: float = dataclasses.field(default=5.0)
+    store_chunk_text_in_metadata: bool = dataclasses.field(default=False)
+    chunk_cache_max_bytes: int = dataclasses.field(default=64 * 1024 * 1024)
+    chunk_cache_on_disk: bool = dataclasses.field(default=False)
+    embedding_batch_size: int = dataclasses.field(default=256)
+    upload_max_workers: int = dataclasses.field(default=16)
+    put_vectors_max_attempts: int = dataclasses.field(default=5)
+    chunk_max_tokens: int = dataclasses.field(default=512)
+    chunk_overlap_tokens: int = dataclasses.field(default=64)
+    merge_adjacent_chunks: bool = dataclasses.field(default=True)
+    embedding_cache_enabled: bool = dataclasses.field(default=True)
+    query_embedding_cache_size: int = dataclasses.field(default=1024)
+    warm_up_on_init: bool = dataclasses.field(default=False)
+    sql_schema_in_prompt: bool = dataclasses.field(default=True)
+    query_result_cache_max_items: int = dataclasses.field(default=256)
+    query_result_cache_max_bytes: int = dataclasses.field(default=16 * 1024 * 1024)
+    query_result_cache_ttl: float = dataclasses.field(default=600.0)
+    sqlite_read_only: bool = dataclasses.field(default=True)
+    sqlite_immutable: bool = dataclasses.field(default=True)
+    sqlite_pool_size: int = dataclasses.field(default=16)
+    sqlite_mmap_size: int = dataclasses.field(default=256 * 1024 * 1024)
+    sqlite_cache_size: int = dataclasses.field(default=-64 * 1024)
+    analytic_snapshot_enabled: bool = dataclasses.field(default=False)
+    sql_query_timeout: float = dataclasses.field(default=30.0)
+    sql_max_rows: int = dataclasses.field(default=200)
+    sql_result_pagination: bool = dataclasses.field(default=True)
+    sql_full_scan_policy: str = dataclasses.field(default=FullScanPolicyEnum.warn.value)
+    sql_full_scan_min_rows: int = dataclasses.field(default=1000)
+    sql_slow_query_seconds: float = dataclasses.field(default=1.0)
+    assistant_max_workers: int = dataclasses.field(default=8)
+    sql_assistant_timeout: float = dataclasses.field(default=120.0)
+    knowledge_assistant_timeout: float = dataclasses.field(default=60.0)
+    skip_report_when_direct: bool = dataclasses.field(default=True)
+    skip_report_when_formatted: bool = dataclasses.field(default=False)
+    conversation_window_size: int = dataclasses.field(default=20)
+    max_sessions: int = dataclasses.field(default=1000)
+    session_ttl: float = dataclasses.field(default=3600.0)
+    answer_cache_enabled: bool = dataclasses.field(default=False)
+    answer_cache_threshold: float = dataclasses.field(default=0.92)
+    answer_cache_max_items: int = dataclasses.field(default=1000)
+    answer_cache_ttl: float = dataclasses.field(default=86400.0)
+    sql_templates_enabled: bool = dataclasses.field(default=True)
+    route_classifier_enabled: bool = dataclasses.field(default=False)
+    route_classifier_examples: str = dataclasses.field(default="")
+    route_classifier_min_score: float = dataclasses.field(default=0.6)
+    route_classifier_min_margin: float = dataclasses.field(default=0.05)
+    retrieval_mode: str = dataclasses.field(default=RetrievalModeEnum.dense.value)
+    hybrid_candidates: int = dataclasses.field(default=20)
+    rrf_k: int = dataclasses.field(default=60)
+    rerank_model: str = dataclasses.field(default="")
+    local_index_type: str = dataclasses.field(default=LocalIndexTypeEnum.exact.value)
+    ann_quantization: str = dataclasses.field(default=AnnQuantizationEnum.int8.value)
+    ann_n_lists: int = dataclasses.field(default=0)
+    ann_n_probe: int = dataclasses.field(default=8)
+    ann_pq_m: int = dataclasses.field(default=48)
+    ann_refine: int = dataclasses.field(default=0)
+
+    def __post_init__(self):
+        self.retrieval_backend = RetrievalBackendEnum(self.retrieval_backend).value
+        self.retrieval_mode = RetrievalModeEnum(self.retrieval_mode).value
+        self.local_index_type = LocalIndexTypeEnum(self.local_index_type).value
+        self.ann_quantization = AnnQuantizationEnum(self.ann_quantization).value
+        self.sql_full_scan_policy = FullScanPolicyEnum(self.sql_full_scan_policy).value
+
+    @classmethod
+    def from_env(cls, environ: T.Optional[T.Mapping[str, str]] = None):
+        """
+        Create a :class:`Settings` object, reading overrides from environment
+        variables.
+        """
+        if environ is None:
+            environ = os.environ
+        kwargs = dict()
+        for field in dataclasses.fields(cls):
+            env_var = f"{ENV_VAR_PREFIX}{field.name.upper()}"
+            if env_var in environ:
+                kwargs[field.name] = _converters[field.type](environ[env_var])
+        return cls(**kwargs)
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+
+"""
+Bounded execution of the SELECT statements the SQL agent runs.
+
+- a per query time limit, enforced on SQLite with a progress handler that
+  interrupts the statement once the deadline is passed.
+- a max number of rows per result, rows are streamed from the cursor and
+  the statement stops as soon as the page is full.
+- pagination: a truncated result ends with a cursor token that fetches the
+  next page.
+"""
+
+import typing as T
+import re
+import time
+import hashlib
+import itertools
+import contextlib
+import dataclasses
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    import sqlalchemy as sa
+
+#: number of SQLite virtual machine instructions between two deadline checks
+PROGRESS_HANDLER_STEPS = 1000
+
+_cursor_pattern = re.compile(r"^(?P<digest>[0-9a-f]{16}):(?P<offset>\d+)$")
+
+
+class QueryTimeoutError(Exception):
+    pass
+
+
+@dataclasses.dataclass
+class QueryPage:
+    """
+    One page of a query result.
+
+    :param columns: result column names.
+    :param rows: at most ``max_rows`` rows.
+    :param offset: number of rows before this page.
+    :param has_more: whether there are rows after this page.
+    """
+
+    columns: list[str]
+    rows: list[list]
+    offset: int
+    has_more: bool
+
+    @property
+    def next_offset(self) -> int:
+        return self.offset + len(self.rows)
+
+
+def paginate(
+    columns: list[str],
+    rows: T.Iterable[T.Sequence],
+    offset: int,
+    max_rows: int,
+) -> QueryPage:
+    """
+    Take one page out of a row iterator, consuming at most
+    ``offset + max_rows + 1`` rows of it.
+    """
+    page = [
+        list(row)
+        for row in itertools.islice(rows, offset, offset + max_rows + 1)
+    ]
+    return QueryPage(
+        columns=list(columns),
+        rows=page[:max_rows],
+        offset=offset,
+        has_more=len(page) > max_rows,
+    )
+
+
+@contextlib.contextmanager
+def sqlite_deadline(dbapi_connection, timeout: float):
+    """
+    Interrupt any statement run on a ``sqlite3`` connection within this
+    context once ``timeout`` seconds are elapsed. Does nothing if ``timeout``
+    is not positive or the connection is not a SQLite one.
+    """
+    set_progress_handler = getattr(dbapi_connection, "set_progress_handler", None)
+    if timeout <= 0 or set_progress_handler is None:
+        yield
+        return
+    deadline = time.monotonic() + timeout
+
+    def handler():
+        # a non zero return value aborts the statement
+        return 1 if time.monotonic() > deadline else 0
+
+    set_progress_handler(handler, PROGRESS_HANDLER_STEPS)
+    try:
+        yield
+    except Exception as e:
+        if time.monotonic() > deadline and "interrupted" in str(e):
+            raise QueryTimeoutError(
+                f"the query exceeded the {timeout} seconds time limit and was "
+                f"interrupted, simplify it or add more specific filters"
+            ) from e
+        raise
+    finally:
+        set_progress_handler(None, 0)
+
+
+def execute_select_page(
+    engine: "sa.Engine",
+    sql: str,
+    params: T.Optional[dict[str, T.Any]],
+    offset: int,
+    max_rows: int,
+    timeout: float,
+) -> QueryPage:
+    """
+    Run a SELECT statement and fetch one page of its result.
+
+    :raises QueryTimeoutError: if the query takes longer than ``timeout``.
+    """
+    import sqlalchemy as sa
+
+    with engine.connect() as connection:
+        dbapi_connection = connection.connection.dbapi_connection
+        with sqlite_deadline(dbapi_connection, timeout):
+            result = connection.execute(sa.text(sql), params)
+            try:
+                return paginate(
+                    columns=list(result.keys()),
+                    rows=result,
+                    offset=offset,
+                    max_rows=max_rows,
+                )
+            finally:
+                result.close()
+
+
+def make_query_digest(*parts: T.Any) -> str:
+    """
+    Short digest that identifies a query, used in cursor tokens.
+    """
+    return hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def make_cursor(digest: str, offset: int) -> str:
+    return f"{digest}:{offset}"
+
+
+def parse_cursor(cursor: str) -> T.Optional[tuple[str, int]]:
+    """
+    :return: (query digest, offset), or None if the cursor is malformed.
+    """
+    match = _cursor_pattern.match(cursor.strip().strip("\"'"))
+    if match is None:
+        return None
+    return match.group("digest"), int(match.group("offset"))
+
+
+def format_page(
+    page: QueryPage,
+    cursor: T.Optional[str] = None,
+) -> str:
+    """
+    Format a page like ``mcp_ohmy_sql`` formats a query result, followed by
+    a note if the result is truncated, with the cursor of the next page if
+    pagination is enabled.
+    """
+    from tabulate import tabulate
+
+    if len(page.rows) == 0:
+        text = "No result"
+    else:
+        text = tabulate(
+            [page.columns, *page.rows],
+            headers="firstrow",
+            tablefmt="pipe",
+            floatfmt=".4f",
+        )
+    if not page.has_more:
+        return text
+    lines = [
+        text,
+        "",
+        "# Truncated",
+        f"Showing rows {page.offset + 1} to {page.next_offset}, more rows are available.",
+    ]
+    if cursor is None:
+        lines.append(
+            "Add a LIMIT, more specific filters or an aggregation to see the rest."
+        )
+    else:
+        lines.append(
+            f'Call fetch_more_rows(cursor="{cursor}") to get the next page, '
+            f"or refine the query."
+        )
+    return "\n".join(lines)
+
+
+def format_select_result(
+    duration: float,
+    query_result_text: str,
+    cached: bool = False,
+) -> str:
+    """
+    Format a query result like ``mcp_ohmy_sql`` does, execution time first.
+    A result served from the result cache says so, its time is the time to
+    serve it, not the time of the run that produced it.
+    """
+    execution_time = f"{duration:.3f} seconds"
+    if cached:
+        execution_time = f"{execution_time} (cached result, the query was not run)"
+    lines = [
+        "# Execution Time",
+        execution_time,
+        "",
+        "# Query Result",
+        query_result_text,
+    ]
+    return "\n".join(lines)
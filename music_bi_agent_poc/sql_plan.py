@@ -0,0 +1,511 @@
+# -*- coding: utf-8 -*-
+
+"""
+``EXPLAIN QUERY PLAN`` pre-flight checks and an index advisor for the
+SELECT statements the SQL agent runs on SQLite.
+
+- :func:`check_query_plan` flags full table scans of large tables before a
+  statement runs.
+- :class:`QueryAdvisor` records the shapes of slow statements and proposes
+  covering indexes for the tables they scan, which
+  :func:`create_indexed_copy` builds in a writable copy of the database.
+"""
+
+import typing as T
+import sqlite3
+import threading
+import dataclasses
+from pathlib import Path
+
+from .sql_shape import Token, tokenize
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    import sqlalchemy as sa
+
+
+@dataclasses.dataclass
+class TableStats:
+    """
+    :param row_counts: lower case table name -> number of rows.
+    :param columns_by_table: lower case table name -> lower case column names.
+    :param indexes: lower case table name -> the lower case columns of each
+        of its indexes.
+    """
+
+    row_counts: dict[str, int]
+    columns_by_table: dict[str, set[str]]
+    indexes: dict[str, list[list[str]]]
+
+
+def get_table_stats(dbapi_connection: sqlite3.Connection) -> TableStats:
+    row_counts = dict()
+    columns_by_table = dict()
+    indexes = dict()
+    tables = [
+        row[0]
+        for row in dbapi_connection.execute(
+            "SELECT name FROM sqlite_master "
+            "WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+        )
+    ]
+    for table in tables:
+        key = table.lower()
+        (row_counts[key],) = dbapi_connection.execute(
+            f'SELECT COUNT(*) FROM "{table}"'
+        ).fetchone()
+        columns_by_table[key] = {
+            row[1].lower()
+            for row in dbapi_connection.execute(f'PRAGMA table_info("{table}")')
+        }
+        indexes[key] = [
+            [
+                row[2].lower()
+                for row in dbapi_connection.execute(f'PRAGMA index_info("{index[1]}")')
+                if row[2] is not None
+            ]
+            for index in dbapi_connection.execute(f'PRAGMA index_list("{table}")')
+        ]
+    return TableStats(
+        row_counts=row_counts,
+        columns_by_table=columns_by_table,
+        indexes=indexes,
+    )
+
+
+def get_table_aliases(tokens: list[Token]) -> dict[str, str]:
+    """
+    Lower case alias -> lower case table name of the tables in the FROM and
+    JOIN clauses, a table is also its own alias.
+    """
+    aliases = dict()
+    for ith, token in enumerate(tokens[:-1]):
+        is_table_position = token.is_keyword("from", "join") or (
+            token.text == ","
+            and any(t.is_keyword("from") for t in tokens[:ith])
+            and not any(
+                t.is_keyword("where", "group", "order", "having", "limit")
+                for t in tokens[:ith]
+            )
+        )
+        table_token = tokens[ith + 1]
+        if not is_table_position or not table_token.is_identifier:
+            continue
+        table = table_token.value
+        aliases.setdefault(table, table)
+        rest = tokens[ith + 2 : ith + 4]
+        if rest and rest[0].is_keyword("as"):
+            rest = rest[1:]
+        if rest and rest[0].kind in ("word", "quoted") and not rest[0].is_keyword(
+            "join", "inner", "left", "cross", "natural", "on", "using", "where",
+            "group", "order", "having", "limit", "union", "full", "right", "outer",
+        ):
+            aliases[rest[0].value] = table
+    return aliases
+
+
+@dataclasses.dataclass
+class PlanStep:
+    id: int
+    parent: int
+    detail: str
+
+
+def explain_query_plan(
+    connection: "sa.Connection",
+    sql: str,
+    params: T.Optional[dict[str, T.Any]] = None,
+) -> list[PlanStep]:
+    import sqlalchemy as sa
+
+    result = connection.execute(sa.text(f"EXPLAIN QUERY PLAN {sql}"), params)
+    return [
+        PlanStep(id=row[0], parent=row[1], detail=row[3]) for row in result.fetchall()
+    ]
+
+
+@dataclasses.dataclass
+class FullScan:
+    """
+    :param table: lower case table name.
+    :param alias: the name the plan uses for the table.
+    :param n_rows: number of rows of the table.
+    """
+
+    table: str
+    alias: str
+    n_rows: int
+
+
+#: functions that make a statement read every row it selects
+AGGREGATE_FUNCTIONS = {"count", "sum", "total", "avg", "min", "max", "group_concat"}
+
+
+def is_unfiltered_aggregate(tokens: list[Token]) -> bool:
+    """
+    Whether a statement aggregates its tables, with a GROUP BY or an
+    aggregate function, without any WHERE clause. It needs every row, a
+    full scan is then expected rather than a mistake.
+    """
+    is_aggregate = False
+    for ith, token in enumerate(tokens):
+        if token.is_keyword("where"):
+            return False
+        if token.is_keyword("group") or (
+            token.is_keyword(*AGGREGATE_FUNCTIONS)
+            and ith + 1 < len(tokens)
+            and tokens[ith + 1].text == "("
+        ):
+            is_aggregate = True
+    return is_aggregate
+
+
+@dataclasses.dataclass
+class PlanCheck:
+    """
+    :param full_scans: the large tables the plan scans without an index,
+        recorded by the :class:`QueryAdvisor` even when expected.
+    :param expected: the statement needs every row anyway, see
+        :func:`is_unfiltered_aggregate`, the scans aren't worth a warning.
+    """
+
+    steps: list[PlanStep]
+    full_scans: list[FullScan]
+    expected: bool = False
+
+    @property
+    def is_ok(self) -> bool:
+        return len(self.full_scans) == 0 or self.expected
+
+    def format_warning(self) -> str:
+        tables = ", ".join(
+            f"{scan.table} ({scan.n_rows} rows)" for scan in self.full_scans
+        )
+        plan = "\n".join(f"- {step.detail}" for step in self.steps)
+        return (
+            f"The query plan scans every row of {tables}. Filter on indexed "
+            f"columns (primary / foreign keys) or aggregate less data.\n"
+            f"Query plan:\n{plan}"
+        )
+
+
+def check_query_plan(
+    steps: list[PlanStep],
+    sql: str,
+    row_counts: dict[str, int],
+    min_rows: int,
+) -> PlanCheck:
+    """
+    Flag the ``SCAN <table>`` steps, without any index, of tables with at
+    least ``min_rows`` rows. Scans of a covering index, of a sub query or of
+    an unknown table are not flagged, the scans of an aggregate over whole
+    tables are flagged as expected.
+    """
+    tokens = tokenize(sql)
+    aliases = get_table_aliases(tokens)
+    full_scans = []
+    for step in steps:
+        words = step.detail.split()
+        if len(words) < 2 or words[0] != "SCAN" or "USING" in words:
+            continue
+        # "SCAN il" since SQLite 3.36, "SCAN TABLE InvoiceLine AS il" before
+        if words[1] == "TABLE" and len(words) >= 3:
+            name = words[-1] if "AS" in words else words[2]
+        else:
+            name = words[1]
+        table = aliases.get(name.lower(), name.lower())
+        n_rows = row_counts.get(table)
+        if n_rows is not None and n_rows >= min_rows:
+            full_scans.append(FullScan(table=table, alias=name, n_rows=n_rows))
+    return PlanCheck(
+        steps=steps,
+        full_scans=full_scans,
+        expected=is_unfiltered_aggregate(tokens),
+    )
+
+
+def fingerprint_sql(sql: str) -> str:
+    """
+    Shape of a statement: literals replaced by ``?``, identifiers and
+    keywords lower cased, whitespace and comments dropped. Statements that
+    only differ by the values they filter on get the same fingerprint.
+    """
+    parts = []
+    for token in tokenize(sql):
+        if token.kind in ("string", "number"):
+            parts.append("?")
+        elif token.kind in ("word", "quoted"):
+            parts.append(token.value)
+        elif token.text != ";":
+            parts.append(token.text)
+    return " ".join(parts)
+
+
+@dataclasses.dataclass
+class ColumnUsage:
+    """
+    How a statement uses the columns of one table, in index key order.
+    """
+
+    equality: list[str] = dataclasses.field(default_factory=list)
+    range: list[str] = dataclasses.field(default_factory=list)
+    join: list[str] = dataclasses.field(default_factory=list)
+    ordering: list[str] = dataclasses.field(default_factory=list)
+    other: list[str] = dataclasses.field(default_factory=list)
+
+    def add(self, kind: str, column: str):
+        columns = getattr(self, kind)
+        if column not in columns:
+            columns.append(column)
+
+
+def get_column_usage(
+    sql: str,
+    columns_by_table: dict[str, set[str]],
+) -> dict[str, ColumnUsage]:
+    """
+    Columns of each table the statement filters, joins, groups, sorts on or
+    just reads.
+    """
+    tokens = tokenize(sql)
+    aliases = get_table_aliases(tokens)
+    tables = set(aliases.values())
+    usage: dict[str, ColumnUsage] = dict()
+    clause = None
+    ith = 0
+    while ith < len(tokens):
+        token = tokens[ith]
+        if token.is_keyword("select", "from", "where", "having", "on", "limit"):
+            clause = token.value
+        elif token.is_keyword("group", "order"):
+            clause = "ordering"
+        reference = None
+        if (
+            token.is_identifier
+            and ith + 2 < len(tokens)
+            and tokens[ith + 1].text == "."
+            and token.value in aliases
+        ):
+            reference = (aliases[token.value], tokens[ith + 2].value)
+            end = ith + 3
+        elif token.is_identifier and not (
+            ith + 1 < len(tokens) and tokens[ith + 1].text in ("(", ".")
+        ):
+            owners = [
+                table
+                for table in tables
+                if token.value in columns_by_table.get(table, set())
+            ]
+            if len(owners) == 1:
+                reference = (owners[0], token.value)
+            end = ith + 1
+        if reference is None or reference[1] not in columns_by_table.get(
+            reference[0], set()
+        ):
+            ith += 1
+            continue
+        previous = tokens[ith - 1] if ith > 0 else None
+        following = tokens[end] if end < len(tokens) else None
+        if clause == "on":
+            kind = "join"
+        elif clause in ("where", "having"):
+            if (following is not None and (
+                following.text == "=" or following.is_keyword("in", "is")
+            )) or (previous is not None and previous.text == "="):
+                kind = "equality"
+            elif (following is not None and (
+                following.text in ("<", ">", "<=", ">=")
+                or following.is_keyword("between", "like", "glob")
+            )) or (previous is not None and previous.text in ("<", ">", "<=", ">=")):
+                kind = "range"
+            else:
+                kind = "other"
+        elif clause == "ordering":
+            kind = "ordering"
+        else:
+            kind = "other"
+        usage.setdefault(reference[0], ColumnUsage()).add(kind, reference[1])
+        ith = end
+    return usage
+
+
+@dataclasses.dataclass
+class IndexProposal:
+    """
+    :param table: lower case table name.
+    :param columns: index columns, in key order.
+    :param seconds: total duration of the slow statements it would help.
+    :param fingerprints: shapes of these statements.
+    """
+
+    table: str
+    columns: list[str]
+    seconds: float = dataclasses.field(default=0.0)
+    fingerprints: list[str] = dataclasses.field(default_factory=list)
+
+    @property
+    def name(self) -> str:
+        return f"ix_advisor_{self.table}_{'_'.join(self.columns)}"
+
+    @property
+    def ddl(self) -> str:
+        columns = ", ".join(f'"{column}"' for column in self.columns)
+        return f'CREATE INDEX IF NOT EXISTS "{self.name}" ON "{self.table}" ({columns})'
+
+
+#: max number of columns of a proposed index
+MAX_INDEX_COLUMNS = 6
+
+
+def propose_index(
+    table: str,
+    usage: ColumnUsage,
+    table_stats: TableStats,
+) -> T.Optional[IndexProposal]:
+    """
+    Covering index for one table: equality columns, then the first range
+    column, then join columns, then grouping / sorting columns, then the
+    columns only read.
+    If that is too wide, only the key columns are kept. None if an existing
+    index already starts with these columns.
+    """
+    keys = list(usage.equality)
+    keys.extend(c for c in usage.range[:1] if c not in keys)
+    keys.extend(c for c in usage.join if c not in keys)
+    keys.extend(c for c in usage.ordering if c not in keys)
+    columns = keys + [
+        c for c in usage.range[1:] + usage.other if c not in keys
+    ]
+    columns = list(dict.fromkeys(columns))
+    if len(columns) > MAX_INDEX_COLUMNS:
+        columns = keys[:MAX_INDEX_COLUMNS]
+    if not columns:
+        return None
+    all_columns = table_stats.columns_by_table.get(table, set())
+    if not keys and len(columns) >= len(all_columns):
+        # scanning such an index is no cheaper than scanning the table
+        return None
+    for index_columns in table_stats.indexes.get(table, []):
+        if index_columns[: len(columns)] == columns:
+            return None
+    return IndexProposal(table=table, columns=columns)
+
+
+@dataclasses.dataclass
+class SlowQuery:
+    """
+    Statistics of one slow statement shape.
+
+    :param sql: the last statement seen with this shape.
+    :param scanned_tables: tables the plan fully scans.
+    """
+
+    fingerprint: str
+    sql: str
+    count: int = dataclasses.field(default=0)
+    total_seconds: float = dataclasses.field(default=0.0)
+    max_seconds: float = dataclasses.field(default=0.0)
+    scanned_tables: set[str] = dataclasses.field(default_factory=set)
+
+
+class QueryAdvisor:
+    """
+    Records the statements slower than ``slow_seconds``, grouped by shape.
+
+    :param slow_seconds: statements faster than that are ignored.
+    :param max_shapes: max number of shapes kept, the ones with the lowest
+        total duration are dropped first.
+    """
+
+    def __init__(
+        self,
+        slow_seconds: float,
+        max_shapes: int = 256,
+    ):
+        self.slow_seconds = slow_seconds
+        self.max_shapes = max_shapes
+        self.slow_queries: dict[str, SlowQuery] = dict()
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        sql: str,
+        seconds: float,
+        full_scans: T.Iterable[FullScan] = (),
+    ):
+        if seconds < self.slow_seconds:
+            return
+        fingerprint = fingerprint_sql(sql)
+        with self._lock:
+            slow_query = self.slow_queries.get(fingerprint)
+            if slow_query is None:
+                if len(self.slow_queries) >= self.max_shapes:
+                    smallest = min(
+                        self.slow_queries.values(), key=lambda q: q.total_seconds
+                    )
+                    del self.slow_queries[smallest.fingerprint]
+                slow_query = SlowQuery(fingerprint=fingerprint, sql=sql)
+                self.slow_queries[fingerprint] = slow_query
+            slow_query.sql = sql
+            slow_query.count += 1
+            slow_query.total_seconds += seconds
+            slow_query.max_seconds = max(slow_query.max_seconds, seconds)
+            slow_query.scanned_tables.update(scan.table for scan in full_scans)
+
+    def top(self, n: int = 10) -> list[SlowQuery]:
+        """
+        The shapes that take the most time in total.
+        """
+        with self._lock:
+            slow_queries = list(self.slow_queries.values())
+        return sorted(slow_queries, key=lambda q: q.total_seconds, reverse=True)[:n]
+
+    def propose_indexes(
+        self,
+        table_stats: TableStats,
+    ) -> list[IndexProposal]:
+        """
+        Covering indexes for the tables the slow statements scan, the most
+        time saving first.
+        """
+        proposals: dict[tuple[str, tuple[str, ...]], IndexProposal] = dict()
+        for slow_query in self.top(self.max_shapes):
+            usage_by_table = get_column_usage(
+                slow_query.sql, table_stats.columns_by_table
+            )
+            for table in slow_query.scanned_tables:
+                usage = usage_by_table.get(table)
+                if usage is None:
+                    continue
+                proposal = propose_index(table, usage, table_stats)
+                if proposal is None:
+                    continue
+                key = (proposal.table, tuple(proposal.columns))
+                proposal = proposals.setdefault(key, proposal)
+                proposal.seconds += slow_query.total_seconds
+                proposal.fingerprints.append(slow_query.fingerprint)
+        return sorted(proposals.values(), key=lambda p: p.seconds, reverse=True)
+
+
+def create_indexed_copy(
+    path_src: Path,
+    path_dst: Path,
+    proposals: list[IndexProposal],
+) -> Path:
+    """
+    Copy the database to ``path_dst`` (overwritten), create the proposed
+    indexes in the copy and refresh its planner statistics.
+    """
+    path_dst.parent.mkdir(parents=True, exist_ok=True)
+    path_dst.unlink(missing_ok=True)
+    src = sqlite3.connect(f"{path_src.absolute().as_uri()}?mode=ro", uri=True)
+    dst = sqlite3.connect(path_dst)
+    try:
+        src.backup(dst)
+        for proposal in proposals:
+            dst.execute(proposal.ddl)
+        dst.execute("ANALYZE")
+        dst.commit()
+    finally:
+        src.close()
+        dst.close()
+    return path_dst
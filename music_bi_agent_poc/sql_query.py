@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+"""
+Helpers around the SELECT statements the SQL agent runs.
+"""
+
+import typing as T
+import re
+import json
+
+_token_pattern = re.compile(
+    r"""
+    (?P<string>'(?:[^']|'')*')          # 'string literal'
+    | (?P<quoted>"(?:[^"]|"")*"         # "quoted identifier"
+        | `[^`]*`                        # `quoted identifier`
+        | \[[^\]]*\])                    # [quoted identifier]
+    | (?P<line_comment>--[^\n]*)
+    | (?P<block_comment>/\*.*?(?:\*/|$))
+    | (?P<space>\s+)
+    | (?P<other>[^'"`\[\s/-]+|[/-])
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+_no_space_after = {"(", ","}
+_no_space_before = {")", ","}
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Normalize a SQL statement so that statements that only differ by
+    whitespace, comments or a trailing semicolon are equal. String literals
+    and quoted identifiers are kept as they are, and the case is not changed
+    because it shows up in the result column names.
+    """
+    parts: list[str] = []
+    pending_space = False
+    for match in _token_pattern.finditer(sql):
+        kind = match.lastgroup
+        if kind in ("space", "line_comment", "block_comment"):
+            pending_space = True
+            continue
+        token = match.group()
+        if kind == "other":
+            # split punctuation so that "( a" and "(a" are equal
+            pieces = [piece for piece in re.split(r"([(),])", token) if piece]
+        else:
+            pieces = [token]
+        for piece in pieces:
+            if (
+                pending_space
+                and parts
+                and parts[-1] not in _no_space_after
+                and piece not in _no_space_before
+            ):
+                parts.append(" ")
+            parts.append(piece)
+            pending_space = False
+    normalized = "".join(parts).strip()
+    while normalized.endswith(";"):
+        normalized = normalized[:-1].rstrip()
+    return normalized
+
+
+def make_params_key(params: T.Optional[dict[str, T.Any]]) -> str:
+    """
+    Hashable, order independent representation of bound parameters.
+    """
+    if not params:
+        return ""
+    return json.dumps(params, sort_keys=True, default=str)
+
+
+def is_error_result(result: str) -> bool:
+    """
+    Whether the output of ``execute_select_statement`` is an error message,
+    errors are never cached.
+    """
+    return result.startswith("Error") or "# Query Result\nError" in result
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+"""
+Helpers to cache database schema introspection and to build the compact
+schema digest injected into the SQL agent system prompt.
+"""
+
+import typing as T
+import os
+from pathlib import Path
+from urllib.parse import unquote
+
+
+def get_sqlite_path(url: str) -> T.Optional[Path]:
+    """
+    Get the database file path of a ``sqlite:///path`` or
+    ``sqlite:///file:path?...&uri=true`` SQLAlchemy url, None for an
+    in-memory database or another dialect.
+    """
+    prefix = "sqlite:///"
+    if not url.startswith(prefix):
+        return None
+    path = url[len(prefix) :].split("?", 1)[0]
+    if path.startswith("file:"):
+        path = unquote(path[len("file:") :])
+    if not path or path == ":memory:":
+        return None
+    return Path(path)
+
+
+def get_file_version(path: Path) -> T.Optional[tuple[int, ...]]:
+    """
+    A token that changes whenever a SQLite database file changes: mtime and
+    size of the file and of its write ahead log if any. None if the file
+    doesn't exist.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    version = (stat.st_mtime_ns, stat.st_size)
+    try:
+        wal_stat = os.stat(f"{path}-wal")
+    except FileNotFoundError:
+        return version
+    return version + (wal_stat.st_mtime_ns, wal_stat.st_size)
+
+
+def make_schema_digest(schema_details: str) -> str:
+    """
+    Collapse the output of ``get_schema_details`` to one line per table::
+
+        Schema default(
+          Table Album(
+            AlbumId:int*PK,
+            Title:str*NN,
+          )
+        )
+
+    becomes::
+
+        Table Album(AlbumId:int*PK, Title:str*NN)
+    """
+    lines = []
+    columns = None
+    for line in schema_details.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            continue
+        if columns is None:
+            # "Table Album(" or "View AlbumSalesStats(", but not "Schema default("
+            if stripped.endswith("(") and not stripped.startswith("Schema "):
+                header = stripped[:-1]
+                columns = []
+        elif stripped == ")":
+            lines.append(f"{header}({', '.join(columns)})")
+            columns = None
+        else:
+            columns.append(stripped.rstrip(","))
+    return "\n".join(lines)
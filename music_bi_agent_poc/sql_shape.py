@@ -0,0 +1,434 @@
+# -*- coding: utf-8 -*-
+
+"""
+Parse the shape of simple aggregate SELECT statements::
+
+    SELECT <expr> [AS alias], ...
+    FROM <table> [alias] [[INNER] JOIN <table> [alias] ON a.x = b.y] ...
+    [GROUP BY <expr>, ...]
+    [ORDER BY <expr> [ASC|DESC], ...]
+    [LIMIT <n>]
+
+Expressions are turned into canonical strings: lower case, with table
+aliases resolved to table names, so two statements that only differ by
+aliases, case or whitespace get the same shape. Anything outside this
+subset (WHERE, HAVING, sub queries, outer joins, ...) is rejected, the
+caller then runs the statement against the database as usual.
+"""
+
+import typing as T
+import re
+import dataclasses
+
+_token_pattern = re.compile(
+    r"""
+    (?P<string>'(?:[^']|'')*')
+    | (?P<quoted>"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])
+    | (?P<comment>--[^\n]*|/\*.*?(?:\*/|$))
+    | (?P<space>\s+)
+    | (?P<number>\d+(?:\.\d+)?)
+    | (?P<word>[A-Za-z_][A-Za-z0-9_]*)
+    | (?P<punct>[.,()*;])
+    | (?P<operator>[<>=!+\-/%|]+)
+    | (?P<other>.)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+#: keywords that can appear in the FROM clause
+_from_keywords = {
+    "join",
+    "inner",
+    "left",
+    "right",
+    "full",
+    "outer",
+    "cross",
+    "natural",
+    "on",
+    "using",
+}
+_clause_keywords = _from_keywords | {
+    "select",
+    "from",
+    "where",
+    "group",
+    "having",
+    "order",
+    "limit",
+    "offset",
+    "union",
+    "intersect",
+    "except",
+    "window",
+    "with",
+    "values",
+}
+
+
+@dataclasses.dataclass
+class Token:
+    kind: str
+    text: str
+    start: int
+    end: int
+
+    @property
+    def is_identifier(self) -> bool:
+        return self.kind in ("word", "quoted")
+
+    @property
+    def value(self) -> str:
+        """
+        Identifier without quotes, lower case.
+        """
+        if self.kind == "quoted":
+            return self.text[1:-1].lower()
+        return self.text.lower()
+
+    def is_keyword(self, *keywords: str) -> bool:
+        return self.kind == "word" and self.text.lower() in keywords
+
+
+def tokenize(sql: str) -> list[Token]:
+    tokens = []
+    for match in _token_pattern.finditer(sql):
+        if match.lastgroup in ("space", "comment"):
+            continue
+        tokens.append(Token(match.lastgroup, match.group(), match.start(), match.end()))
+    return tokens
+
+
+@dataclasses.dataclass
+class SelectItem:
+    """
+    :param expr: canonical expression.
+    :param name: result column name, as SQLite reports it.
+    """
+
+    expr: str
+    name: str
+
+
+@dataclasses.dataclass
+class OrderItem:
+    expr: str
+    descending: bool = dataclasses.field(default=False)
+
+
+@dataclasses.dataclass
+class AggregateQuery:
+    """
+    :param tables: table names (lower case) in FROM / JOIN order.
+    :param joins: for each joined table, the pair of canonical
+        ``table.column`` of its ``ON a.x = b.y`` condition.
+    """
+
+    select: list[SelectItem]
+    tables: list[str]
+    joins: list[tuple[str, str]]
+    group_by: list[str]
+    order_by: list[OrderItem]
+    limit: T.Optional[int] = dataclasses.field(default=None)
+
+
+class _Unsupported(Exception):
+    pass
+
+
+def _split_top_level(tokens: list[Token], separator: str = ",") -> list[list[Token]]:
+    parts = [[]]
+    depth = 0
+    for token in tokens:
+        if token.text == "(":
+            depth += 1
+        elif token.text == ")":
+            depth -= 1
+        if depth == 0 and token.text == separator:
+            parts.append([])
+        else:
+            parts[-1].append(token)
+    return parts
+
+
+def _find_top_level(tokens: list[Token], start: int, *keywords: str) -> int:
+    depth = 0
+    for ith in range(start, len(tokens)):
+        token = tokens[ith]
+        if token.text == "(":
+            depth += 1
+        elif token.text == ")":
+            depth -= 1
+        elif depth == 0 and token.is_keyword(*keywords):
+            return ith
+    return len(tokens)
+
+
+class _Parser:
+    def __init__(
+        self,
+        sql: str,
+        columns_by_table: dict[str, set[str]],
+    ):
+        self.sql = sql
+        self.columns_by_table = columns_by_table
+        self.aliases: dict[str, str] = dict()
+        self.tables: list[str] = []
+
+    def resolve_column(self, column: str) -> str:
+        candidates = [
+            table
+            for table in self.tables
+            if column in self.columns_by_table.get(table, set())
+        ]
+        if len(candidates) != 1:
+            raise _Unsupported(f"ambiguous or unknown column {column!r}")
+        return f"{candidates[0]}.{column}"
+
+    def canonical(self, tokens: list[Token]) -> str:
+        """
+        Canonical string of an expression.
+        """
+        if not tokens:
+            raise _Unsupported("empty expression")
+        parts = []
+        ith = 0
+        while ith < len(tokens):
+            token = tokens[ith]
+            if token.is_keyword("select"):
+                raise _Unsupported("sub query")
+            nxt = tokens[ith + 1] if ith + 1 < len(tokens) else None
+            if token.is_identifier and nxt is not None and nxt.text == ".":
+                if ith + 2 >= len(tokens) or not tokens[ith + 2].is_identifier:
+                    raise _Unsupported("bad column reference")
+                qualifier = token.value
+                if qualifier not in self.aliases:
+                    raise _Unsupported(f"unknown table {qualifier!r}")
+                parts.append(f"{self.aliases[qualifier]}.{tokens[ith + 2].value}")
+                ith += 3
+                continue
+            if token.kind == "word" and nxt is not None and nxt.text == "(":
+                parts.append(token.value)  # function name
+            elif token.kind == "word" and token.value in ("distinct", "as"):
+                parts.append(token.value)
+            elif token.is_identifier:
+                parts.append(self.resolve_column(token.value))
+            else:
+                parts.append(token.text)
+            ith += 1
+        return " ".join(parts)
+
+    def parse_from(self, tokens: list[Token]) -> list[tuple[str, str]]:
+        """
+        Parse ``<table> [alias] [[INNER] JOIN <table> [alias] ON a.x = b.y]...``
+        """
+        joins = []
+        ith = 0
+
+        def read_table():
+            nonlocal ith
+            if ith >= len(tokens) or not tokens[ith].is_identifier:
+                raise _Unsupported("expect a table")
+            if tokens[ith].is_keyword(*_clause_keywords):
+                raise _Unsupported("expect a table")
+            table = tokens[ith].value
+            ith += 1
+            if ith < len(tokens) and tokens[ith].text == ".":
+                raise _Unsupported("schema qualified table")
+            alias = table
+            if ith < len(tokens) and tokens[ith].is_keyword("as"):
+                ith += 1
+            if (
+                ith < len(tokens)
+                and tokens[ith].is_identifier
+                and not tokens[ith].is_keyword(*_clause_keywords)
+            ):
+                alias = tokens[ith].value
+                ith += 1
+            if table in self.tables or alias in self.aliases:
+                raise _Unsupported("self join")
+            self.tables.append(table)
+            self.aliases[alias] = table
+            # a table can always be referenced by its own name
+            self.aliases.setdefault(table, table)
+
+        read_table()
+        while ith < len(tokens):
+            if tokens[ith].is_keyword("inner"):
+                ith += 1
+            if ith >= len(tokens) or not tokens[ith].is_keyword("join"):
+                raise _Unsupported("only inner joins are supported")
+            ith += 1
+            read_table()
+            if ith >= len(tokens) or not tokens[ith].is_keyword("on"):
+                raise _Unsupported("expect ON")
+            condition = tokens[ith + 1 : ith + 8]
+            if (
+                len(condition) != 7
+                or [token.text for token in condition[1::2]] != [".", "=", "."]
+            ):
+                raise _Unsupported("only a.x = b.y join conditions are supported")
+            left = self.canonical(condition[0:3])
+            right = self.canonical(condition[4:7])
+            joins.append((left, right))
+            ith += 8
+        return joins
+
+    def parse(self) -> AggregateQuery:
+        tokens = tokenize(self.sql)
+        while tokens and tokens[-1].text == ";":
+            tokens.pop()
+        if any(token.text == ";" for token in tokens):
+            raise _Unsupported("multiple statements")
+        if not tokens or not tokens[0].is_keyword("select"):
+            raise _Unsupported("not a SELECT")
+        if len(tokens) > 1 and tokens[1].is_keyword("distinct", "all"):
+            raise _Unsupported("SELECT DISTINCT")
+        # e.g. bound parameters like ":name" or "?"
+        if any(token.kind == "other" for token in tokens):
+            raise _Unsupported("unexpected character")
+
+        i_from = _find_top_level(tokens, 1, "from")
+        if i_from >= len(tokens):
+            raise _Unsupported("no FROM")
+        i_end_from = _find_top_level(
+            tokens, i_from + 1, *(_clause_keywords - _from_keywords)
+        )
+        joins = self.parse_from(tokens[i_from + 1 : i_end_from])
+
+        select = []
+        for item_tokens in _split_top_level(tokens[1:i_from]):
+            alias = None
+            if len(item_tokens) >= 2 and item_tokens[-1].is_identifier:
+                if item_tokens[-2].is_keyword("as"):
+                    alias = item_tokens[-1]
+                    item_tokens = item_tokens[:-2]
+                elif item_tokens[-2].text not in (".", "(", ","):
+                    alias = item_tokens[-1]
+                    item_tokens = item_tokens[:-1]
+            if item_tokens and item_tokens[-1].text == "*":
+                raise _Unsupported("SELECT *")
+            expr = self.canonical(item_tokens)
+            if alias is not None:
+                name = alias.text[1:-1] if alias.kind == "quoted" else alias.text
+            elif item_tokens[-1].is_identifier and (
+                len(item_tokens) == 1 or item_tokens[-2].text == "."
+            ):
+                last = item_tokens[-1]
+                name = last.text[1:-1] if last.kind == "quoted" else last.text
+            else:
+                name = self.sql[item_tokens[0].start : item_tokens[-1].end]
+            select.append(SelectItem(expr=expr, name=name))
+
+        group_by: list[str] = []
+        order_by: list[OrderItem] = []
+        limit = None
+        ith = i_end_from
+        while ith < len(tokens):
+            token = tokens[ith]
+            if token.is_keyword("group", "order"):
+                if ith + 1 >= len(tokens) or not tokens[ith + 1].is_keyword("by"):
+                    raise _Unsupported("expect BY")
+                i_next = _find_top_level(tokens, ith + 2, *_clause_keywords)
+                items = _split_top_level(tokens[ith + 2 : i_next])
+                if token.is_keyword("group"):
+                    if group_by:
+                        raise _Unsupported("duplicate GROUP BY")
+                    group_by = [
+                        self.resolve_item(item, select, prefer_column=True)
+                        for item in items
+                    ]
+                else:
+                    if order_by:
+                        raise _Unsupported("duplicate ORDER BY")
+                    for item in items:
+                        descending = False
+                        if item and item[-1].is_keyword("asc", "desc"):
+                            descending = item[-1].is_keyword("desc")
+                            item = item[:-1]
+                        order_by.append(
+                            OrderItem(
+                                expr=self.resolve_item(
+                                    item, select, prefer_column=False
+                                ),
+                                descending=descending,
+                            )
+                        )
+                ith = i_next
+            elif token.is_keyword("limit"):
+                rest = tokens[ith + 1 :]
+                if len(rest) != 1 or rest[0].kind != "number" or "." in rest[0].text:
+                    raise _Unsupported("only LIMIT <integer> is supported")
+                limit = int(rest[0].text)
+                ith = len(tokens)
+            else:
+                raise _Unsupported(f"unsupported clause {token.text!r}")
+
+        return AggregateQuery(
+            select=select,
+            tables=list(self.tables),
+            joins=joins,
+            group_by=group_by,
+            order_by=order_by,
+            limit=limit,
+        )
+
+    def resolve_item(
+        self,
+        tokens: list[Token],
+        select: list[SelectItem],
+        prefer_column: bool,
+    ) -> str:
+        """
+        Resolve a GROUP BY / ORDER BY term, which can also be an ordinal or
+        the alias of a select item.
+        """
+        if len(tokens) == 1:
+            token = tokens[0]
+            if token.kind == "number":
+                ordinal = int(token.text)
+                if not (1 <= ordinal <= len(select)) or "." in token.text:
+                    raise _Unsupported("bad ordinal")
+                return select[ordinal - 1].expr
+            if token.is_identifier:
+                by_alias = [item for item in select if item.name.lower() == token.value]
+                is_column = any(
+                    token.value in self.columns_by_table.get(table, set())
+                    for table in self.tables
+                )
+                if by_alias and not (prefer_column and is_column):
+                    return by_alias[0].expr
+        return self.canonical(tokens)
+
+
+def parse_aggregate_query(
+    sql: str,
+    columns_by_table: dict[str, set[str]],
+) -> T.Optional[AggregateQuery]:
+    """
+    Parse a SELECT statement in the supported subset.
+
+    :param columns_by_table: lower case column names of each lower case table
+        name, used to resolve unqualified column references.
+
+    :return: None if the statement is outside the supported subset.
+    """
+    try:
+        return _Parser(sql, columns_by_table).parse()
+    except (_Unsupported, IndexError, ValueError):
+        return None
+
+
+def canonical_expression(
+    expr: str,
+    columns_by_table: dict[str, set[str]],
+) -> str:
+    """
+    Canonical string of an expression written with full table names, used to
+    declare the expressions a caller knows how to answer.
+    """
+    parser = _Parser(expr, columns_by_table)
+    for table in columns_by_table:
+        parser.aliases[table] = table
+        parser.tables.append(table)
+    return parser.canonical(tokenize(expr))
@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+
+"""
+Vetted SQL statements for the most common Chinook BI questions (top N
+artists / tracks / albums / customers by revenue, genre performance, sales by
+country, monthly and yearly trends), so they are answered without any SQL
+agent LLM call.
+
+A question is matched by a strict keyword classifier: it must name exactly
+one template dimension, a sales measure, and nothing else than a top N limit
+and a year. Any other word, e.g. a filter like "in USA" or "of the Rock
+genre", means the template can't honour the question, it is then left to the
+SQL agent.
+"""
+
+import typing as T
+import re
+import dataclasses
+
+_filter_by_year = "(:year IS NULL OR strftime('%Y', i.InvoiceDate) = :year)"
+
+
+@dataclasses.dataclass(frozen=True)
+class SqlTemplate:
+    """
+    :param name: template name.
+    :param description: what the result contains.
+    :param sql: the vetted SELECT statement, with the ``:limit`` and ``:year``
+        bind parameters.
+    :param words: words of a question that select this template.
+    :param ranking: whether the rows are ranked by revenue, only then a top N
+        limit makes sense.
+    :param default_limit: number of rows when the question doesn't say, -1
+        means all rows.
+    """
+
+    name: str
+    description: str
+    sql: str
+    words: tuple[str, ...]
+    ranking: bool = dataclasses.field(default=True)
+    default_limit: int = dataclasses.field(default=10)
+
+
+TEMPLATES = [
+    SqlTemplate(
+        name="top_artists_by_revenue",
+        description="artists ranked by revenue, with the number of tracks sold",
+        sql=f"""
+SELECT ar.Name AS Artist,
+       SUM(il.Quantity) AS UnitsSold,
+       ROUND(SUM(il.UnitPrice * il.Quantity), 2) AS Revenue
+FROM Artist ar
+JOIN Album al ON ar.ArtistId = al.ArtistId
+JOIN Track t ON al.AlbumId = t.AlbumId
+JOIN InvoiceLine il ON t.TrackId = il.TrackId
+JOIN Invoice i ON il.InvoiceId = i.InvoiceId
+WHERE {_filter_by_year}
+GROUP BY ar.ArtistId, ar.Name
+ORDER BY Revenue DESC, Artist
+LIMIT :limit
+""".strip(),
+        words=("artist", "artists", "band", "bands", "musician", "musicians"),
+    ),
+    SqlTemplate(
+        name="top_tracks_by_revenue",
+        description="tracks ranked by revenue, with their artist and the number of units sold",
+        sql=f"""
+SELECT t.Name AS Track,
+       ar.Name AS Artist,
+       SUM(il.Quantity) AS UnitsSold,
+       ROUND(SUM(il.UnitPrice * il.Quantity), 2) AS Revenue
+FROM Track t
+LEFT JOIN Album al ON t.AlbumId = al.AlbumId
+LEFT JOIN Artist ar ON al.ArtistId = ar.ArtistId
+JOIN InvoiceLine il ON t.TrackId = il.TrackId
+JOIN Invoice i ON il.InvoiceId = i.InvoiceId
+WHERE {_filter_by_year}
+GROUP BY t.TrackId, t.Name, ar.Name
+ORDER BY Revenue DESC, UnitsSold DESC, Track
+LIMIT :limit
+""".strip(),
+        words=("track", "tracks", "song", "songs"),
+    ),
+    SqlTemplate(
+        name="top_albums_by_revenue",
+        description="albums ranked by revenue, with their artist and the number of tracks sold",
+        sql=f"""
+SELECT al.Title AS Album,
+       ar.Name AS Artist,
+       SUM(il.Quantity) AS UnitsSold,
+       ROUND(SUM(il.UnitPrice * il.Quantity), 2) AS Revenue
+FROM Album al
+JOIN Artist ar ON al.ArtistId = ar.ArtistId
+JOIN Track t ON al.AlbumId = t.AlbumId
+JOIN InvoiceLine il ON t.TrackId = il.TrackId
+JOIN Invoice i ON il.InvoiceId = i.InvoiceId
+WHERE {_filter_by_year}
+GROUP BY al.AlbumId, al.Title, ar.Name
+ORDER BY Revenue DESC, Album
+LIMIT :limit
+""".strip(),
+        words=("album", "albums", "record", "records"),
+    ),
+    SqlTemplate(
+        name="top_customers_by_revenue",
+        description="customers ranked by total spending, with their country and number of invoices",
+        sql=f"""
+SELECT c.FirstName || ' ' || c.LastName AS Customer,
+       c.Country AS Country,
+       COUNT(i.InvoiceId) AS Invoices,
+       ROUND(SUM(i.Total), 2) AS Revenue
+FROM Customer c
+JOIN Invoice i ON c.CustomerId = i.CustomerId
+WHERE {_filter_by_year}
+GROUP BY c.CustomerId, c.FirstName, c.LastName, c.Country
+ORDER BY Revenue DESC, Customer
+LIMIT :limit
+""".strip(),
+        words=("customer", "customers", "client", "clients", "buyer", "buyers"),
+    ),
+    SqlTemplate(
+        name="genre_performance",
+        description="genres ranked by revenue, with their number of transactions and average track price",
+        sql=f"""
+SELECT g.Name AS Genre,
+       COUNT(DISTINCT il.InvoiceId) AS Transactions,
+       SUM(il.Quantity) AS UnitsSold,
+       ROUND(SUM(il.UnitPrice * il.Quantity), 2) AS Revenue,
+       ROUND(AVG(il.UnitPrice), 2) AS AvgPrice
+FROM Genre g
+JOIN Track t ON g.GenreId = t.GenreId
+JOIN InvoiceLine il ON t.TrackId = il.TrackId
+JOIN Invoice i ON il.InvoiceId = i.InvoiceId
+WHERE {_filter_by_year}
+GROUP BY g.GenreId, g.Name
+ORDER BY Revenue DESC, Genre
+LIMIT :limit
+""".strip(),
+        words=("genre", "genres", "category", "categories", "style", "styles"),
+        default_limit=-1,
+    ),
+    SqlTemplate(
+        name="sales_by_country",
+        description="billing countries ranked by revenue, with their number of customers and invoices",
+        sql=f"""
+SELECT i.BillingCountry AS Country,
+       COUNT(DISTINCT i.CustomerId) AS Customers,
+       COUNT(i.InvoiceId) AS Invoices,
+       ROUND(SUM(i.Total), 2) AS Revenue
+FROM Invoice i
+WHERE {_filter_by_year}
+GROUP BY i.BillingCountry
+ORDER BY Revenue DESC, Country
+LIMIT :limit
+""".strip(),
+        words=("country", "countries", "market", "markets"),
+        default_limit=-1,
+    ),
+    SqlTemplate(
+        name="monthly_revenue",
+        description="number of transactions and revenue of each month, in time order",
+        sql=f"""
+SELECT strftime('%Y-%m', i.InvoiceDate) AS Month,
+       COUNT(*) AS Transactions,
+       ROUND(SUM(i.Total), 2) AS Revenue
+FROM Invoice i
+WHERE {_filter_by_year}
+GROUP BY Month
+ORDER BY Month
+LIMIT :limit
+""".strip(),
+        words=("month", "months", "monthly"),
+        ranking=False,
+        default_limit=-1,
+    ),
+    SqlTemplate(
+        name="yearly_revenue",
+        description="number of transactions and revenue of each year, in time order",
+        sql=f"""
+SELECT strftime('%Y', i.InvoiceDate) AS Year,
+       COUNT(*) AS Transactions,
+       ROUND(SUM(i.Total), 2) AS Revenue
+FROM Invoice i
+WHERE {_filter_by_year}
+GROUP BY Year
+ORDER BY Year
+LIMIT :limit
+""".strip(),
+        words=("year", "years", "yearly", "annual", "annually"),
+        ranking=False,
+        default_limit=-1,
+    ),
+]
+
+_templates_by_word: dict[str, SqlTemplate] = {
+    word: template for template in TEMPLATES for word in template.words
+}
+
+#: words that say what is measured, at least one is required
+MEASURE_WORDS = {
+    "revenue", "revenues", "sales", "sale", "sold", "sell", "sells", "selling",
+    "seller", "sellers", "earn", "earns", "earned", "earning", "earnings",
+    "income", "money", "spend", "spends", "spent", "spending", "purchase",
+    "purchases", "purchased", "bought", "popular", "popularity", "perform",
+    "performs", "performed", "performing", "performance", "trend", "trends",
+}
+#: words that ask for a ranking, they may precede a top N limit
+RANKING_WORDS = {
+    "top", "best", "most", "highest", "biggest", "largest", "greatest",
+    "leading", "first", "rank", "ranked", "ranking",
+}
+#: ranking words that also imply the sales measure, "top customers"
+SALES_RANKING_WORDS = {"top", "best", "biggest", "leading"}
+#: words that don't change the meaning of the question
+FILLER_WORDS = {
+    "a", "an", "the", "which", "what", "who", "whose", "are", "is", "was",
+    "were", "has", "have", "had", "do", "does", "did", "by", "of", "in",
+    "for", "during", "to", "me", "us", "show", "list", "give", "get", "find",
+    "tell", "display", "our", "we", "all", "each", "per", "and", "terms",
+    "based", "on", "how", "much", "generated", "made", "brought", "their",
+    "its", "total", "overall", "ever", "time", "over", "breakdown", "s",
+}
+NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "fifteen": 15, "twenty": 20,
+}
+
+_token_pattern = re.compile(r"[a-z]+|\d+")
+_year_pattern = re.compile(r"^(19|20)\d\d$")
+_sql_assistant_query_pattern = re.compile(
+    r"^\s*Run SQL if needed:\s*(?P<question>.*?)\s*(?:Use your available tools.*)?$",
+    re.DOTALL | re.IGNORECASE,
+)
+
+
+def extract_question(query: str) -> str:
+    """
+    The user question inside the ``sql_assistant`` query the router writes,
+    ``Run SQL if needed: '...'. Use your available tools to ...``.
+    """
+    match = _sql_assistant_query_pattern.match(query)
+    if match is None:
+        return query
+    return match.group("question")
+
+
+def tokenize(text: str) -> list[str]:
+    return _token_pattern.findall(text.lower())
+
+
+@dataclasses.dataclass(frozen=True)
+class TemplateMatch:
+    """
+    A question matched by :func:`match_sql_template`.
+
+    :param template: the matched template.
+    :param params: the values of its bind parameters.
+    """
+
+    template: SqlTemplate
+    params: dict[str, T.Any]
+
+
+def _parse_number(token: str) -> T.Optional[int]:
+    if token.isdigit():
+        return int(token)
+    return NUMBER_WORDS.get(token)
+
+
+def match_sql_template(question: str) -> T.Optional[TemplateMatch]:
+    """
+    Find the template that answers a question exactly, None if there is
+    none or the question says more than a template can honour.
+
+    A number is a top N limit when it directly follows a ranking word
+    ("top 5") or directly precedes the dimension ("5 best artists"), a
+    number like 2012 is a year filter, any other number is a no-match.
+    """
+    tokens = tokenize(question)
+    template = None
+    has_measure = False
+    limit = None
+    year = None
+    for ith, token in enumerate(tokens):
+        if token in FILLER_WORDS or token in RANKING_WORDS:
+            has_measure = has_measure or token in SALES_RANKING_WORDS
+            continue
+        if token in MEASURE_WORDS:
+            has_measure = True
+            continue
+        if token in _templates_by_word:
+            if template is not None and template is not _templates_by_word[token]:
+                return None
+            template = _templates_by_word[token]
+            continue
+        number = _parse_number(token)
+        if number is None:
+            return None
+        if year is None and _year_pattern.match(token):
+            year = token
+            continue
+        previous_token = tokens[ith - 1] if ith > 0 else None
+        next_token = tokens[ith + 1] if ith + 1 < len(tokens) else None
+        if limit is None and (
+            previous_token in RANKING_WORDS
+            or next_token in RANKING_WORDS
+            or next_token in _templates_by_word
+        ):
+            limit = number
+            continue
+        return None
+    if template is None or not has_measure:
+        return None
+    if limit is not None and (not template.ranking or limit <= 0):
+        return None
+    return TemplateMatch(
+        template=template,
+        params={
+            "limit": template.default_limit if limit is None else limit,
+            "year": year,
+        },
+    )
+
+
+def format_template_answer(match: TemplateMatch, query_result: str) -> str:
+    """
+    The ``sql_assistant`` answer of a matched question, in the same shape as
+    the SQL agent answer: the query, then its result.
+    """
+    params = ", ".join(f"{key}={value!r}" for key, value in match.params.items())
+    return (
+        f"Answered with the vetted SQL template {match.template.name!r}: "
+        f"{match.template.description}.\n\n"
+        f"Query executed:\n"
+        f"```sql\n{match.template.sql}\n```\n"
+        f"Parameters: {params}\n\n"
+        f"{query_result}"
+    )
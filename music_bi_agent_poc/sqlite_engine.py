@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+"""
+Read-only SQLite engine mode for the SQL agent database.
+
+The database file is opened with a ``file:`` URI in ``mode=ro`` (and
+optionally ``immutable=1``, which also skips file locking), connections are
+pooled and shared by all threads, and each connection is tuned with
+``mmap_size`` / ``cache_size`` and locked with ``query_only``.
+"""
+
+import typing as T
+from pathlib import Path
+from urllib.parse import quote
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    import sqlalchemy as sa
+
+
+def make_sqlite_url(
+    path: Path,
+    read_only: bool = False,
+    immutable: bool = False,
+) -> str:
+    """
+    :param read_only: open the file with ``mode=ro``.
+    :param immutable: also set ``immutable=1``, SQLite then assumes the file
+        never changes and doesn't lock it. Only used with ``read_only``.
+    """
+    if not read_only:
+        return f"sqlite:///{path}"
+    query = "mode=ro"
+    if immutable:
+        query += "&immutable=1"
+    return f"sqlite:///file:{quote(path.as_posix())}?{query}&uri=true"
+
+
+def make_sqlite_engine_kwargs(pool_size: int) -> dict[str, T.Any]:
+    """
+    ``create_engine`` arguments that keep up to ``pool_size`` connections
+    open for concurrent tool calls, a burst above it opens temporary extra
+    connections instead of waiting.
+
+    A connection is only used by one thread at a time, but not always the
+    thread that opened it, which is safe for a read-only file.
+    """
+    from sqlalchemy.pool import QueuePool
+
+    return {
+        "poolclass": QueuePool,
+        "pool_size": pool_size,
+        "max_overflow": pool_size,
+        "connect_args": {"check_same_thread": False},
+    }
+
+
+def install_sqlite_pragmas(
+    engine: "sa.Engine",
+    mmap_size: int,
+    cache_size: int,
+    query_only: bool = True,
+):
+    """
+    Run the tuning pragmas on every new connection of the engine.
+
+    :param mmap_size: bytes of the database file to memory map, 0 disables it.
+    :param cache_size: page cache size, in pages if positive, in KiB if
+        negative, following the SQLite convention.
+    :param query_only: reject any statement that writes to the database.
+    """
+    from sqlalchemy import event
+
+    pragmas = [
+        f"PRAGMA mmap_size = {int(mmap_size)}",
+        f"PRAGMA cache_size = {int(cache_size)}",
+    ]
+    if query_only:
+        pragmas.append("PRAGMA query_only = ON")
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+    event.listen(engine, "connect", set_pragmas)
@@ -2,9 +2,116 @@
 
 import typing as T
 import textwrap
+import threading
+from functools import cached_property
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    from strands.tools.decorator import DecoratedFunctionTool
+
 
 def get_description(method: T.Callable) -> str:
     """
     Get the description of a function, falling back to its docstring if available.
     """
     return textwrap.dedent(method.__doc__).strip()
+
+
+_locks_key = "__locked_cached_property_locks__"
+
+
+class locked_cached_property(cached_property):
+    """
+    Drop-in replacement of :func:`functools.cached_property` that computes
+    the value only once per instance when several threads read it at the
+    same time, e.g. the warm-up threads and the first requests: the other
+    threads wait for the value instead of building their own copy.
+
+    Each instance and attribute has its own lock, reading other attributes,
+    or the same attribute of another session, never waits.
+    """
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        cache = instance.__dict__
+        try:
+            return cache[self.attrname]
+        except KeyError:
+            pass
+        # dict.setdefault is atomic, every thread gets the same lock. The
+        # locks live in a dict of their own, a key like f"_{attrname}_lock"
+        # could be the name of another attribute, e.g. ``_sessions_lock``
+        locks = cache.setdefault(_locks_key, dict())
+        lock = locks.setdefault(self.attrname, threading.Lock())
+        with lock:
+            try:
+                return cache[self.attrname]
+            except KeyError:
+                value = self.func(instance)
+                cache[self.attrname] = value
+                return value
+
+
+class LazyTool:
+    """
+    Descriptor that only imports ``strands`` and builds the tool the first
+    time it is accessed on an instance, see :func:`lazy_tool`.
+    """
+
+    def __init__(
+        self,
+        func: T.Callable,
+        description: T.Optional[T.Callable[[], str]] = None,
+        context: bool = False,
+    ):
+        self.func = func
+        self.description = description
+        self.context = context
+        self._tool = None
+        self._lock = threading.Lock()
+
+    def get_tool(self) -> "DecoratedFunctionTool":
+        if self._tool is None:
+            with self._lock:
+                if self._tool is None:
+                    import strands
+
+                    tool = strands.tool(self.func, context=self.context)
+                    if self.description is not None:
+                        tool.tool_spec["description"] = self.description()
+                    self._tool = tool
+        return self._tool
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        return self.get_tool().__get__(instance, owner)
+
+
+def lazy_tool(
+    func: T.Optional[T.Callable] = None,
+    description: T.Optional[T.Callable[[], str]] = None,
+    context: bool = False,
+):
+    """
+    Drop-in replacement of ``@strands.tool`` for methods of the ``One``
+    mixins, importing a mixin doesn't import the agent framework.
+
+    Usage::
+
+        @lazy_tool
+        def my_tool(self, query: str) -> str:
+            ...
+
+        @lazy_tool(description=lambda: "...")
+        def my_other_tool(self, query: str) -> str:
+            ...
+
+    :param description: optional function that returns the tool description,
+        called once when the tool is built, to override the docstring.
+    :param context: pass the strands ``ToolContext`` of the call in the
+        ``tool_context`` parameter, which is not part of the tool spec.
+    """
+    if func is None:
+        return lambda func: LazyTool(func, description=description, context=context)
+    return LazyTool(func, description=description, context=context)
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+"""
+Recall@k, latency and memory of the approximate ``IVFIndex`` against the
+exact ``LocalVectorIndex``, for several quantizations and ``n_probe`` /
+``refine`` values. Uses clustered random 384-dim embeddings, no AWS and no
+embedding model required.
+
+Usage::
+
+    python scripts/benchmark_ann_index.py
+    python scripts/benchmark_ann_index.py --n-chunks 200000 --top-k 5
+"""
+
+import argparse
+
+import numpy as np
+
+from music_bi_agent_poc.local_vector_index import LocalVectorIndex, normalize
+from music_bi_agent_poc.ann_index import IVFIndex, measure_recall
+
+DIMENSION = 384
+
+
+def make_embeddings(
+    rng: np.random.Generator,
+    n: int,
+    n_topics: int,
+) -> np.ndarray:
+    """
+    Embeddings grouped around ``n_topics`` topics, like the chunks of a
+    real corpus, uniform random vectors would have no neighbours at all.
+    """
+    topics = rng.standard_normal((n_topics, DIMENSION), dtype=np.float32)
+    noise = rng.standard_normal((n, DIMENSION), dtype=np.float32)
+    return normalize(topics[rng.integers(n_topics, size=n)] + 0.8 * noise)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-chunks", type=int, default=50_000)
+    parser.add_argument("--n-queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    embeddings = make_embeddings(
+        rng, args.n_chunks, n_topics=max(10, args.n_chunks // 100)
+    )
+    keys = [f"key-{i}" for i in range(args.n_chunks)]
+    texts = [""] * args.n_chunks
+    # queries close to, but not exactly on, existing chunks
+    noise = normalize(
+        rng.standard_normal((args.n_queries, DIMENSION), dtype=np.float32)
+    )
+    queries = normalize(
+        embeddings[rng.integers(args.n_chunks, size=args.n_queries)] + 0.5 * noise
+    )
+    exact_index = LocalVectorIndex(keys=keys, texts=texts, embeddings=embeddings)
+    print(
+        f"{args.n_chunks} chunks, exact float32 index: "
+        f"{exact_index.matrix.nbytes / 2**20:.1f} MiB"
+    )
+    print(
+        f"{'quantization':>12} {'MiB':>6} {'n_probe':>7} {'refine':>6} "
+        f"{'recall@' + str(args.top_k):>9} {'ann_ms':>7} {'exact_ms':>8}"
+    )
+    for quantization in ["int8", "pq"]:
+        ann_index = IVFIndex.build(
+            keys=keys,
+            texts=texts,
+            embeddings=embeddings,
+            quantization=quantization,
+        )
+        for n_probe in [1, 4, 8, 16, 32]:
+            for refine in [0, 4]:
+                report = measure_recall(
+                    ann_index,
+                    exact_index,
+                    queries,
+                    top_k=args.top_k,
+                    n_probe=n_probe,
+                    refine=refine,
+                )
+                print(
+                    f"{quantization:>12} {ann_index.nbytes / 2**20:>6.1f} "
+                    f"{n_probe:>7} {refine:>6} {report.recall:>9.3f} "
+                    f"{report.ann_ms:>7.3f} {report.exact_ms:>8.3f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
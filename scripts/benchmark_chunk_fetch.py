@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compare serial, concurrent and cached chunk body reads in ``RagMixin`` against
+a local S3 stand-in.
+
+.. code-block:: bash
+
+    pip install "moto[s3]"
+
+moto answers in-process in microseconds, so a ``before-send`` hook adds a
+fixed delay to every S3 request to emulate the network round trip to S3.
+"""
+
+import os
+import time
+
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import moto
+from boto_session_manager import BotoSesManager
+from s3pathlib import S3Path
+
+from music_bi_agent_poc.one.api import one
+
+S3_LATENCY = 0.030  # seconds per request
+TOP_K = 5
+
+
+def emulate_latency(**kwargs):
+    time.sleep(S3_LATENCY)
+
+
+def serial_fetch(keys: list[str]) -> list[str]:
+    return [one.get_s3path_doc(key).read_text(bsm=one.bsm) for key in keys]
+
+
+def concurrent_fetch(keys: list[str]) -> list[str]:
+    one.chunk_cache.memory.clear()
+    return one.fetch_chunk_contents(keys)
+
+
+def main():
+    with moto.mock_aws():
+        bsm = BotoSesManager(region_name="us-east-1")
+        one.__dict__["bsm"] = bsm
+        bsm.s3_client.create_bucket(Bucket="benchmark")
+        one.__dict__["s3dir_documents"] = S3Path("benchmark/documents/").to_dir()
+        for client in [bsm.s3_client, one.s3_client_for_chunk_fetch]:
+            client.meta.events.register_first(
+                "before-send.s3.GetObject", emulate_latency
+            )
+
+        keys = [f"chunk-{i}" for i in range(TOP_K)]
+        for key in keys:
+            one.get_s3path_doc(key).write_text(f"content of {key}", bsm=bsm)
+
+        for name, func in [
+            ("serial", serial_fetch),
+            ("concurrent", concurrent_fetch),
+            ("cached", one.fetch_chunk_contents),
+        ]:
+            n_rounds = 10
+            start = time.perf_counter()
+            for _ in range(n_rounds):
+                contents = func(keys)
+            elapsed = (time.perf_counter() - start) / n_rounds
+            assert contents == [f"content of {key}" for key in keys]
+            print(f"{name:>10}: {elapsed * 1000:.1f} ms per retrieve ({TOP_K} chunks)")
+
+
+if __name__ == "__main__":
+    main()
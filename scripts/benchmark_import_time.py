@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+"""
+Measure the import time of ``music_bi_agent_poc.one.api`` with
+``python -X importtime`` and fail if it exceeds the budget, or if a heavy
+dependency is imported eagerly.
+
+Usage::
+
+    python scripts/benchmark_import_time.py
+    python scripts/benchmark_import_time.py --budget-ms 150 --runs 10
+"""
+
+import sys
+import argparse
+import statistics
+import subprocess
+
+MODULE = "music_bi_agent_poc.one.api"
+#: Dependencies that must only be imported by the mixin that uses them.
+HEAVY_MODULES = [
+    "strands",
+    "boto_session_manager",
+    "s3pathlib",
+    "s3vectorm",
+    "fastembed",
+    "tokenizers",
+    "mcp_ohmy_sql",
+    "numpy",
+]
+DEFAULT_BUDGET_MS = 150.0
+
+
+def parse_importtime(stderr: str) -> dict[str, int]:
+    """
+    :return: cumulative import time in microseconds of each module.
+    """
+    cumulative = dict()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative_us, name = line[len("import time:") :].split("|")
+        try:
+            cumulative[name.strip()] = int(cumulative_us)
+        except ValueError:  # the header line
+            pass
+    return cumulative
+
+
+def measure_once() -> tuple[float, dict[str, int]]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {MODULE}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    cumulative = parse_importtime(result.stderr)
+    return cumulative[MODULE] / 1000, cumulative
+
+
+def find_heavy_imports() -> list[str]:
+    code = (
+        f"import sys, {MODULE}; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return [name for name in result.stdout.strip().split(",") if name]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    timings = []
+    cumulative = dict()
+    for _ in range(args.runs):
+        elapsed_ms, cumulative = measure_once()
+        timings.append(elapsed_ms)
+    median_ms = statistics.median(timings)
+
+    print(f"import {MODULE}: median {median_ms:.1f} ms over {args.runs} runs")
+    print("slowest modules (last run, cumulative):")
+    for name, us in sorted(cumulative.items(), key=lambda x: -x[1])[: args.top]:
+        print(f"  {us / 1000:>8.1f} ms  {name}")
+
+    ok = True
+    heavy = find_heavy_imports()
+    if heavy:
+        print(f"FAIL: heavy dependencies imported eagerly: {', '.join(heavy)}")
+        ok = False
+    if median_ms > args.budget_ms:
+        print(f"FAIL: {median_ms:.1f} ms exceeds the {args.budget_ms:.1f} ms budget")
+        ok = False
+    if ok:
+        print(f"OK: within the {args.budget_ms:.1f} ms budget")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+
+"""
+Measure the query latency of the in-process ``LocalVectorIndex`` with random
+384-dim embeddings, no AWS and no embedding model required.
+"""
+
+import time
+
+import numpy as np
+
+from music_bi_agent_poc.local_vector_index import LocalVectorIndex
+
+
+def benchmark(n_chunks: int, n_queries: int = 1000, top_k: int = 5):
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((n_chunks, 384), dtype=np.float32)
+    index = LocalVectorIndex(
+        keys=[f"key-{i}" for i in range(n_chunks)],
+        texts=[f"text-{i}" for i in range(n_chunks)],
+        embeddings=embeddings,
+    )
+    queries = rng.standard_normal((n_queries, 384), dtype=np.float32)
+    start = time.perf_counter()
+    for query in queries:
+        index.query(query, top_k=top_k)
+    elapsed = time.perf_counter() - start
+    print(f"{n_chunks = :>7}, avg query latency = {elapsed / n_queries * 1000:.4f} ms")
+
+
+for n_chunks in [100, 1_000, 10_000]:
+    benchmark(n_chunks)
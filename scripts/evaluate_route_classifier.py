@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+"""
+Evaluate the embedding route classifier offline, with leave-one-out cross
+validation over the labelled questions: routing accuracy and coverage at
+several confidence thresholds, against the router LLM latency it saves.
+Needs the embedding model, no AWS.
+
+Usage::
+
+    python scripts/evaluate_route_classifier.py
+    python scripts/evaluate_route_classifier.py --examples my_examples.jsonl --router-seconds 2.0
+"""
+
+import time
+import argparse
+
+from music_bi_agent_poc.one.api import one
+from music_bi_agent_poc.route_classifier import load_labelled_queries, cross_validate
+
+MIN_MARGINS = [0.0, 0.02, 0.05, 0.08, 0.1, 0.15, 0.2]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--examples", default="", help="labelled questions, JSON lines")
+    parser.add_argument(
+        "--router-seconds",
+        type=float,
+        default=1.5,
+        help="latency of one router LLM turn",
+    )
+    args = parser.parse_args()
+    if args.examples:
+        one.settings.route_classifier_examples = args.examples
+    labelled_queries = load_labelled_queries(one.get_route_classifier_examples_path())
+    queries = [labelled_query.query for labelled_query in labelled_queries]
+    routes = [labelled_query.route for labelled_query in labelled_queries]
+
+    # the classifier cost per question: one uncached query embedding
+    list(one.embedding_model.embed(documents=["warm up"]))
+    start = time.perf_counter()
+    embeddings = [
+        list(one.embedding_model.embed(documents=[query]))[0] for query in queries
+    ]
+    classify_ms = (time.perf_counter() - start) / len(queries) * 1000
+
+    print(
+        f"{len(queries)} labelled questions, "
+        f"classifier cost {classify_ms:.1f} ms per question"
+    )
+    print(
+        f"{'min_margin':>10} {'coverage':>9} {'accuracy':>9} {'skipped':>8} "
+        f"{'wrong':>6} {'saved_ms':>9}"
+    )
+    for row in cross_validate(
+        embeddings,
+        routes,
+        min_margins=MIN_MARGINS,
+        min_score=one.settings.route_classifier_min_score,
+    ):
+        saved_ms = row.get_seconds_saved(args.router_seconds) * 1000 - classify_ms
+        print(
+            f"{row.min_margin:>10.2f} {row.coverage:>9.1%} {row.accuracy:>9.1%} "
+            f"{row.skipped:>8.1%} {row.wrong_dispatch:>6.1%} {saved_ms:>9.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
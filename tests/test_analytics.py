@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+import sqlite3
+
+import pytest
+
+from music_bi_agent_poc.paths import path_enum
+from music_bi_agent_poc.analytics import AnalyticSnapshot, format_rows
+
+LINE_JOINS = """
+FROM InvoiceLine il
+JOIN Track t ON il.TrackId = t.TrackId
+JOIN Album al ON t.AlbumId = al.AlbumId
+JOIN Artist ar ON al.ArtistId = ar.ArtistId
+"""
+GENRE_JOINS = """
+FROM InvoiceLine il
+JOIN Track t ON il.TrackId = t.TrackId
+JOIN Genre g ON t.GenreId = g.GenreId
+"""
+
+
+@pytest.fixture(scope="module")
+def snapshot() -> AnalyticSnapshot:
+    return AnalyticSnapshot.build(path_enum.path_sqlite)
+
+
+def run_sqlite(sql: str) -> tuple[list[str], list[list]]:
+    uri = f"{path_enum.path_sqlite.absolute().as_uri()}?mode=ro"
+    with sqlite3.connect(uri, uri=True) as connection:
+        cursor = connection.execute(sql)
+        columns = [description[0] for description in cursor.description]
+        return columns, [list(row) for row in cursor.fetchall()]
+
+
+def normalize_row(row: list) -> tuple:
+    # the rollups and SQLite add floats in a different order
+    return tuple(round(v, 6) if isinstance(v, float) else v for v in row)
+
+
+def assert_same_result(snapshot: AnalyticSnapshot, sql: str, order_position: int):
+    """
+    The snapshot answer equals the SQLite result. Rows that tie on the
+    ``order_position`` column may come in any order.
+    """
+    result = snapshot.answer(sql)
+    assert result is not None
+    columns, rows = result
+    expected_columns, expected_rows = run_sqlite(sql)
+    assert columns == expected_columns
+    assert len(rows) == len(expected_rows)
+    assert [normalize_row(row)[order_position] for row in rows] == [
+        normalize_row(row)[order_position] for row in expected_rows
+    ]
+    assert sorted(map(normalize_row, rows), key=repr) == sorted(
+        map(normalize_row, expected_rows), key=repr
+    )
+
+
+@pytest.mark.parametrize(
+    "sql, order_position",
+    [
+        # ROUND, ORDER BY alias, LIMIT
+        (
+            f"SELECT ar.Name, ROUND(SUM(il.UnitPrice * il.Quantity), 2) AS Revenue "
+            f"{LINE_JOINS} GROUP BY ar.Name ORDER BY Revenue DESC LIMIT 10",
+            1,
+        ),
+        # ORDER BY ordinal, measure written the other way around
+        (
+            f"SELECT g.Name AS Genre, SUM(il.Quantity * il.UnitPrice) AS Revenue, "
+            f"COUNT(*) AS Lines {GENRE_JOINS} GROUP BY Genre ORDER BY 2 DESC",
+            1,
+        ),
+        # AVG, COUNT DISTINCT
+        (
+            f"SELECT g.Name, AVG(il.UnitPrice), COUNT(DISTINCT il.InvoiceId) "
+            f"{GENRE_JOINS} GROUP BY g.Name ORDER BY 3 DESC",
+            2,
+        ),
+        # no ORDER BY, groups sorted by the group key
+        (
+            "SELECT strftime('%Y', i.InvoiceDate) AS Year, "
+            "ROUND(SUM(il.UnitPrice * il.Quantity), 2) "
+            "FROM InvoiceLine il JOIN Invoice i ON il.InvoiceId = i.InvoiceId "
+            "GROUP BY Year",
+            0,
+        ),
+        # invoice grain
+        (
+            "SELECT BillingCountry, ROUND(AVG(Total), 2) AS AvgTotal, SUM(Total), "
+            "COUNT(*) FROM Invoice GROUP BY BillingCountry "
+            "ORDER BY AvgTotal DESC LIMIT 5",
+            1,
+        ),
+        (
+            "SELECT c.Country, COUNT(DISTINCT c.CustomerId) AS Customers "
+            "FROM Invoice i JOIN Customer c ON i.CustomerId = c.CustomerId "
+            "GROUP BY c.Country ORDER BY Customers DESC",
+            1,
+        ),
+        (
+            "SELECT strftime('%Y-%m', InvoiceDate) AS Month, SUM(Total) "
+            "FROM Invoice GROUP BY Month ORDER BY Month DESC LIMIT 12",
+            0,
+        ),
+    ],
+)
+def test_answer(snapshot, sql: str, order_position: int):
+    assert_same_result(snapshot, sql, order_position)
+
+
+def test_order_by_with_ties(snapshot):
+    # many genres have the same number of distinct invoices, only the
+    # ordering column is compared row by row
+    sql = (
+        f"SELECT g.Name, COUNT(DISTINCT il.InvoiceId) AS Invoices "
+        f"{GENRE_JOINS} GROUP BY g.Name ORDER BY Invoices"
+    )
+    assert_same_result(snapshot, sql, 1)
+
+
+@pytest.mark.parametrize(
+    "sql",
+    [
+        f"SELECT g.Name, COUNT(*) {GENRE_JOINS} WHERE g.Name = 'Rock' GROUP BY g.Name",
+        f"SELECT g.Name, COUNT(*) {GENRE_JOINS} GROUP BY g.Name HAVING COUNT(*) > 10",
+        f"SELECT g.Name, COUNT(*) {GENRE_JOINS} GROUP BY g.Name LIMIT 5 OFFSET 5",
+        "SELECT g.Name, COUNT(*) FROM InvoiceLine il "
+        "LEFT JOIN Track t ON il.TrackId = t.TrackId "
+        "LEFT JOIN Genre g ON t.GenreId = g.GenreId GROUP BY g.Name",
+        "SELECT g.Name, COUNT(*) FROM Track t, Genre g GROUP BY g.Name",
+        # join on columns that are not a foreign key
+        "SELECT g.Name, COUNT(*) FROM InvoiceLine il "
+        "JOIN Track t ON il.UnitPrice = t.UnitPrice "
+        "JOIN Genre g ON t.GenreId = g.GenreId GROUP BY g.Name",
+        "SELECT g.Name, COUNT(*) FROM InvoiceLine il "
+        "JOIN Track t ON il.InvoiceLineId = t.TrackId "
+        "JOIN Genre g ON t.GenreId = g.GenreId GROUP BY g.Name",
+        # unknown measure, unknown dimension, two group keys, two sort keys
+        f"SELECT g.Name, MAX(il.UnitPrice) {GENRE_JOINS} GROUP BY g.Name",
+        f"SELECT t.Composer, COUNT(*) {GENRE_JOINS} GROUP BY t.Composer",
+        f"SELECT g.Name, t.Composer, COUNT(*) {GENRE_JOINS} GROUP BY g.Name, t.Composer",
+        f"SELECT g.Name, COUNT(*) {GENRE_JOINS} GROUP BY g.Name ORDER BY 2 DESC, 1",
+        "SELECT Name FROM Genre",
+    ],
+)
+def test_fallback(snapshot, sql: str):
+    assert snapshot.answer(sql) is None
+    # still a valid statement for SQLite
+    run_sqlite(sql)
+
+
+def test_stats(snapshot):
+    hits, misses = snapshot.stats.hits, snapshot.stats.misses
+    snapshot.answer("SELECT BillingCountry, COUNT(*) FROM Invoice GROUP BY 1")
+    snapshot.answer("SELECT Name FROM Genre")
+    assert (snapshot.stats.hits, snapshot.stats.misses) == (hits + 1, misses + 1)
+
+
+def test_dump_load(snapshot, tmp_path):
+    sql = f"SELECT ar.Name, COUNT(*) AS n {LINE_JOINS} GROUP BY 1 ORDER BY n DESC"
+    assert AnalyticSnapshot.load(tmp_path) is None
+    snapshot.dump(tmp_path)
+    loaded = AnalyticSnapshot.load(tmp_path)
+    assert loaded.answer(sql) == snapshot.answer(sql)
+    loaded = AnalyticSnapshot.load_or_build(path_enum.path_sqlite, tmp_path)
+    assert loaded.answer(sql) == snapshot.answer(sql)
+
+
+def test_format_rows():
+    assert format_rows(["a"], []) == "No result"
+    text = format_rows(["a", "b"], [["x", 1.5]])
+    assert text.splitlines()[0].replace(" ", "") == "|a|b|"
+    assert "1.5000" in text
+
+
+if __name__ == "__main__":
+    from music_bi_agent_poc.tests import run_cov_test
+
+    run_cov_test(
+        __file__,
+        "music_bi_agent_poc.analytics",
+        preview=False,
+    )
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+from music_bi_agent_poc.local_vector_index import LocalVectorIndex, normalize
+from music_bi_agent_poc.ann_index import (
+    assign,
+    kmeans,
+    Int8Quantizer,
+    ProductQuantizer,
+    IVFIndex,
+    measure_recall,
+)
+
+DIMENSION = 32
+
+
+def make_embeddings(n: int, seed: int = 0) -> np.ndarray:
+    """
+    Embeddings around 20 topics, like the chunks of a knowledge base.
+    """
+    rng = np.random.default_rng(seed)
+    topics = rng.normal(size=(20, DIMENSION))
+    return (
+        topics[rng.integers(0, len(topics), n)] + 0.5 * rng.normal(size=(n, DIMENSION))
+    ).astype(np.float32)
+
+
+def make_queries(embeddings: np.ndarray, n: int, seed: int = 1) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    rows = normalize(embeddings[rng.choice(len(embeddings), n, replace=False)])
+    noise = normalize(rng.normal(size=(n, DIMENSION)))
+    return rows + 0.5 * noise
+
+
+@pytest.fixture(scope="module")
+def embeddings() -> np.ndarray:
+    return make_embeddings(2000)
+
+
+@pytest.fixture(scope="module")
+def exact_index(embeddings) -> LocalVectorIndex:
+    keys = [f"k{ith}" for ith in range(len(embeddings))]
+    return LocalVectorIndex(keys=keys, texts=keys, embeddings=embeddings)
+
+
+def build(embeddings: np.ndarray, quantization: str, **kwargs) -> IVFIndex:
+    keys = [f"k{ith}" for ith in range(len(embeddings))]
+    return IVFIndex.build(
+        keys=keys,
+        texts=[f"text of {key}" for key in keys],
+        embeddings=embeddings,
+        quantization=quantization,
+        pq_m=8,
+        **kwargs,
+    )
+
+
+def test_kmeans_assign():
+    rng = np.random.default_rng(0)
+    centers = np.array([[10.0, 0.0], [0.0, 10.0], [-10.0, -10.0]])
+    matrix = np.concatenate([center + rng.normal(size=(50, 2)) for center in centers])
+    centroids = kmeans(matrix, n_clusters=3, seed=0)
+    labels = assign(matrix, centroids)
+    # each generated cluster is one k-means cluster
+    assert [len(set(labels[i : i + 50])) for i in range(0, 150, 50)] == [1, 1, 1]
+    assert len(set(labels)) == 3
+    # never more clusters than rows
+    assert len(kmeans(matrix[:2], n_clusters=3)) == 2
+
+
+def test_int8_quantizer():
+    rng = np.random.default_rng(0)
+    matrix = rng.normal(size=(100, DIMENSION)).astype(np.float32)
+    matrix[:, 0] = 0.0
+    quantizer = Int8Quantizer.fit(matrix)
+    codes = quantizer.encode(matrix)
+    assert codes.dtype == np.int8
+    query = rng.normal(size=DIMENSION).astype(np.float32)
+    np.testing.assert_allclose(
+        quantizer.score(query, codes), matrix @ query, atol=0.1
+    )
+
+
+def test_product_quantizer():
+    matrix = normalize(make_embeddings(1000))
+    quantizer = ProductQuantizer.fit(matrix, m=8, n_iter=5)
+    codes = quantizer.encode(matrix)
+    assert (codes.shape, codes.dtype) == ((1000, 8), np.uint8)
+    scores = quantizer.score(matrix[0], codes)
+    # approximate, but the row itself is among the best matches
+    assert abs(scores[0] - 1.0) < 0.2
+    assert 0 in np.argsort(-scores)[:20]
+    with pytest.raises(ValueError):
+        ProductQuantizer.fit(matrix, m=5)
+
+
+@pytest.mark.parametrize(
+    "quantization, refine, min_recall",
+    [
+        ("int8", 0, 0.9),
+        ("pq", 0, 0.5),
+        ("pq", 4, 0.9),
+    ],
+)
+def test_recall(embeddings, exact_index, quantization, refine, min_recall):
+    ann_index = build(embeddings, quantization, n_probe=8, refine=refine)
+    assert len(ann_index) == len(embeddings)
+    assert ann_index.n_lists == int(4 * np.sqrt(len(embeddings)))
+    # every row is in exactly one cluster
+    assert sorted(ann_index.rows.tolist()) == list(range(len(embeddings)))
+    assert ann_index.offsets[-1] == len(embeddings)
+    report = measure_recall(
+        ann_index, exact_index, make_queries(embeddings, 50), top_k=10
+    )
+    assert report.recall >= min_recall
+    # scanning every cluster without quantization loss is exact
+    report = measure_recall(
+        ann_index,
+        exact_index,
+        make_queries(embeddings, 20),
+        top_k=10,
+        n_probe=ann_index.n_lists,
+        refine=10,
+    )
+    assert report.recall == 1.0
+
+
+def test_query(embeddings, exact_index):
+    ann_index = build(embeddings, "int8")
+    hits = ann_index.query(embeddings[7], top_k=3, n_probe=ann_index.n_lists)
+    assert len(hits) == 3
+    assert hits[0].key == "k7"
+    assert hits[0].text == "text of k7"
+    assert hits[0].score == pytest.approx(1.0, abs=0.02)
+    assert [hit.score for hit in hits] == sorted(
+        [hit.score for hit in hits], reverse=True
+    )
+    # refined scores are the exact cosine similarities
+    refined = ann_index.query(embeddings[7], top_k=3, refine=2)
+    exact = exact_index.query(embeddings[7], top_k=3)
+    assert [hit.key for hit in refined] == [hit.key for hit in exact]
+    assert refined[0].score == pytest.approx(exact[0].score, abs=1e-5)
+
+
+@pytest.mark.parametrize("quantization", ["int8", "pq"])
+def test_dump_load(embeddings, tmp_path, quantization):
+    ann_index = build(embeddings, quantization, n_iter=5)
+    assert IVFIndex.exists(tmp_path) is False
+    ann_index.dump(tmp_path)
+    assert IVFIndex.exists(tmp_path) is True
+    loaded = IVFIndex.load(tmp_path, n_probe=4, refine=2)
+    assert (loaded.n_probe, loaded.refine) == (4, 2)
+    assert loaded.quantizer.kind == quantization
+    assert loaded.build_params == ann_index.build_params
+    assert loaded.nbytes == ann_index.nbytes
+    # the float32 embeddings are memory-mapped, not loaded
+    assert isinstance(loaded.matrix, np.memmap)
+    for query in make_queries(embeddings, 5):
+        for refine in (0, 2):
+            assert loaded.query(query, top_k=5, n_probe=4, refine=refine) == (
+                ann_index.query(query, top_k=5, n_probe=4, refine=refine)
+            )
+
+
+def test_is_built_with(embeddings, tmp_path):
+    int8_index = build(embeddings, "int8", n_iter=5)
+    assert int8_index.is_built_with(n_lists=0, quantization="int8")
+    # pq_m doesn't shape an int8 index
+    assert int8_index.is_built_with(n_lists=0, quantization="int8", pq_m=4)
+    assert not int8_index.is_built_with(n_lists=16, quantization="int8")
+    assert not int8_index.is_built_with(n_lists=0, quantization="pq", pq_m=8)
+    assert not int8_index.is_built_with(n_iter=20)
+
+    pq_index = build(embeddings, "pq", n_iter=5)
+    assert pq_index.is_built_with(n_lists=0, quantization="pq", pq_m=8)
+    assert not pq_index.is_built_with(n_lists=0, quantization="pq", pq_m=4)
+
+    # the build parameters of an index dumped without them are unknown
+    pq_index.dump(tmp_path)
+    (tmp_path / IVFIndex.path_build_params_name).unlink()
+    loaded = IVFIndex.load(tmp_path)
+    assert loaded.build_params == {}
+    assert not loaded.is_built_with(n_lists=0, quantization="pq", pq_m=8)
+
+
+def test_nbytes(embeddings):
+    int8_index = build(embeddings, "int8", n_iter=5)
+    pq_index = build(embeddings, "pq", n_iter=5)
+    assert int8_index.codes.nbytes == len(embeddings) * DIMENSION
+    assert pq_index.codes.nbytes == len(embeddings) * 8
+    assert int8_index.nbytes < embeddings.nbytes
+
+
+def test_build_errors(embeddings):
+    with pytest.raises(ValueError):
+        IVFIndex.build(keys=[], texts=[], embeddings=[])
+    with pytest.raises(ValueError):
+        build(embeddings[:10], "float16")
+
+
+if __name__ == "__main__":
+    from music_bi_agent_poc.tests import run_cov_test
+
+    run_cov_test(
+        __file__,
+        "music_bi_agent_poc.ann_index",
+        preview=False,
+    )
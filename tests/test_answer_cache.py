@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+import re
+import hashlib
+
+import numpy as np
+import pytest
+
+from music_bi_agent_poc import answer_cache as answer_cache_module
+from music_bi_agent_poc.answer_cache import get_numbers, SemanticAnswerCache
+from music_bi_agent_poc.settings import Settings
+from music_bi_agent_poc.one.one_01_main import One
+
+
+def embed(text: str) -> np.ndarray:
+    """
+    Bag of words stub embedder: numbers are left out, like a real embedding
+    model barely tells them apart.
+    """
+    embedding = np.zeros(64, dtype=np.float32)
+    for word in re.findall(r"[a-z]+", text.lower()):
+        embedding[int(hashlib.md5(word.encode()).hexdigest(), 16) % 64] += 1.0
+    return embedding
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(answer_cache_module.time, "monotonic", clock)
+    return clock
+
+
+def put(cache: SemanticAnswerCache, question: str, answer: str, version="v1"):
+    cache.put(question, embed(question), answer, version=version)
+
+
+def get(cache: SemanticAnswerCache, question: str, version="v1"):
+    return cache.get(question, embed(question), version=version)
+
+
+def test_get_numbers():
+    assert get_numbers("top 10 artists in 2012") == ("10", "2012")
+    assert get_numbers("average of 1.5 and 3") == ("1.5", "3")
+    assert get_numbers("which genre sells best?") == ()
+
+
+def test_similar_question():
+    cache = SemanticAnswerCache(threshold=0.9, max_items=10)
+    assert get(cache, "Which genre sells best?") is None
+    put(cache, "Which genre sells best?", "Rock")
+    hit = get(cache, "which GENRE sells best")
+    assert (hit.question, hit.answer) == ("Which genre sells best?", "Rock")
+    assert hit.score == pytest.approx(1.0)
+    assert get(cache, "Where is the agent code?") is None
+    assert (cache.stats.hits, cache.stats.misses) == (1, 2)
+
+
+def test_number_mismatch():
+    cache = SemanticAnswerCache(threshold=0.9, max_items=10)
+    put(cache, "Top 5 artists in 2012", "five artists of 2012")
+    # the same embedding, other numbers
+    assert get(cache, "Top 10 artists in 2012") is None
+    assert get(cache, "Top 5 artists in 2013") is None
+    assert get(cache, "Top artists") is None
+    assert get(cache, "top 5 ARTISTS in 2012").answer == "five artists of 2012"
+    # a stored question with the right numbers is found behind a closer one
+    put(cache, "Top 10 artists in 2012", "ten artists of 2012")
+    assert get(cache, "Top 10 artists in 2012").answer == "ten artists of 2012"
+
+
+def test_version_change_drops_everything():
+    cache = SemanticAnswerCache(threshold=0.9, max_items=10)
+    put(cache, "Which genre sells best?", "Rock", version="v1")
+    assert get(cache, "Which genre sells best?", version="v2") is None
+    assert len(cache) == 0
+    # the old entries don't come back with the old version
+    assert get(cache, "Which genre sells best?", version="v1") is None
+    put(cache, "Which genre sells best?", "Latin", version="v1")
+    assert get(cache, "Which genre sells best?", version="v1").answer == "Latin"
+
+
+def test_ttl(clock):
+    cache = SemanticAnswerCache(threshold=0.9, max_items=10, ttl=60)
+    put(cache, "Which genre sells best?", "Rock")
+    clock.now += 60
+    assert get(cache, "Which genre sells best?").answer == "Rock"
+    clock.now += 1
+    assert get(cache, "Which genre sells best?") is None
+    # a fresh answer to the same question is served again
+    put(cache, "Which genre sells best?", "Latin")
+    assert get(cache, "Which genre sells best?").answer == "Latin"
+
+
+def test_eviction():
+    cache = SemanticAnswerCache(threshold=0.9, max_items=2)
+    put(cache, "Which genre sells best?", "Rock")
+    put(cache, "Where is the agent code?", "one_03_agent.py")
+    put(cache, "How to run the tests?", "pytest")
+    assert len(cache) == 2
+    assert cache.stats.evictions == 1
+    # the oldest entry is dropped first
+    assert get(cache, "Which genre sells best?") is None
+    assert get(cache, "Where is the agent code?").answer == "one_03_agent.py"
+    assert get(cache, "How to run the tests?").answer == "pytest"
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_mixin(monkeypatch):
+    one = One(settings=Settings(answer_cache_enabled=True, answer_cache_threshold=0.9))
+    versions = iter([("db1", "kb1"), ("db1", "kb1"), ("db1", "kb1"), ("db2", "kb1")])
+    monkeypatch.setattr(one, "single_embedding", embed)
+    monkeypatch.setattr(one, "get_answer_cache_version", lambda: next(versions))
+    one.put_cached_answer("Which genre sells best?", "Rock")
+    assert one.get_cached_answer("Which genre sells best?").answer == "Rock"
+    assert one.get_cached_answer("Top 3 genres") is None
+    # the database changed
+    assert one.get_cached_answer("Which genre sells best?") is None
+
+    disabled = One(settings=Settings(answer_cache_enabled=False))
+    disabled.put_cached_answer("Which genre sells best?", "Rock")
+    assert disabled.get_cached_answer("Which genre sells best?") is None
+    assert "answer_cache" not in disabled.__dict__
+
+
+if __name__ == "__main__":
+    from music_bi_agent_poc.tests import run_cov_test
+
+    run_cov_test(
+        __file__,
+        "music_bi_agent_poc.answer_cache",
+        preview=False,
+    )
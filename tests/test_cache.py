@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from music_bi_agent_poc import cache as cache_module
+from music_bi_agent_poc.cache import CacheStats, LRUCache, ChunkCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, "monotonic", clock)
+    return clock
+
+
+def test_cache_stats():
+    assert CacheStats().hit_rate == 0.0
+    assert CacheStats(hits=3, misses=1).hit_rate == 0.75
+
+
+def test_lru_eviction_by_items():
+    cache = LRUCache(max_items=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "b" is now the least recently used
+    cache.put("c", 3)
+    assert "b" not in cache
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.get("b", "default") == "default"
+    assert cache.stats.evictions == 1
+    assert (cache.stats.hits, cache.stats.misses) == (3, 1)
+
+
+def test_lru_eviction_by_bytes():
+    cache = LRUCache(max_bytes=10, sizeof=len)
+    cache.put("a", "xxxx")
+    cache.put("b", "yyyy")
+    cache.put("a", "xxxxx")  # replacing a value updates the total size
+    assert cache.total_bytes == 9
+    cache.put("c", "zz")
+    assert "b" not in cache
+    assert cache.total_bytes == 7
+    # a value larger than the whole cache is not cached
+    cache.put("d", "w" * 11)
+    assert "d" not in cache
+    assert len(cache) == 2
+
+
+def test_lru_ttl(clock):
+    cache = LRUCache(ttl=10)
+    cache.put("a", 1)
+    clock.now += 9
+    assert cache.get("a") == 1
+    # reading doesn't extend the time to live
+    clock.now += 2
+    assert cache.get("a") is None
+    assert len(cache) == 0
+    assert cache.stats.misses == 1
+
+
+def test_lru_pop_clear():
+    cache = LRUCache(sizeof=len)
+    cache.put("a", "xx")
+    cache.put("b", "yyy")
+    assert cache.pop("a") == "xx"
+    assert cache.pop("a", "default") == "default"
+    assert cache.total_bytes == 3
+    cache.clear()
+    assert (len(cache), cache.total_bytes) == (0, 0)
+
+
+def test_chunk_cache(tmp_path):
+    chunk_cache = ChunkCache(max_bytes=5, dir_cache=tmp_path)
+    assert chunk_cache.get("k1") is None
+    chunk_cache.put("k1", "hello")
+    chunk_cache.put("k2", "world")  # evicts k1 from memory, not from disk
+    assert "k1" not in chunk_cache.memory
+    assert chunk_cache.get("k1") == "hello"
+    assert chunk_cache.disk_hits == 1
+    assert chunk_cache.get("k1") == "hello"
+    assert chunk_cache.disk_hits == 1
+    assert (chunk_cache.stats.hits, chunk_cache.stats.misses) == (2, 1)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["k1.txt", "k2.txt"]
+
+    memory_only = ChunkCache(max_bytes=5)
+    memory_only.put("k1", "hello")
+    memory_only.put("k2", "world")
+    assert memory_only.get("k1") is None
+
+
+if __name__ == "__main__":
+    from music_bi_agent_poc.tests import run_cov_test
+
+    run_cov_test(
+        __file__,
+        "music_bi_agent_poc.cache",
+        preview=False,
+    )
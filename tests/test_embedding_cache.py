@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from music_bi_agent_poc.embedding_cache import EmbeddingCache, get_text_sha256
+
+
+def test_put_get_reload(tmp_path):
+    cache = EmbeddingCache(dir_root=tmp_path, model_name="org/model", dimension=3)
+    assert cache.get_many(["a"]) == [None]
+    cache.put_many(["a", "b", "a"], [[1, 1, 1], [2, 2, 2], [3, 3, 3]])
+    assert len(cache) == 2
+    a, b, c = cache.get_many(["a", "b", "c"])
+    assert a.tolist() == [1, 1, 1]
+    assert b.tolist() == [2, 2, 2]
+    assert c is None
+    assert (cache.stats.hits, cache.stats.misses) == (2, 2)
+
+    cache = EmbeddingCache(dir_root=tmp_path, model_name="org/model", dimension=3)
+    assert len(cache) == 2
+    assert cache.get_many(["b"])[0].tolist() == [2, 2, 2]
+
+
+def test_recover_interrupted_write(tmp_path):
+    cache = EmbeddingCache(dir_root=tmp_path, model_name="model", dimension=3)
+    cache.put_many(["a"], [[1, 1, 1]])
+    # a row was written but not its key, then half of another row
+    with cache.path_embeddings.open("ab") as f:
+        f.write(np.array([9, 9, 9], dtype=np.float32).tobytes())
+        f.write(np.array([8], dtype=np.float32).tobytes())
+
+    cache = EmbeddingCache(dir_root=tmp_path, model_name="model", dimension=3)
+    assert len(cache) == 1
+    assert cache.path_embeddings.stat().st_size == 3 * 4
+    cache.put_many(["b"], [[2, 2, 2]])
+    assert cache.get_many(["a", "b"])[1].tolist() == [2, 2, 2]
+
+    cache = EmbeddingCache(dir_root=tmp_path, model_name="model", dimension=3)
+    a, b = cache.get_many(["a", "b"])
+    assert a.tolist() == [1, 1, 1]
+    assert b.tolist() == [2, 2, 2]
+
+
+def test_recover_partial_key(tmp_path):
+    cache = EmbeddingCache(dir_root=tmp_path, model_name="model", dimension=2)
+    cache.put_many(["a", "b"], [[1, 1], [2, 2]])
+    # the last key line was cut in the middle
+    keys = cache.path_keys.read_text(encoding="utf-8")
+    cache.path_keys.write_text(keys[:-10], encoding="utf-8")
+
+    cache = EmbeddingCache(dir_root=tmp_path, model_name="model", dimension=2)
+    assert len(cache) == 1
+    assert cache.path_keys.read_text(encoding="utf-8") == f"{get_text_sha256('a')}\n"
+    cache.put_many(["c"], [[3, 3]])
+    assert cache.get_many(["c"])[0].tolist() == [3, 3]
+    assert cache.get_many(["b"]) == [None]
+
+
+if __name__ == "__main__":
+    from music_bi_agent_poc.tests import run_cov_test
+
+    run_cov_test(
+        __file__,
+        "music_bi_agent_poc.embedding_cache",
+        preview=False,
+    )
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from music_bi_agent_poc.fan_out import BranchResult, fan_out, format_branch_results
+
+
+@pytest.fixture
+def executor():
+    executor = ThreadPoolExecutor(max_workers=4)
+    yield executor
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def test_branches_run_concurrently(executor):
+    def branch(output: str):
+        time.sleep(0.2)
+        return output
+
+    start = time.monotonic()
+    results = fan_out(
+        executor,
+        branches={"a": lambda: branch("A"), "b": lambda: branch("B")},
+        timeouts={},
+    )
+    assert time.monotonic() - start < 0.35
+    assert [(result.name, result.output, result.ok) for result in results] == [
+        ("a", "A", True),
+        ("b", "B", True),
+    ]
+
+
+def test_timeout_and_failure(executor):
+    release = threading.Event()
+
+    def stuck():
+        release.wait(5)
+        return "too late"
+
+    def broken():
+        raise ValueError("no such table")
+
+    start = time.monotonic()
+    results = fan_out(
+        executor,
+        branches={"stuck": stuck, "broken": broken, "fine": lambda: "ok"},
+        timeouts={"stuck": 0.1, "broken": 1, "fine": 0},
+    )
+    release.set()
+    # the stuck branch is given up at its own deadline
+    assert time.monotonic() - start < 1
+    stuck_result, broken_result, fine_result = results
+    assert stuck_result.ok is False
+    assert stuck_result.output is None
+    assert stuck_result.error == "timed out after 0.1 seconds"
+    assert broken_result.error == "ValueError: no such table"
+    assert (fine_result.ok, fine_result.output) == (True, "ok")
+
+    text = format_branch_results(results)
+    assert "# stuck\nFAILED (timed out after 0.1 seconds)." in text
+    assert "# broken\nFAILED (ValueError: no such table)." in text
+    assert "# fine\nok" in text
+
+
+def test_deadlines_start_together(executor):
+    # waiting for the first branch doesn't give the second one more time
+    def branch(seconds: float):
+        time.sleep(seconds)
+        return "done"
+
+    first, second = fan_out(
+        executor,
+        branches={"a": lambda: branch(0.2), "b": lambda: branch(0.4)},
+        timeouts={"a": 0.3, "b": 0.3},
+    )
+    assert first.ok is True
+    assert second.ok is False
+    assert second.elapsed < 0.4
+
+
+def test_format_branch_results():
+    assert format_branch_results([BranchResult(name="a", output="x")]) == "# a\nx"
+
+
+if __name__ == "__main__":
+    from music_bi_agent_poc.tests import run_cov_test
+
+    run_cov_test(
+        __file__,
+        "music_bi_agent_poc.fan_out",
+        preview=False,
+    )
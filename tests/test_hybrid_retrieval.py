@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+import math
+
+import pytest
+
+from music_bi_agent_poc.hybrid_retrieval import (
+    tokenize,
+    BM25Index,
+    reciprocal_rank_fusion,
+)
+
+
+def test_tokenize():
+    assert tokenize("SqlMixin.run_select") == [
+        "sqlmixin",
+        "sql",
+        "mixin",
+        "run_select",
+        "run",
+        "select",
+    ]
+    assert tokenize("one_03_agent HTTPServer") == [
+        "one_03_agent",
+        "one",
+        "03",
+        "agent",
+        "httpserver",
+        "http",
+        "server",
+    ]
+    assert tokenize("the router") == ["the", "router"]
+
+
+@pytest.fixture
+def bm25_index() -> BM25Index:
+    return BM25Index(
+        keys=["agent", "sql", "rag", "readme"],
+        texts=[
+            "def make_router_agent(self): the router_agent delegates",
+            "class SqlMixin: def run_select(self, sql): execute the sql",
+            "class RagMixin: the knowledge base retrieval",
+            "the the the the the the the the router",
+        ],
+    )
+
+
+def test_query(bm25_index):
+    # the whole identifier ranks first, its parts are searched too
+    hits = bm25_index.query("router_agent")
+    assert [hit.key for hit in hits] == ["agent", "readme"]
+    # an identifier part matches too, the shorter chunk comes first
+    hits = bm25_index.query("router")
+    assert [hit.key for hit in hits] == ["agent", "readme"]
+    assert hits[0].score > hits[1].score > 0
+    # a term in every but one chunk counts less than a rare one
+    hits = bm25_index.query("the sql")
+    assert hits[0].key == "sql"
+    # chunks without any query term are not returned
+    assert bm25_index.query("nothing matches") == []
+    assert len(bm25_index.query("the", top_k=2)) == 2
+
+
+def test_query_score(bm25_index):
+    # a single term, by hand
+    (hit,) = bm25_index.query("knowledge")
+    n, df = 4, 1
+    idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+    lengths = [len(tokenize(text)) for text in bm25_index.texts]
+    norm = 1.2 * (1 - 0.75 + 0.75 * lengths[2] / (sum(lengths) / n))
+    assert hit.score == pytest.approx(idf * 2.2 / (1 + norm), rel=1e-5)
+
+
+def test_bm25_index_edge_cases():
+    assert BM25Index(keys=[], texts=[]).query("router") == []
+    with pytest.raises(ValueError):
+        BM25Index(keys=["a"], texts=[])
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]], k=60)
+    assert [key for key, _ in fused] == ["b", "a", "d", "c"]
+    assert fused[0][1] == pytest.approx(1 / 62 + 1 / 61)
+    assert fused[1][1] == pytest.approx(1 / 61)
+    # ties keep the order of first appearance
+    fused = reciprocal_rank_fusion([["a", "b"], ["b", "a"]])
+    assert [key for key, _ in fused] == ["a", "b"]
+    assert reciprocal_rank_fusion([]) == []
+
+
+if __name__ == "__main__":
+    from music_bi_agent_poc.tests import run_cov_test
+
+    run_cov_test(
+        __file__,
+        "music_bi_agent_poc.hybrid_retrieval",
+        preview=False,
+    )
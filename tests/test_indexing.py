@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+import botocore.exceptions
+
+from music_bi_agent_poc import indexing
+from music_bi_agent_poc.indexing import (
+    iter_batches,
+    iter_sized_batches,
+    is_retryable_error,
+    call_with_retry,
+    IndexingProgress,
+)
+
+
+def make_client_error(code: str, status_code: int = 400) -> botocore.exceptions.ClientError:
+    return botocore.exceptions.ClientError(
+        error_response={
+            "Error": {"Code": code, "Message": code},
+            "ResponseMetadata": {"HTTPStatusCode": status_code},
+        },
+        operation_name="PutVectors",
+    )
+
+
+def test_iter_batches():
+    assert list(iter_batches(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(iter_batches(iter(range(4)), 2)) == [[0, 1], [2, 3]]
+    assert list(iter_batches([], 2)) == []
+
+
+def test_iter_sized_batches():
+    def batches(sizes, max_count, max_bytes):
+        return list(
+            iter_sized_batches(
+                sizes,
+                sizeof=lambda size: size,
+                max_count=max_count,
+                max_bytes=max_bytes,
+            )
+        )
+
+    # count limit
+    assert batches([1] * 5, max_count=2, max_bytes=100) == [[1, 1], [1, 1], [1]]
+    # byte limit, a batch may be exactly full
+    assert batches([4, 6, 5, 5, 1], max_count=10, max_bytes=10) == [
+        [4, 6],
+        [5, 5],
+        [1],
+    ]
+    # an item larger than the limit goes alone, nothing is dropped
+    assert batches([3, 50, 3], max_count=10, max_bytes=10) == [[3], [50], [3]]
+    assert batches([], max_count=10, max_bytes=10) == []
+    for batch in batches(list(range(1, 30)), max_count=4, max_bytes=40):
+        assert len(batch) <= 4
+        assert len(batch) == 1 or sum(batch) <= 40
+
+
+def test_is_retryable_error():
+    assert is_retryable_error(make_client_error("ThrottlingException"))
+    assert is_retryable_error(make_client_error("SlowDown", 503))
+    assert is_retryable_error(make_client_error("Whatever", 500))
+    assert is_retryable_error(
+        botocore.exceptions.ReadTimeoutError(endpoint_url="https://s3vectors")
+    )
+    assert not is_retryable_error(make_client_error("ValidationException"))
+    assert not is_retryable_error(make_client_error("AccessDeniedException", 403))
+    assert not is_retryable_error(ValueError("bad input"))
+
+
+class Flaky:
+    def __init__(self, errors: list[Exception]):
+        self.errors = errors
+        self.calls = 0
+
+    def __call__(self) -> str:
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+@pytest.fixture
+def delays(monkeypatch) -> list[float]:
+    delays = []
+    monkeypatch.setattr(indexing.time, "sleep", delays.append)
+    return delays
+
+
+def test_call_with_retry(delays):
+    func = Flaky([make_client_error("ThrottlingException")] * 3)
+    assert call_with_retry(func, max_attempts=5, base_delay=1, max_delay=3) == "ok"
+    assert func.calls == 4
+    assert len(delays) == 3
+    # full jitter under an exponential, capped, ceiling
+    for delay, ceiling in zip(delays, [1, 2, 3]):
+        assert 0 <= delay <= ceiling
+
+
+def test_call_with_retry_gives_up(delays):
+    func = Flaky([make_client_error("ThrottlingException")] * 5)
+    with pytest.raises(botocore.exceptions.ClientError):
+        call_with_retry(func, max_attempts=3)
+    assert func.calls == 3
+    assert len(delays) == 2
+
+
+def test_call_with_retry_not_retryable(delays):
+    func = Flaky([make_client_error("ValidationException")])
+    with pytest.raises(botocore.exceptions.ClientError):
+        call_with_retry(func)
+    assert func.calls == 1
+    assert delays == []
+
+    func = Flaky([ValueError("bad input")])
+    with pytest.raises(ValueError):
+        call_with_retry(func)
+    assert func.calls == 1
+
+    # a custom predicate
+    func = Flaky([ValueError("try again")])
+    assert call_with_retry(func, is_retryable=lambda e: True) == "ok"
+    assert func.calls == 2
+
+
+def test_indexing_progress(capsys):
+    progress = IndexingProgress(total=10)
+    progress.update(4)
+    progress.update(6)
+    progress.finish()
+    assert progress.done == 10
+    assert progress.elapsed == progress.end_time - progress.start_time
+    assert "indexed 10/10 chunks" in capsys.readouterr().out
+    assert IndexingProgress(total=1, verbose=False).chunks_per_sec >= 0
+
+
+if __name__ == "__main__":
+    from music_bi_agent_poc.tests import run_cov_test
+
+    run_cov_test(
+        __file__,
+        "music_bi_agent_poc.indexing",
+        preview=False,
+    )
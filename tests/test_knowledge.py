@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+import random
+
+from music_bi_agent_poc.knowledge import (
+    KnowledgeDocument,
+    parse_document_lines,
+    iter_knowledge_documents,
+    split_document,
+    merge_adjacent_chunks,
+)
+
+
+def count_tokens(text: str) -> int:
+    return len(text.split())
+
+
+def make_document(content: str, path: str = "a/b.py") -> KnowledgeDocument:
+    document = KnowledgeDocument(
+        xml="",
+        source_type="GitHub Repository",
+        github_url=f"https://github.com/org/repo/blob/main/{path}",
+        path=path,
+        content=content,
+    )
+    document.xml = document.to_xml()
+    return document
+
+
+def make_content(n_lines: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    lines = [
+        " ".join(f"w{rng.randint(0, 999)}" for _ in range(rng.randint(0, 12)))
+        for _ in range(n_lines)
+    ]
+    # one line much longer than a chunk
+    lines[n_lines // 2] = " ".join(f"long{ith}" for ith in range(300))
+    return "\n".join(lines)
+
+
+def test_parse_document(tmp_path):
+    documents = [make_document("x = 1\n\ny = 2", path=f"f{ith}.py") for ith in range(3)]
+    path = tmp_path / "kb.txt"
+    path.write_text(
+        "header\n" + "\n".join(document.xml for document in documents) + "\n",
+        encoding="utf-8",
+    )
+    parsed = list(iter_knowledge_documents(path))
+    assert [document.path for document in parsed] == ["f0.py", "f1.py", "f2.py"]
+    assert parsed[0].content == "x = 1\n\ny = 2"
+    assert parsed[0].source == "https://github.com/org/repo/blob/main/f0.py"
+    assert parsed[0].is_chunk is False
+
+
+def test_small_document_is_not_split():
+    document = make_document("x = 1")
+    assert split_document(document, 100, 10, count_tokens) == [document]
+
+
+def test_split_document():
+    content = make_content(200)
+    document = make_document(content)
+    chunks = split_document(document, 120, 20, count_tokens)
+    assert len(chunks) > 5
+    assert chunks[0].start_offset == 0
+    assert chunks[-1].end_offset == len(content)
+    for chunk, next_chunk in zip(chunks, chunks[1:]):
+        # contiguous or overlapping, always moving forward
+        assert next_chunk.start_offset <= chunk.end_offset
+        assert next_chunk.start_offset > chunk.start_offset
+        assert chunk.end_offset - next_chunk.start_offset < len(chunk.content)
+    assert any(
+        next_chunk.start_offset < chunk.end_offset
+        for chunk, next_chunk in zip(chunks, chunks[1:])
+    )
+    for chunk in chunks:
+        assert chunk.content == content[chunk.start_offset : chunk.end_offset]
+        assert count_tokens(chunk.xml) <= 120
+        # the chunk xml parses back to the same chunk
+        parsed = parse_document_lines(chunk.xml.split("\n"))
+        assert (parsed.start_offset, parsed.end_offset) == (
+            chunk.start_offset,
+            chunk.end_offset,
+        )
+        assert parsed.content == chunk.content
+        assert parsed.path == document.path
+
+
+def test_merge_adjacent_chunks_round_trip():
+    content = make_content(200, seed=1)
+    chunks = split_document(make_document(content), 120, 20, count_tokens)
+    texts = [chunk.xml for chunk in chunks]
+    random.Random(0).shuffle(texts)
+    (merged,) = merge_adjacent_chunks(texts)
+    document = parse_document_lines(merged.split("\n"))
+    assert document.content == content
+    assert (document.start_offset, document.end_offset) == (0, len(content))
+
+
+def test_merge_adjacent_chunks_keeps_gaps_and_ranks():
+    content = make_content(200, seed=2)
+    chunks = split_document(make_document(content), 120, 0, count_tokens)
+    other = make_document("print('hello')", path="other.py").xml
+    texts = [chunks[4].xml, other, chunks[0].xml, chunks[1].xml]
+    merged = merge_adjacent_chunks(texts)
+    assert len(merged) == 3
+    # chunk 4 kept its rank, chunks 0 and 1 became one, at the rank of chunk 0
+    assert merged[0] == chunks[4].to_xml()
+    assert merged[1] == other
+    document = parse_document_lines(merged[2].split("\n"))
+    assert document.content == content[: chunks[1].end_offset]
+
+
+if __name__ == "__main__":
+    from music_bi_agent_poc.tests import run_cov_test
+
+    run_cov_test(
+        __file__,
+        "music_bi_agent_poc.knowledge",
+        preview=False,
+    )
@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+
+import time
+import types
+
+import numpy as np
+import pytest
+
+from music_bi_agent_poc.paths import path_enum
+from music_bi_agent_poc.settings import Settings
+from music_bi_agent_poc.knowledge import KnowledgeDocument
+from music_bi_agent_poc.local_vector_index import LocalVectorIndex
+from music_bi_agent_poc.ann_index import IVFIndex
+from music_bi_agent_poc.one.one_01_main import One
+from music_bi_agent_poc.one.one_05_rag import get_chunk_key, KnowledgeBaseSyncReport
+
+
+class FakeEmbeddingModel:
+    """
+    Stub of ``fastembed.TextEmbedding``, records every embedded document.
+    """
+
+    def __init__(self):
+        self.documents = []
+
+    def embed(self, documents: list[str]):
+        for document in documents:
+            self.documents.append(document)
+            yield [float(len(document)), 1.0, 0.0, 0.0]
+
+
+def make_xml(path: str, content: str) -> str:
+    return KnowledgeDocument(
+        xml="",
+        source_type="GitHub Repository",
+        github_url=f"https://github.com/org/repo/blob/main/{path}",
+        path=path,
+        content=content,
+    ).to_xml()
+
+
+def write_knowledge_base(documents: dict[str, str]) -> dict[str, str]:
+    """
+    Write the knowledge base file, return the chunk keys by path.
+    """
+    xmls = {path: make_xml(path, content) for path, content in documents.items()}
+    path_enum.path_knowledge_base_txt.write_text(
+        "\n".join(xmls.values()) + "\n",
+        encoding="utf-8",
+    )
+    return {path: get_chunk_key(xml) for path, xml in xmls.items()}
+
+
+@pytest.fixture
+def one(tmp_path, monkeypatch) -> One:
+    monkeypatch.setattr(path_enum, "path_knowledge_base_txt", tmp_path / "kb.txt")
+    monkeypatch.setattr(path_enum, "dir_local_vector_index", tmp_path / "index")
+    monkeypatch.setattr(
+        path_enum, "path_s3vectors_manifest_json", tmp_path / "manifest.json"
+    )
+    one = One(
+        settings=Settings(
+            retrieval_backend="local",
+            chunk_max_tokens=0,
+            embedding_cache_enabled=False,
+        )
+    )
+    one.__dict__["embedding_model"] = FakeEmbeddingModel()
+    return one
+
+
+def test_sync_report():
+    report = KnowledgeBaseSyncReport.new(
+        current_keys=["k1", "k2", "k3"],
+        indexed_keys={"k2", "k4", "k0"},
+    )
+    assert report.n_chunks == 3
+    assert report.added_keys == ["k1", "k3"]
+    assert report.deleted_keys == ["k0", "k4"]
+    assert report.n_unchanged == 1
+    assert report.chunks_per_sec == 0.0
+    report.elapsed = 0.5
+    assert report.chunks_per_sec == 4.0
+
+
+def test_prepare_local_knowledge_base(one):
+    keys = write_knowledge_base({"a.py": "a = 1", "b.py": "b = 2", "c.py": "c = 3"})
+    report = one.prepare_knowledge_base(verbose=False)
+    assert report.added_keys == list(keys.values())
+    assert report.deleted_keys == []
+    assert len(one.embedding_model.documents) == 3
+
+    old_index = LocalVectorIndex.load(path_enum.dir_local_vector_index)
+
+    # nothing changed, nothing is embedded
+    one.embedding_model.documents.clear()
+    report = one.prepare_knowledge_base(verbose=False)
+    assert (report.added_keys, report.deleted_keys) == ([], [])
+    assert report.n_unchanged == 3
+    assert one.embedding_model.documents == []
+
+    # b.py is edited, c.py is removed, d.py is added
+    new_keys = write_knowledge_base({"a.py": "a = 1", "b.py": "b = 20", "d.py": "d = 4"})
+    report = one.prepare_knowledge_base(verbose=False)
+    assert report.added_keys == [new_keys["b.py"], new_keys["d.py"]]
+    assert report.deleted_keys == sorted([keys["b.py"], keys["c.py"]])
+    assert report.n_unchanged == 1
+    assert len(one.embedding_model.documents) == 2
+    assert "b = 20" in one.embedding_model.documents[0]
+
+    index = LocalVectorIndex.load(path_enum.dir_local_vector_index)
+    assert index.keys == list(new_keys.values())
+    assert one.local_vector_index.keys == index.keys
+    # the unchanged chunk keeps its embedding, the edited one gets a new one
+    assert (index.matrix[0] == old_index.matrix[0]).all()
+    assert (index.matrix[1] != old_index.matrix[1]).any()
+    assert "b = 20" in index.texts[1]
+
+    # a full rebuild embeds everything again
+    one.embedding_model.documents.clear()
+    report = one.prepare_knowledge_base(full_rebuild=True, verbose=False)
+    assert report.added_keys == list(new_keys.values())
+    assert len(one.embedding_model.documents) == 3
+
+
+class FakeVectorStore:
+    def create(self, **kwargs):
+        pass
+
+    def delete_all_vectors(self, **kwargs):
+        self.deleted_all = True
+
+
+def test_prepare_s3vectors_knowledge_base(one, monkeypatch):
+    one.settings.retrieval_backend = "s3vectors"
+    one.__dict__["vector_bucket"] = FakeVectorStore()
+    one.__dict__["vector_index"] = FakeVectorStore()
+    one.__dict__["s3vectors_client"] = None
+    bodies = dict()
+    vectors = dict()
+    monkeypatch.setattr(
+        one, "write_chunk_content", lambda key, content: bodies.update({key: content})
+    )
+    monkeypatch.setattr(
+        one,
+        "put_s3vectors",
+        lambda batch: vectors.update({vector.key: vector for vector in batch}),
+    )
+
+    def delete_s3vectors_chunks(keys):
+        for key in keys:
+            del bodies[key]
+            del vectors[key]
+
+    monkeypatch.setattr(one, "delete_s3vectors_chunks", delete_s3vectors_chunks)
+    # no manifest yet, the index itself is empty
+    monkeypatch.setattr(one, "list_s3vectors_keys", lambda: set(vectors))
+
+    keys = write_knowledge_base({"a.py": "a = 1", "b.py": "b = 2", "c.py": "c = 3"})
+    report = one.prepare_knowledge_base(verbose=False)
+    assert report.added_keys == list(keys.values())
+    assert set(vectors) == set(bodies) == set(keys.values())
+    assert one.load_s3vectors_manifest() == set(keys.values())
+
+    one.embedding_model.documents.clear()
+    report = one.prepare_knowledge_base(verbose=False)
+    assert (report.added_keys, report.deleted_keys) == ([], [])
+    assert one.embedding_model.documents == []
+
+    new_keys = write_knowledge_base({"a.py": "a = 1", "b.py": "b = 20", "d.py": "d = 4"})
+    report = one.prepare_knowledge_base(verbose=False)
+    assert report.added_keys == [new_keys["b.py"], new_keys["d.py"]]
+    assert report.deleted_keys == sorted([keys["b.py"], keys["c.py"]])
+    assert len(one.embedding_model.documents) == 2
+    assert set(vectors) == set(bodies) == set(new_keys.values())
+    assert "b = 20" in bodies[new_keys["b.py"]]
+    assert one.load_s3vectors_manifest() == set(new_keys.values())
+
+    # without the manifest the indexed keys are listed from the index
+    path_enum.path_s3vectors_manifest_json.unlink()
+    one.embedding_model.documents.clear()
+    report = one.prepare_knowledge_base(verbose=False)
+    assert report.n_unchanged == 3
+    assert one.embedding_model.documents == []
+
+
+class FakeFetcher:
+    """
+    Stub of :meth:`RagMixin.read_chunk_content`, the first keys take the
+    longest, and ``"bad"`` fails.
+    """
+
+    def __init__(self, one: One):
+        self.one = one
+        self.keys = []
+
+    def __call__(self, key: str) -> str:
+        self.keys.append(key)
+        time.sleep(0.05 if key == "k1" else 0.0)
+        if key == "bad":
+            raise TimeoutError(key)
+        content = f"content of {key}"
+        self.one.chunk_cache.put(key, content)
+        return content
+
+
+@pytest.fixture
+def fetcher(one, monkeypatch) -> FakeFetcher:
+    one.settings.chunk_cache_on_disk = False
+    fetcher = FakeFetcher(one)
+    monkeypatch.setattr(one, "read_chunk_content", fetcher)
+    return fetcher
+
+
+def test_fetch_chunk_contents(one, fetcher):
+    keys = ["k1", "bad", "k2", "k3"]
+    assert one.fetch_chunk_contents(keys) == [
+        "content of k1",
+        None,
+        "content of k2",
+        "content of k3",
+    ]
+    # the cached chunks are not downloaded again, the failed one is
+    fetcher.keys.clear()
+    assert one.fetch_chunk_contents(["k3", "bad", "k1"]) == [
+        "content of k3",
+        None,
+        "content of k1",
+    ]
+    assert fetcher.keys == ["bad"]
+    assert one.fetch_chunk_contents([]) == []
+
+
+class FakeS3VectorIndex:
+    def __init__(self, vectors: list[types.SimpleNamespace]):
+        self.vectors = vectors
+
+    def query_vectors(self, **kwargs):
+        return types.SimpleNamespace(as_vector_objects=lambda klass: self.vectors)
+
+
+def test_retrieve_from_s3vectors_leaves_out_failed_chunks(one, fetcher):
+    one.__dict__["s3vectors_client"] = None
+    one.__dict__["vector_index"] = FakeS3VectorIndex(
+        [
+            types.SimpleNamespace(key="k1", text=None),
+            types.SimpleNamespace(key="k0", text="content of k0"),
+            types.SimpleNamespace(key="bad", text=None),
+            types.SimpleNamespace(key="k2", text=None),
+        ]
+    )
+    chunks = one.retrieve_from_s3vectors(np.zeros(4), top_k=4)
+    # hit order, the chunk whose download failed is left out
+    assert chunks == ["content of k1", "content of k0", "content of k2"]
+    # the chunk text stored as metadata is not downloaded
+    assert sorted(fetcher.keys) == ["bad", "k1", "k2"]
+
+
+def test_ann_index_is_rebuilt_when_the_settings_change(tmp_path, monkeypatch):
+    monkeypatch.setattr(path_enum, "dir_local_vector_index", tmp_path / "index")
+    monkeypatch.setattr(path_enum, "dir_ann_index", tmp_path / "ann_index")
+    rng = np.random.default_rng(0)
+    keys = [f"k{ith}" for ith in range(200)]
+    LocalVectorIndex(
+        keys=keys,
+        texts=[f"text of {key}" for key in keys],
+        embeddings=rng.normal(size=(len(keys), 32)),
+    ).dump(path_enum.dir_local_vector_index)
+
+    def new_one(**kwargs) -> tuple[One, list[IVFIndex]]:
+        one = One(settings=Settings(local_index_type="ivf", **kwargs))
+        built = []
+        build_ann_index = one.build_ann_index
+
+        def spy() -> IVFIndex:
+            built.append(build_ann_index())
+            return built[-1]
+
+        monkeypatch.setattr(one, "build_ann_index", spy)
+        return one, built
+
+    one, built = new_one(ann_n_lists=8)
+    assert one.ann_index.n_lists == 8
+    assert len(built) == 1
+    assert IVFIndex.exists(path_enum.dir_ann_index)
+
+    # the same settings load the dumped index
+    one, built = new_one(ann_n_lists=8, ann_n_probe=2)
+    assert one.ann_index.n_lists == 8
+    assert one.ann_index.n_probe == 2
+    assert built == []
+
+    # other build settings build it again
+    one, built = new_one(ann_n_lists=4)
+    assert one.ann_index.n_lists == 4
+    assert len(built) == 1
+    one, built = new_one(ann_n_lists=4, ann_quantization="pq", ann_pq_m=8)
+    assert one.ann_index.quantizer.kind == "pq"
+    assert len(built) == 1
+    one, built = new_one(ann_n_lists=4, ann_quantization="pq", ann_pq_m=4)
+    assert len(one.ann_index.quantizer.codebooks) == 4
+    assert len(built) == 1
+    one, built = new_one(ann_n_lists=4, ann_quantization="pq", ann_pq_m=4)
+    _ = one.ann_index
+    assert built == []
+
+
+if __name__ == "__main__":
+    from music_bi_agent_poc.tests import run_cov_test
+
+    run_cov_test(
+        __file__,
+        "music_bi_agent_poc.one.one_05_rag",
+        preview=False,
+    )
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+from music_bi_agent_poc.paths import path_enum
+from music_bi_agent_poc.routing import ROUTES
+from music_bi_agent_poc.route_classifier import (
+    LabelledQuery,
+    load_labelled_queries,
+    RoutePrediction,
+    NearestCentroidClassifier,
+    cross_validate,
+)
+
+
+def make_clusters(
+    routes: list[str],
+    n_per_route: int,
+    noise: float,
+    seed: int = 0,
+) -> tuple[np.ndarray, list[str]]:
+    """
+    Embeddings around one random direction per route.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(len(routes), 32))
+    embeddings = []
+    labels = []
+    for center, route in zip(centers, routes):
+        embeddings.append(center + noise * rng.normal(size=(n_per_route, 32)))
+        labels.extend([route] * n_per_route)
+    return np.concatenate(embeddings), labels
+
+
+def test_load_labelled_queries(tmp_path):
+    path = tmp_path / "queries.jsonl"
+    path.write_text(
+        '{"query": "hi", "route": "direct"}\n'
+        "\n"
+        '{"query": "top artists", "route": "sql"}\n'
+    )
+    assert load_labelled_queries(path) == [
+        LabelledQuery(query="hi", route="direct"),
+        LabelledQuery(query="top artists", route="sql"),
+    ]
+    path.write_text('{"query": "hi", "route": "smalltalk"}\n')
+    with pytest.raises(ValueError):
+        load_labelled_queries(path)
+
+
+def test_router_examples():
+    labelled_queries = load_labelled_queries(path_enum.path_prompts_router_examples)
+    assert {labelled_query.route for labelled_query in labelled_queries} <= set(ROUTES)
+
+
+def test_route_prediction():
+    prediction = RoutePrediction(route="sql", score=0.8, margin=0.1)
+    assert prediction.is_confident(min_score=0.5, min_margin=0.1) is True
+    assert prediction.is_confident(min_score=0.9, min_margin=0.0) is False
+    assert prediction.is_confident(min_score=0.0, min_margin=0.2) is False
+
+
+def test_fit_predict():
+    embeddings, routes = make_clusters(["sql", "knowledge", "direct"], 10, noise=0.1)
+    classifier = NearestCentroidClassifier.fit(embeddings, routes)
+    # centroids in the ROUTES order, with unit length
+    assert classifier.routes == ["direct", "sql", "knowledge"]
+    np.testing.assert_allclose(np.linalg.norm(classifier.centroids, axis=1), 1.0)
+    for embedding, route in zip(embeddings, routes):
+        prediction = classifier.predict(embedding)
+        assert prediction.route == route
+        assert prediction.score > 0.9
+        assert prediction.margin > 0.0
+    # the embedding scale doesn't matter
+    assert classifier.predict(embeddings[0] * 7).route == routes[0]
+
+
+def test_fit_one_route():
+    embeddings, routes = make_clusters(["sql"], 3, noise=0.1)
+    with pytest.raises(ValueError):
+        NearestCentroidClassifier.fit(embeddings, routes)
+
+
+def test_cross_validate():
+    embeddings, routes = make_clusters(["sql", "knowledge", "direct"], 8, noise=0.1)
+    row_0, row_1 = cross_validate(embeddings, routes, min_margins=[0.0, 10.0])
+    assert (row_0.coverage, row_0.accuracy) == (1.0, 1.0)
+    # every sql and knowledge question skips the router, none goes astray
+    assert row_0.skipped == pytest.approx(2 / 3)
+    assert row_0.wrong_dispatch == 0.0
+    assert row_0.get_seconds_saved(router_seconds=3.0) == pytest.approx(2.0)
+    # nothing is confident at an impossible margin
+    assert (row_1.coverage, row_1.accuracy, row_1.skipped) == (0.0, 1.0, 0.0)
+
+
+def test_cross_validate_holds_out_the_question():
+    # a "direct" copy of the first sql question: held out, it has no
+    # direct centroid left and goes to sql, while the sql question it
+    # copies exactly goes to the direct centroid
+    embeddings, routes = make_clusters(["sql", "knowledge"], 5, noise=0.1)
+    embeddings = np.concatenate([embeddings, embeddings[:1]])
+    routes = routes + ["direct"]
+    (row,) = cross_validate(embeddings, routes, min_margins=[0.0])
+    assert row.accuracy == pytest.approx(9 / 11)
+    # only the direct question was dispatched to a specialist by mistake
+    assert row.wrong_dispatch == pytest.approx(1 / 11)
+
+
+if __name__ == "__main__":
+    from music_bi_agent_poc.tests import run_cov_test
+
+    run_cov_test(
+        __file__,
+        "music_bi_agent_poc.route_classifier",
+        preview=False,
+    )
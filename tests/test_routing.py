@@ -0,0 +1,441 @@
+# -*- coding: utf-8 -*-
+
+import time
+import types
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import strands
+from strands.models import Model
+from strands.agent.conversation_manager import SlidingWindowConversationManager
+
+from music_bi_agent_poc.one.api import one
+from music_bi_agent_poc.agent import (
+    route,
+    route_async,
+    run_agent,
+    run_agent_async,
+    stream_agent_async,
+    stream_agent,
+    is_final_answer,
+    remember_answer,
+)
+from music_bi_agent_poc.routing import (
+    ToolCallRecorder,
+    RoutingDecision,
+    is_formatted_answer,
+    make_specialist_queries,
+)
+
+
+class ScriptedRouterModel(Model):
+    """
+    Calls ``sql_assistant`` for every question, except greetings which it
+    answers directly.
+    """
+
+    def update_config(self, **model_config):
+        pass
+
+    def get_config(self):
+        return {}
+
+    async def structured_output(self, *args, **kwargs):
+        raise NotImplementedError
+
+    async def stream(self, messages, tool_specs=None, system_prompt=None, **kwargs):
+        content = messages[-1]["content"][0]
+        yield {"messageStart": {"role": "assistant"}}
+        if "text" in content and "hello" not in content["text"]:
+            tool_use = {"toolUseId": f"t{len(messages)}", "name": "sql_assistant"}
+            yield {"contentBlockStart": {"start": {"toolUse": tool_use}}}
+            yield {"contentBlockDelta": {"delta": {"toolUse": {"input": '{"query": "q"}'}}}}
+            yield {"contentBlockStop": {}}
+            yield {"messageStop": {"stopReason": "tool_use"}}
+            return
+        yield {"contentBlockStart": {"start": {}}}
+        yield {"contentBlockDelta": {"delta": {"text": "answer"}}}
+        yield {"contentBlockStop": {}}
+        yield {"messageStop": {"stopReason": "end_turn"}}
+
+
+@strands.tool
+def sql_assistant(query: str) -> str:
+    """
+    Answer a question with SQL.
+
+    :param query: the question.
+    """
+    return "42"
+
+
+def make_agents(window_size: int) -> types.SimpleNamespace:
+    router_agent = strands.Agent(
+        model=ScriptedRouterModel(),
+        conversation_manager=SlidingWindowConversationManager(
+            window_size=window_size,
+            should_truncate_results=False,
+        ),
+        callback_handler=None,
+        tools=[sql_assistant],
+        hooks=[ToolCallRecorder()],
+    )
+    return types.SimpleNamespace(router_agent=router_agent)
+
+
+def test_route_beyond_conversation_window():
+    window_size = 6
+    agents = make_agents(window_size)
+    for _ in range(window_size + 2):
+        decision = route("Which genre sells best?", agents)
+        assert decision.tools == ["sql_assistant"]
+        assert decision.is_final() is False
+    # the history was trimmed, the tool calls were still found
+    assert len(agents.router_agent.messages) <= window_size
+    decision = route("hello", agents)
+    assert decision.tools == []
+    assert decision.is_final() is True
+
+
+def test_route_async_beyond_conversation_window():
+    window_size = 6
+    agents = make_agents(window_size)
+    for _ in range(window_size + 2):
+        decision = asyncio.run(route_async("Which genre sells best?", agents))
+        assert decision.tools == ["sql_assistant"]
+    assert len(agents.router_agent.messages) <= window_size
+
+
+class SlowRouterAgent:
+    """
+    Answers directly after a while, and records how many calls overlapped.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def __call__(self, user_input, invocation_state):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.02)
+        with self.lock:
+            self.running -= 1
+        return f"answer to {user_input}"
+
+
+def test_run_agent_without_session_is_serialized(monkeypatch):
+    router_agent = SlowRouterAgent()
+    monkeypatch.setitem(one.__dict__, "router_agent", router_agent)
+    monkeypatch.setattr(one.settings, "answer_cache_enabled", False)
+    monkeypatch.setattr(one.settings, "route_classifier_enabled", False)
+    monkeypatch.setattr(one.settings, "skip_report_when_direct", True)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        answers = list(executor.map(run_agent, [f"q{ith}" for ith in range(8)]))
+    assert answers == [f"answer to q{ith}" for ith in range(8)]
+    # the shared router conversation is never used by two requests at once
+    assert router_agent.max_running == 1
+
+
+def test_route_records_failed_assistants(monkeypatch):
+    def ask_sql_agent(query):
+        raise RuntimeError("database is down")
+
+    monkeypatch.setattr(one, "ask_sql_agent", ask_sql_agent)
+    router_agent = strands.Agent(
+        model=ScriptedRouterModel(),
+        callback_handler=None,
+        tools=[one.sql_assistant],
+        hooks=[ToolCallRecorder()],
+    )
+    agents = types.SimpleNamespace(router_agent=router_agent)
+    decision = route("Which genre sells best?", agents)
+    # the scripted router answer says nothing about the failure
+    assert decision.answer.strip() == "answer"
+    assert decision.failed_assistants == ["sql_assistant"]
+    assert decision.failed is True
+    assert decision.is_final(skip_formatted=True) is False
+
+    monkeypatch.setattr(one, "ask_sql_agent", lambda query: "## 42")
+    decision = asyncio.run(route_async("Which genre sells best?", agents))
+    assert decision.tools == ["sql_assistant"]
+    assert decision.failed is False
+
+
+def test_run_agent_failed_assistant(monkeypatch):
+    def ask_sql_agent(query):
+        raise TimeoutError()
+
+    stored = []
+    monkeypatch.setattr(one, "ask_sql_agent", ask_sql_agent)
+    monkeypatch.setitem(
+        one.__dict__,
+        "router_agent",
+        strands.Agent(
+            model=ScriptedRouterModel(),
+            callback_handler=None,
+            tools=[one.sql_assistant],
+            hooks=[ToolCallRecorder()],
+        ),
+    )
+    monkeypatch.setitem(one.__dict__, "report_agent", lambda prompt: "report")
+    monkeypatch.setattr(one.settings, "answer_cache_enabled", True)
+    monkeypatch.setattr(one.settings, "route_classifier_enabled", False)
+    monkeypatch.setattr(one.settings, "skip_report_when_direct", True)
+    monkeypatch.setattr(one.settings, "skip_report_when_formatted", True)
+    monkeypatch.setattr(one, "get_cached_answer", lambda user_input: None)
+    monkeypatch.setattr(
+        one, "put_cached_answer", lambda *args: stored.append(args)
+    )
+    # the report agent writes the answer, and it is not cached
+    assert run_agent("Which genre sells best?") == "report"
+    assert stored == []
+
+
+def test_run_agent_without_session_follow_up(monkeypatch):
+    lookups = []
+
+    def get_cached_answer(user_input):
+        lookups.append(user_input)
+        return types.SimpleNamespace(answer="cached")
+
+    monkeypatch.setitem(
+        one.__dict__,
+        "router_agent",
+        strands.Agent(model=ScriptedRouterModel(), callback_handler=None),
+    )
+    monkeypatch.setattr(one.settings, "answer_cache_enabled", True)
+    monkeypatch.setattr(one.settings, "route_classifier_enabled", False)
+    monkeypatch.setattr(one.settings, "skip_report_when_direct", True)
+    monkeypatch.setattr(one, "get_cached_answer", get_cached_answer)
+    monkeypatch.setattr(one, "put_cached_answer", lambda *args: None)
+    assert run_agent("hello") == "cached"
+    # the shared conversation is no longer empty, a follow up question may
+    # depend on it and must not be answered from the cache
+    assert run_agent("hello, and in 2012?").strip() == "answer"
+    assert lookups == ["hello"]
+
+
+class ChunkedReportModel(Model):
+    """
+    Streams a fixed answer chunk by chunk, optionally fails after the first
+    chunk, and records how many calls overlapped.
+    """
+
+    def __init__(self, chunks: list[str], fail: bool = False):
+        self.chunks = chunks
+        self.fail = fail
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def update_config(self, **model_config):
+        pass
+
+    def get_config(self):
+        return {}
+
+    async def structured_output(self, *args, **kwargs):
+        raise NotImplementedError
+
+    async def stream(self, messages, tool_specs=None, system_prompt=None, **kwargs):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            yield {"messageStart": {"role": "assistant"}}
+            yield {"contentBlockStart": {"start": {}}}
+            for chunk in self.chunks:
+                await asyncio.sleep(0.01)
+                yield {"contentBlockDelta": {"delta": {"text": chunk}}}
+                if self.fail:
+                    raise RuntimeError("model is down")
+            yield {"contentBlockStop": {}}
+            yield {"messageStop": {"stopReason": "end_turn"}}
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+@pytest.fixture
+def session(monkeypatch):
+    """
+    A session whose router answers greetings directly, and whose report
+    agent streams ``"The answer is 42."`` in chunks.
+    """
+    monkeypatch.setattr(one.settings, "answer_cache_enabled", False)
+    monkeypatch.setattr(one.settings, "route_classifier_enabled", False)
+    monkeypatch.setattr(one.settings, "skip_report_when_direct", False)
+    session = one.get_session("test_routing")
+    session.__dict__["router_agent"] = strands.Agent(
+        model=ScriptedRouterModel(),
+        callback_handler=None,
+    )
+    session.__dict__["report_agent"] = strands.Agent(
+        model=ChunkedReportModel(["The ", "answer ", "is 42."]),
+        callback_handler=None,
+    )
+    yield session
+    one.end_session(session.session_id)
+
+
+def test_run_agent_async(session):
+    answer = asyncio.run(run_agent_async("hello", session.session_id))
+    assert answer.strip() == "The answer is 42."
+    assert len(session.router_agent.messages) == 2
+
+
+def test_stream_agent_async(session):
+    async def collect():
+        return [
+            chunk async for chunk in stream_agent_async("hello", session.session_id)
+        ]
+
+    assert asyncio.run(collect()) == ["The ", "answer ", "is 42."]
+    assert list(stream_agent("hello", session.session_id)) == [
+        "The ",
+        "answer ",
+        "is 42.",
+    ]
+
+
+def test_stream_agent_error(session):
+    session.__dict__["report_agent"] = strands.Agent(
+        model=ChunkedReportModel(["The ", "answer"], fail=True),
+        callback_handler=None,
+    )
+    chunks = []
+    with pytest.raises(RuntimeError, match="model is down"):
+        for chunk in stream_agent("hello", session.session_id):
+            chunks.append(chunk)
+    assert chunks == ["The "]
+    # the session is usable again
+    assert session.lock.locked() is False
+
+
+def test_concurrent_requests_of_a_session(session):
+    report_model = session.report_agent.model
+
+    async def main():
+        return await asyncio.gather(
+            *[run_agent_async("hello", session.session_id) for _ in range(3)]
+        )
+
+    answers = asyncio.run(main())
+    assert [answer.strip() for answer in answers] == ["The answer is 42."] * 3
+    assert report_model.max_running == 1
+    assert len(session.router_agent.messages) == 6
+
+    # stream_agent runs every call on an event loop of its own
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [
+            executor.submit(lambda: "".join(stream_agent("hello", session.session_id)))
+            for _ in range(3)
+        ]
+        assert [future.result() for future in futures] == ["The answer is 42."] * 3
+    assert report_model.max_running == 1
+    assert len(session.router_agent.messages) == 12
+
+
+def test_remember_answer_in_window_and_session(monkeypatch):
+    window_size = 6
+    monkeypatch.setattr(one.settings, "conversation_window_size", window_size)
+    monkeypatch.setitem(one.__dict__, "model", ScriptedRouterModel())
+    session_1, session_2 = one.get_session("test_1"), one.get_session("test_2")
+    try:
+        for ith in range(window_size):
+            remember_answer(session_1, f"q{ith}", f"a{ith}")
+        # trimmed to the window, the last question is kept
+        messages = session_1.router_agent.messages
+        assert len(messages) <= window_size
+        assert messages[-2:] == [
+            {"role": "user", "content": [{"text": f"q{window_size - 1}"}]},
+            {"role": "assistant", "content": [{"text": f"a{window_size - 1}"}]},
+        ]
+        # the other session and the shared conversation are left alone
+        assert session_2.router_agent.messages == []
+        assert session_2.router_agent is not session_1.router_agent
+        assert one.get_session("test_1").router_agent.messages == messages
+        if "router_agent" in one.__dict__:
+            assert one.router_agent.messages is not messages
+    finally:
+        one.end_session("test_1")
+        one.end_session("test_2")
+
+
+def test_routing_decision():
+    decision = RoutingDecision(answer="Hi!")
+    assert decision.delegated is False
+    assert decision.is_final() is True
+
+    decision = RoutingDecision(answer="| a |\n|---|\n| 1 |", tools=["sql_assistant"])
+    assert decision.specialists == ["sql_assistant"]
+    assert decision.is_final() is False
+    assert decision.is_final(skip_formatted=True) is True
+
+    decision = RoutingDecision(answer="plain text", tools=["sql_assistant"])
+    assert decision.is_final(skip_formatted=True) is False
+
+    decision = RoutingDecision(
+        answer="## sql_assistant\n| a |\n|---|\n| 1 |",
+        tools=["hybrid_assistant"],
+    )
+    assert decision.is_final(skip_formatted=True) is False
+
+    # the recorded failures count, not the router wording
+    decision = RoutingDecision(
+        answer="## Results\n| a |\n|---|\n| 1 |",
+        tools=["sql_assistant"],
+        failed_assistants=["sql_assistant"],
+    )
+    assert decision.failed is True
+    assert decision.is_final(skip_formatted=True) is False
+
+
+def test_is_formatted_answer():
+    assert is_formatted_answer("## Top genres\nRock leads.")
+    assert is_formatted_answer("| genre | revenue |\n|---|---:|\n| Rock | 826.65 |")
+    assert is_formatted_answer("Top:\n- Rock\n- Latin\n- Metal")
+    assert is_formatted_answer("1. Rock\n2. Latin\n3. Metal")
+    assert not is_formatted_answer("Rock is the best selling genre.")
+    assert not is_formatted_answer("- Rock\n- Latin")
+    assert not is_formatted_answer("#hashtag, not a heading")
+
+
+def test_is_final_answer(monkeypatch):
+    direct = RoutingDecision(answer="Hi!")
+    formatted = RoutingDecision(answer="## Result\n42", tools=["sql_assistant"])
+    monkeypatch.setattr(one.settings, "skip_report_when_direct", False)
+    monkeypatch.setattr(one.settings, "skip_report_when_formatted", True)
+    assert is_final_answer(direct) is False
+    assert is_final_answer(formatted) is False
+    monkeypatch.setattr(one.settings, "skip_report_when_direct", True)
+    assert is_final_answer(direct) is True
+    assert is_final_answer(formatted) is True
+    monkeypatch.setattr(one.settings, "skip_report_when_formatted", False)
+    assert is_final_answer(direct) is True
+    assert is_final_answer(formatted) is False
+
+
+def test_make_specialist_queries():
+    assert list(make_specialist_queries("sql", "q")) == ["sql_assistant"]
+    assert list(make_specialist_queries("knowledge", "q")) == ["knowledge_assistant"]
+    assert list(make_specialist_queries("hybrid", "q")) == [
+        "sql_assistant",
+        "knowledge_assistant",
+    ]
+    assert make_specialist_queries("direct", "q") == {}
+
+
+if __name__ == "__main__":
+    from music_bi_agent_poc.tests import run_cov_test
+
+    run_cov_test(
+        __file__,
+        "music_bi_agent_poc.routing",
+        preview=False,
+    )
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+import sqlite3
+
+import pytest
+import sqlalchemy as sa
+
+from music_bi_agent_poc.sql_execution import (
+    QueryTimeoutError,
+    paginate,
+    execute_select_page,
+    make_query_digest,
+    make_cursor,
+    parse_cursor,
+    format_page,
+    format_select_result,
+)
+
+
+def test_paginate():
+    consumed = []
+
+    def rows():
+        for ith in range(100):
+            consumed.append(ith)
+            yield (ith, str(ith))
+
+    page = paginate(["a", "b"], rows(), offset=10, max_rows=5)
+    assert page.rows == [[ith, str(ith)] for ith in range(10, 15)]
+    assert page.has_more is True
+    assert page.next_offset == 15
+    # one extra row to know there are more, nothing after it
+    assert len(consumed) == 16
+
+    page = paginate(["a"], iter([(1,), (2,)]), offset=0, max_rows=2)
+    assert (page.rows, page.has_more) == ([[1], [2]], False)
+    page = paginate(["a"], iter([(1,), (2,)]), offset=5, max_rows=2)
+    assert (page.rows, page.has_more) == ([], False)
+
+
+def test_cursor():
+    digest = make_query_digest("SELECT 1", "")
+    assert len(digest) == 16
+    assert digest != make_query_digest("SELECT 2", "")
+    cursor = make_cursor(digest, 200)
+    assert parse_cursor(cursor) == (digest, 200)
+    assert parse_cursor(f' "{cursor}" ') == (digest, 200)
+    assert parse_cursor("not a cursor") is None
+    assert parse_cursor(f"{digest}:-1") is None
+
+
+def test_format_page():
+    page = paginate(["a"], iter([(1,), (2,), (3,)]), offset=0, max_rows=2)
+    text = format_page(page)
+    assert "Showing rows 1 to 2, more rows are available." in text
+    assert "Add a LIMIT" in text
+    text = format_page(page, cursor="0123456789abcdef:2")
+    assert 'fetch_more_rows(cursor="0123456789abcdef:2")' in text
+    page = paginate(["a"], iter([]), offset=0, max_rows=2)
+    assert format_page(page) == "No result"
+
+
+@pytest.fixture
+def engine(tmp_path):
+    path = tmp_path / "test.sqlite"
+    with sqlite3.connect(path) as connection:
+        connection.execute("CREATE TABLE t (id INTEGER PRIMARY KEY)")
+        connection.executemany("INSERT INTO t VALUES (?)", [(i,) for i in range(50)])
+    engine = sa.create_engine(f"sqlite:///{path}")
+    yield engine
+    engine.dispose()
+
+
+def test_execute_select_page(engine):
+    page = execute_select_page(
+        engine,
+        sql="SELECT id FROM t WHERE id >= :start ORDER BY id",
+        params={"start": 10},
+        offset=20,
+        max_rows=15,
+        timeout=10,
+    )
+    assert page.columns == ["id"]
+    assert page.rows == [[ith] for ith in range(30, 45)]
+    assert page.has_more is True
+
+
+def test_execute_select_page_timeout(engine):
+    # a cross join of 50^5 rows, aggregated, never ends in time
+    sql = "SELECT COUNT(*) FROM t a, t b, t c, t d, t e"
+    with pytest.raises(QueryTimeoutError):
+        execute_select_page(engine, sql, None, offset=0, max_rows=10, timeout=0.2)
+    # the connection is usable again, without a deadline
+    page = execute_select_page(
+        engine, "SELECT COUNT(*) FROM t", None, offset=0, max_rows=10, timeout=0
+    )
+    assert page.rows == [[50]]
+
+
+def test_format_select_result():
+    text = format_select_result(duration=1.23456, query_result_text="| a |")
+    assert text == "# Execution Time\n1.235 seconds\n\n# Query Result\n| a |"
+    text = format_select_result(duration=0.0001, query_result_text="| a |", cached=True)
+    assert text.splitlines()[1] == "0.000 seconds (cached result, the query was not run)"
+
+
+def test_cached_select_statement_timing():
+    from music_bi_agent_poc.one.api import one
+
+    database_identifier = one.get_chinook_database_identifier()
+    sql = "SELECT GenreId, Name FROM Genre ORDER BY GenreId LIMIT 3"
+    first = one.execute_cached_select_statement(database_identifier, sql)
+    second = one.execute_cached_select_statement(database_identifier, sql)
+    assert "cached result" not in first
+    # same rows, the timing of the first run is not replayed
+    assert "(cached result, the query was not run)" in second.splitlines()[1]
+    assert first.split("# Query Result")[1] == second.split("# Query Result")[1]
+
+
+if __name__ == "__main__":
+    from music_bi_agent_poc.tests import run_cov_test
+
+    run_cov_test(
+        __file__,
+        "music_bi_agent_poc.sql_execution",
+        preview=False,
+    )
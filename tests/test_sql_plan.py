@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+import sqlite3
+
+import pytest
+import sqlalchemy as sa
+
+from music_bi_agent_poc.sql_plan import (
+    get_table_stats,
+    get_table_aliases,
+    explain_query_plan,
+    check_query_plan,
+    is_unfiltered_aggregate,
+    fingerprint_sql,
+    QueryAdvisor,
+    create_indexed_copy,
+)
+from music_bi_agent_poc.sql_shape import tokenize
+
+
+@pytest.fixture
+def path_db(tmp_path):
+    path = tmp_path / "test.sqlite"
+    with sqlite3.connect(path) as connection:
+        connection.executescript(
+            """
+            CREATE TABLE Genre (GenreId INTEGER PRIMARY KEY, Name TEXT);
+            CREATE TABLE Track (
+                TrackId INTEGER PRIMARY KEY, Name TEXT, GenreId INTEGER
+            );
+            CREATE TABLE InvoiceLine (
+                InvoiceLineId INTEGER PRIMARY KEY,
+                TrackId INTEGER,
+                UnitPrice REAL,
+                Quantity INTEGER
+            );
+            """
+        )
+        connection.executemany(
+            "INSERT INTO Genre VALUES (?, ?)", [(i, f"g{i}") for i in range(5)]
+        )
+        connection.executemany(
+            "INSERT INTO Track VALUES (?, ?, ?)",
+            [(i, f"t{i}", i % 5) for i in range(200)],
+        )
+        connection.executemany(
+            "INSERT INTO InvoiceLine VALUES (?, ?, ?, ?)",
+            [(i, i % 200, 0.99, 1 + i % 3) for i in range(2000)],
+        )
+    return path
+
+
+def check(path_db, sql: str, min_rows: int = 1000):
+    engine = sa.create_engine(f"sqlite:///{path_db}")
+    try:
+        with engine.connect() as connection:
+            steps = explain_query_plan(connection, sql)
+            table_stats = get_table_stats(connection.connection.dbapi_connection)
+    finally:
+        engine.dispose()
+    return check_query_plan(
+        steps=steps,
+        sql=sql,
+        row_counts=table_stats.row_counts,
+        min_rows=min_rows,
+    )
+
+
+def test_get_table_aliases():
+    tokens = tokenize(
+        "SELECT * FROM InvoiceLine il JOIN Track AS t ON il.TrackId = t.TrackId, "
+        '"Genre" WHERE 1'
+    )
+    assert get_table_aliases(tokens) == {
+        "invoiceline": "invoiceline",
+        "il": "invoiceline",
+        "track": "track",
+        "t": "track",
+        "genre": "genre",
+    }
+
+
+def test_warn_filtered_full_scan(path_db):
+    plan_check = check(path_db, "SELECT * FROM InvoiceLine WHERE Quantity > 1")
+    assert [scan.table for scan in plan_check.full_scans] == ["invoiceline"]
+    assert plan_check.expected is False
+    assert plan_check.is_ok is False
+    assert "invoiceline (2000 rows)" in plan_check.format_warning()
+
+
+def test_no_warning_for_unfiltered_aggregate(path_db):
+    sql = """
+    SELECT g.Name, ROUND(SUM(il.UnitPrice * il.Quantity), 2) AS Revenue
+    FROM InvoiceLine il
+    JOIN Track t ON il.TrackId = t.TrackId
+    JOIN Genre g ON t.GenreId = g.GenreId
+    GROUP BY g.Name
+    ORDER BY Revenue DESC
+    """
+    plan_check = check(path_db, sql)
+    # still recorded for the index advisor, but not a warning
+    assert "invoiceline" in [scan.table for scan in plan_check.full_scans]
+    assert plan_check.expected is True
+    assert plan_check.is_ok is True
+
+
+def test_no_warning(path_db):
+    # small table
+    assert check(path_db, "SELECT * FROM Track WHERE Name = 'x'").is_ok
+    # primary key lookup
+    assert check(path_db, "SELECT * FROM InvoiceLine WHERE InvoiceLineId = 3").is_ok
+
+
+def test_is_unfiltered_aggregate():
+    def f(sql: str) -> bool:
+        return is_unfiltered_aggregate(tokenize(sql))
+
+    assert f("SELECT COUNT(*) FROM InvoiceLine") is True
+    assert f("SELECT TrackId, Quantity FROM InvoiceLine GROUP BY 1, 2") is True
+    assert f("SELECT COUNT(*) FROM InvoiceLine WHERE Quantity > 1") is False
+    assert f("SELECT * FROM InvoiceLine") is False
+    # a column named like an aggregate function
+    assert f('SELECT "count" FROM t') is False
+
+
+def test_fingerprint_sql():
+    assert fingerprint_sql(
+        "SELECT * FROM Track WHERE Name = 'a' -- c\n AND GenreId = 1;"
+    ) == fingerprint_sql("select *  from track where name = 'b' and genreid = 2")
+
+
+def test_query_advisor(path_db, tmp_path):
+    sql = "SELECT TrackId FROM InvoiceLine WHERE Quantity = 2"
+    plan_check = check(path_db, sql)
+    advisor = QueryAdvisor(slow_seconds=0.5)
+    advisor.record(sql, seconds=0.1, full_scans=plan_check.full_scans)
+    assert advisor.top() == []
+    advisor.record(sql, seconds=1.0, full_scans=plan_check.full_scans)
+    advisor.record(sql, seconds=2.0, full_scans=plan_check.full_scans)
+    (slow_query,) = advisor.top()
+    assert (slow_query.count, slow_query.total_seconds) == (2, 3.0)
+
+    with sqlite3.connect(path_db) as connection:
+        table_stats = get_table_stats(connection)
+    (proposal,) = advisor.propose_indexes(table_stats)
+    assert proposal.table == "invoiceline"
+    assert proposal.columns == ["quantity", "trackid"]
+
+    path_indexed = create_indexed_copy(path_db, tmp_path / "indexed.sqlite", [proposal])
+    assert check(path_indexed, sql).is_ok
+
+
+if __name__ == "__main__":
+    from music_bi_agent_poc.tests import run_cov_test
+
+    run_cov_test(
+        __file__,
+        "music_bi_agent_poc.sql_plan",
+        preview=False,
+    )
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+from music_bi_agent_poc.sql_query import (
+    normalize_sql,
+    make_params_key,
+    is_error_result,
+)
+
+
+def test_normalize_sql():
+    assert normalize_sql(
+        "SELECT  a ,b\nFROM t -- comment\nWHERE ( x = 1 ) ;;"
+    ) == normalize_sql("SELECT a, b FROM t /* other comment */ WHERE (x = 1)")
+    assert normalize_sql("SELECT a,  b FROM t;") == "SELECT a,b FROM t"
+    # the case shows up in the result column names, it is kept
+    assert normalize_sql("SELECT Name FROM t") != normalize_sql("select name from t")
+
+
+def test_normalize_sql_keeps_literals():
+    assert normalize_sql("SELECT 'a  b -- c' FROM t") == "SELECT 'a  b -- c' FROM t"
+    assert normalize_sql('SELECT "my  col" FROM t') == 'SELECT "my  col" FROM t'
+    assert normalize_sql("SELECT 'a' FROM t") != normalize_sql("SELECT 'A' FROM t")
+    assert normalize_sql("SELECT 1 - 1") == "SELECT 1 - 1"
+    assert normalize_sql("SELECT 4 / 2") == "SELECT 4 / 2"
+
+
+def test_make_params_key():
+    assert make_params_key(None) == make_params_key({}) == ""
+    assert make_params_key({"a": 1, "b": 2}) == make_params_key({"b": 2, "a": 1})
+    assert make_params_key({"a": 1}) != make_params_key({"a": "1"})
+
+
+def test_is_error_result():
+    assert is_error_result("Error: no such table")
+    assert is_error_result("# Query Result\nError: syntax error")
+    assert not is_error_result("# Query Result\n| a |\n|---|\n| 1 |")
+
+
+if __name__ == "__main__":
+    from music_bi_agent_poc.tests import run_cov_test
+
+    run_cov_test(
+        __file__,
+        "music_bi_agent_poc.sql_query",
+        preview=False,
+    )
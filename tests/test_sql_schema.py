@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sqlite3
+from pathlib import Path
+
+import pytest
+from strands.models import Model
+
+from music_bi_agent_poc.paths import path_enum
+from music_bi_agent_poc.settings import Settings
+from music_bi_agent_poc.one.one_01_main import One
+from music_bi_agent_poc.sqlite_engine import make_sqlite_url
+from music_bi_agent_poc.sql_schema import (
+    get_sqlite_path,
+    get_file_version,
+    make_schema_digest,
+)
+
+
+def test_get_sqlite_path(tmp_path):
+    path = tmp_path / "a b.sqlite"
+    assert get_sqlite_path(make_sqlite_url(path)) == path
+    url = make_sqlite_url(path, read_only=True, immutable=True)
+    assert get_sqlite_path(url) == path
+    assert get_sqlite_path("sqlite:///relative/chinook.sqlite") == Path(
+        "relative/chinook.sqlite"
+    )
+    assert get_sqlite_path("sqlite://") is None
+    assert get_sqlite_path("sqlite:///:memory:") is None
+    assert get_sqlite_path("postgresql://user@localhost/db") is None
+
+
+def test_get_file_version(tmp_path):
+    path = tmp_path / "test.sqlite"
+    assert get_file_version(path) is None
+    path.write_bytes(b"x")
+    version = get_file_version(path)
+    assert len(version) == 2
+    path.with_name("test.sqlite-wal").write_bytes(b"xy")
+    assert get_file_version(path)[:2] == version
+    assert get_file_version(path)[3] == 2
+
+
+def test_make_schema_digest():
+    schema_details = """
+Schema default(
+  Table Album(
+    AlbumId:int*PK,
+    Title:str*NN,
+    ArtistId:int*FK->Artist.ArtistId,
+  )
+  View AlbumSalesStats(
+    AlbumId:int,
+    Sales:float,
+  )
+)
+"""
+    assert make_schema_digest(schema_details) == (
+        "Table Album(AlbumId:int*PK, Title:str*NN, ArtistId:int*FK->Artist.ArtistId)\n"
+        "View AlbumSalesStats(AlbumId:int, Sales:float)"
+    )
+    assert make_schema_digest("") == ""
+
+
+def touch(path: Path):
+    """
+    Make sure the file version changes even on a coarse mtime clock.
+    """
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2_000_000_000))
+
+
+class SilentModel(Model):
+    def update_config(self, **model_config):
+        pass
+
+    def get_config(self):
+        return {}
+
+    async def structured_output(self, *args, **kwargs):
+        raise NotImplementedError
+
+    async def stream(self, *args, **kwargs):
+        raise NotImplementedError
+        yield
+
+
+@pytest.fixture
+def one(tmp_path, monkeypatch) -> One:
+    path = tmp_path / "test.sqlite"
+    with sqlite3.connect(path) as connection:
+        connection.execute("CREATE TABLE Genre (GenreId INTEGER PRIMARY KEY, Name TEXT)")
+    monkeypatch.setattr(path_enum, "path_sqlite", path)
+    one = One(
+        settings=Settings(
+            sqlite_read_only=True,
+            sqlite_immutable=True,
+            sqlite_mmap_size=0,
+            sql_schema_in_prompt=True,
+        )
+    )
+    one.__dict__["model"] = SilentModel()
+    yield one
+    for database in one.ohmy_sql_config.databases:
+        database.connection.sa_engine.dispose()
+
+
+def add_table():
+    with sqlite3.connect(path_enum.path_sqlite) as connection:
+        connection.execute("CREATE TABLE Label (LabelId INTEGER PRIMARY KEY, Name TEXT)")
+    touch(path_enum.path_sqlite)
+
+
+def test_cached_schema_details(one, monkeypatch):
+    database_identifier = one.get_chinook_database_identifier()
+    calls = []
+    adapter_class = type(one.ohmy_sql_adapter)
+    tool_get_schema_details = adapter_class.tool_get_schema_details
+
+    def spy(self, **kwargs):
+        calls.append(kwargs)
+        return tool_get_schema_details(self, **kwargs)
+
+    # the adapter is a pydantic model, patch the method on its class
+    monkeypatch.setattr(adapter_class, "tool_get_schema_details", spy)
+    version = one.get_schema_version()
+    assert version == (get_file_version(path_enum.path_sqlite),)
+
+    schema_details = one.get_cached_schema_details(database_identifier)
+    assert "Table Genre(" in schema_details
+    assert "Label" not in schema_details
+    assert one.get_cached_schema_details(database_identifier) == schema_details
+    assert len(calls) == 1
+
+    add_table()
+    assert one.get_schema_version() != version
+    schema_details = one.get_cached_schema_details(database_identifier)
+    assert "Table Label(" in schema_details
+    assert len(calls) == 2
+    assert one.get_cached_schema_details(database_identifier) == schema_details
+    assert len(calls) == 2
+
+
+def test_refresh_sql_agent_system_prompt(one):
+    # nothing to refresh before the agent is built
+    one.refresh_sql_agent_system_prompt()
+    assert "sql_agent" not in one.__dict__
+
+    system_prompt = one.sql_agent.system_prompt
+    assert "Table Genre(GenreId:int*PK, Name:str)" in system_prompt
+    assert "Label" not in system_prompt
+    one.refresh_sql_agent_system_prompt()
+    assert one.sql_agent.system_prompt == system_prompt
+
+    add_table()
+    one.refresh_sql_agent_system_prompt()
+    assert "Table Label(LabelId:int*PK, Name:str)" in one.sql_agent.system_prompt
+    assert one.__dict__["sql_agent_schema_version"] == one.get_schema_version()
+
+
+def test_refresh_sql_agent_system_prompt_disabled(one):
+    one.settings.sql_schema_in_prompt = False
+    system_prompt = one.sql_agent.system_prompt
+    assert "## Database Schema" not in system_prompt
+    add_table()
+    one.refresh_sql_agent_system_prompt()
+    assert one.sql_agent.system_prompt == system_prompt
+
+
+if __name__ == "__main__":
+    from music_bi_agent_poc.tests import run_cov_test
+
+    run_cov_test(
+        __file__,
+        "music_bi_agent_poc.sql_schema",
+        preview=False,
+    )
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from music_bi_agent_poc.sql_shape import (
+    tokenize,
+    parse_aggregate_query,
+    canonical_expression,
+)
+
+COLUMNS_BY_TABLE = {
+    "invoiceline": {"invoicelineid", "invoiceid", "trackid", "unitprice", "quantity"},
+    "track": {"trackid", "name", "albumid", "genreid", "unitprice"},
+    "genre": {"genreid", "name"},
+}
+
+
+def parse(sql: str):
+    return parse_aggregate_query(sql, COLUMNS_BY_TABLE)
+
+
+def test_tokenize():
+    tokens = tokenize("SELECT 'it''s' -- comment\n, \"Na me\" /* c */ FROM t;")
+    assert [token.kind for token in tokens] == [
+        "word",
+        "string",
+        "punct",
+        "quoted",
+        "word",
+        "word",
+        "punct",
+    ]
+    assert tokens[3].value == "na me"
+
+
+def test_parse():
+    query = parse(
+        """
+        SELECT g.Name AS Genre, ROUND(SUM(il.UnitPrice * il.Quantity), 2) Revenue
+        FROM InvoiceLine il
+        INNER JOIN Track t ON il.TrackId = t.TrackId
+        JOIN Genre AS g ON t.GenreId = g.GenreId
+        GROUP BY g.Name
+        ORDER BY Revenue DESC
+        LIMIT 5;
+        """
+    )
+    assert query.tables == ["invoiceline", "track", "genre"]
+    assert query.joins == [
+        ("invoiceline.trackid", "track.trackid"),
+        ("track.genreid", "genre.genreid"),
+    ]
+    assert [item.name for item in query.select] == ["Genre", "Revenue"]
+    assert query.select[0].expr == "genre.name"
+    assert query.select[1].expr == (
+        "round ( sum ( invoiceline.unitprice * invoiceline.quantity ) , 2 )"
+    )
+    assert query.group_by == ["genre.name"]
+    assert query.order_by[0].expr == query.select[1].expr
+    assert query.order_by[0].descending is True
+    assert query.limit == 5
+
+
+def test_same_shape():
+    # aliases, case and whitespace don't change the shape
+    query_1 = parse(
+        "SELECT g.Name, COUNT(*) FROM Track t JOIN Genre g "
+        "ON t.GenreId = g.GenreId GROUP BY g.Name"
+    )
+    query_2 = parse(
+        "select genre.name,count(*) from track join genre "
+        "on track.genreid=genre.genreid group by 1"
+    )
+    assert query_1.select[0].expr == query_2.select[0].expr
+    assert query_1.select[1].expr == query_2.select[1].expr
+    assert query_1.group_by == query_2.group_by
+    # the result column name is the text SQLite reports
+    assert [item.name for item in query_1.select] == ["Name", "COUNT(*)"]
+
+
+def test_order_by_alias_and_ordinal():
+    sql = (
+        "SELECT GenreId, COUNT(DISTINCT AlbumId) AS n_albums FROM Track "
+        "GROUP BY GenreId ORDER BY {}"
+    )
+    by_alias = parse(sql.format("n_albums DESC"))
+    by_ordinal = parse(sql.format("2 DESC"))
+    assert by_alias.order_by == by_ordinal.order_by
+    assert by_alias.order_by[0].expr == "count ( distinct track.albumid )"
+    assert parse(sql.format("3")) is None
+
+
+def test_group_by_prefers_column_over_alias():
+    # "name" is both a column and the alias of another select item
+    query = parse("SELECT GenreId AS name, COUNT(*) FROM Genre GROUP BY name")
+    assert query.group_by == ["genre.name"]
+
+
+def test_canonical_expression():
+    assert canonical_expression(
+        "SUM(InvoiceLine.UnitPrice * InvoiceLine.Quantity)", COLUMNS_BY_TABLE
+    ) == parse(
+        "SELECT SUM(il.UnitPrice * il.Quantity) FROM InvoiceLine il GROUP BY TrackId"
+    ).select[0].expr
+
+
+@pytest.mark.parametrize(
+    "sql",
+    [
+        "SELECT GenreId, COUNT(*) FROM Track WHERE GenreId > 1 GROUP BY GenreId",
+        "SELECT GenreId, COUNT(*) FROM Track GROUP BY GenreId HAVING COUNT(*) > 1",
+        "SELECT GenreId, COUNT(*) FROM Track GROUP BY GenreId LIMIT 5 OFFSET 5",
+        "SELECT GenreId, COUNT(*) FROM Track GROUP BY GenreId LIMIT 5, 5",
+        "SELECT g.Name, COUNT(*) FROM Track t LEFT JOIN Genre g "
+        "ON t.GenreId = g.GenreId GROUP BY g.Name",
+        "SELECT g.Name, COUNT(*) FROM Track t, Genre g GROUP BY g.Name",
+        "SELECT g.Name, COUNT(*) FROM Track t JOIN Genre g "
+        "ON t.GenreId = g.GenreId AND t.TrackId > 1 GROUP BY g.Name",
+        "SELECT t.Name, COUNT(*) FROM Track t JOIN Track t2 "
+        "ON t.TrackId = t2.TrackId GROUP BY t.Name",
+        "SELECT DISTINCT GenreId FROM Track",
+        "SELECT * FROM Track",
+        "SELECT GenreId, COUNT(*) FROM Track WHERE GenreId = :genre GROUP BY GenreId",
+        "SELECT GenreId FROM (SELECT GenreId FROM Track) GROUP BY GenreId",
+        "SELECT Name FROM Track; DELETE FROM Track",
+        # ambiguous column
+        "SELECT Name, COUNT(*) FROM Track t JOIN Genre g "
+        "ON t.GenreId = g.GenreId GROUP BY Name",
+        "SELECT unknown_column FROM Track",
+        "WITH x AS (SELECT 1) SELECT * FROM x",
+    ],
+)
+def test_unsupported(sql: str):
+    assert parse(sql) is None
+
+
+if __name__ == "__main__":
+    from music_bi_agent_poc.tests import run_cov_test
+
+    run_cov_test(
+        __file__,
+        "music_bi_agent_poc.sql_shape",
+        preview=False,
+    )
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+import sqlite3
+
+import pytest
+
+from music_bi_agent_poc.paths import path_enum
+from music_bi_agent_poc.sql_templates import (
+    TEMPLATES,
+    extract_question,
+    tokenize,
+    match_sql_template,
+    format_template_answer,
+)
+
+
+def test_extract_question():
+    query = (
+        "Run SQL if needed: 'Who are our top customers?'. "
+        "Use your available tools to answer."
+    )
+    assert extract_question(query) == "'Who are our top customers?'."
+    assert extract_question("Who are our top customers?") == (
+        "Who are our top customers?"
+    )
+
+
+def test_tokenize():
+    assert tokenize("Top-5 artist's sales in 2012?") == [
+        "top",
+        "5",
+        "artist",
+        "s",
+        "sales",
+        "in",
+        "2012",
+    ]
+
+
+@pytest.mark.parametrize(
+    "question, name, limit, year",
+    [
+        ("Who are our top customers?", "top_customers_by_revenue", 10, None),
+        ("Top 5 artists by revenue", "top_artists_by_revenue", 5, None),
+        ("What are the five best selling albums?", "top_albums_by_revenue", 5, None),
+        ("Show the 3 best selling tracks in 2012", "top_tracks_by_revenue", 3, "2012"),
+        ("How does each genre perform?", "genre_performance", -1, None),
+        ("Sales by country in 2010", "sales_by_country", -1, "2010"),
+        ("Monthly revenue trend", "monthly_revenue", -1, None),
+        ("What is our total revenue per year?", "yearly_revenue", -1, None),
+    ],
+)
+def test_match(question: str, name: str, limit: int, year: str):
+    match = match_sql_template(question)
+    assert match is not None
+    assert match.template.name == name
+    assert match.params == {"limit": limit, "year": year}
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        # a filter the template can't honour
+        "Top customers in USA",
+        "Best selling tracks of the Rock genre",
+        # no sales measure
+        "List all artists",
+        # two dimensions
+        "Sales by genre and country",
+        # no dimension
+        "What is our total revenue?",
+        # a number that is neither a limit nor a year
+        "Artists with more than 5 sales",
+        # a top N limit on a time series
+        "Top 3 months by revenue",
+        "Top 0 artists by revenue",
+        "",
+    ],
+)
+def test_no_match(question: str):
+    assert match_sql_template(question) is None
+
+
+@pytest.mark.parametrize("template", TEMPLATES, ids=lambda template: template.name)
+def test_templates_run(template):
+    uri = f"{path_enum.path_sqlite.absolute().as_uri()}?mode=ro"
+    with sqlite3.connect(uri, uri=True) as connection:
+        rows = connection.execute(template.sql, {"limit": 3, "year": "2010"}).fetchall()
+        assert 0 < len(rows) <= 3
+        all_rows = connection.execute(template.sql, {"limit": -1, "year": None}).fetchall()
+        assert len(all_rows) >= len(rows)
+
+
+def test_format_template_answer():
+    match = match_sql_template("Top 5 artists by revenue")
+    answer = format_template_answer(match, "| Artist |")
+    assert "'top_artists_by_revenue'" in answer
+    assert "Parameters: limit=5, year=None" in answer
+    assert match.template.sql in answer
+    assert answer.endswith("| Artist |")
+
+
+if __name__ == "__main__":
+    from music_bi_agent_poc.tests import run_cov_test
+
+    run_cov_test(
+        __file__,
+        "music_bi_agent_poc.sql_templates",
+        preview=False,
+    )
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import sqlalchemy as sa
+
+from music_bi_agent_poc.paths import path_enum
+from music_bi_agent_poc.settings import Settings
+from music_bi_agent_poc.one.one_01_main import One
+from music_bi_agent_poc.sqlite_engine import (
+    make_sqlite_url,
+    make_sqlite_engine_kwargs,
+    install_sqlite_pragmas,
+)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    path = tmp_path / "test.sqlite"
+    with sqlite3.connect(path) as connection:
+        connection.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, value INTEGER)")
+        connection.executemany(
+            "INSERT INTO t VALUES (?, ?)", [(i, i * 10) for i in range(100)]
+        )
+    engine = sa.create_engine(
+        make_sqlite_url(path, read_only=True, immutable=True),
+        **make_sqlite_engine_kwargs(pool_size=2),
+    )
+    install_sqlite_pragmas(engine, mmap_size=1024 * 1024, cache_size=-1024)
+    yield engine
+    engine.dispose()
+
+
+def test_make_sqlite_url(tmp_path):
+    path = tmp_path / "a b.sqlite"
+    assert make_sqlite_url(path) == f"sqlite:///{path}"
+    url = make_sqlite_url(path, read_only=True, immutable=True)
+    assert url.endswith("?mode=ro&immutable=1&uri=true")
+    assert "a%20b.sqlite" in url
+
+
+def test_concurrent_queries(engine):
+    # many more threads than pooled connections, none may lose its
+    # connection in the middle of a query
+    barrier = threading.Barrier(16)
+
+    def query(ith: int) -> int:
+        barrier.wait()
+        with engine.connect() as connection:
+            return connection.execute(
+                sa.text("SELECT value FROM t WHERE id = :id"), {"id": ith}
+            ).scalar_one()
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        for _ in range(5):
+            assert list(executor.map(query, range(16))) == [
+                ith * 10 for ith in range(16)
+            ]
+
+
+def test_query_only(engine):
+    with engine.connect() as connection:
+        with pytest.raises(sa.exc.OperationalError):
+            connection.execute(sa.text("DELETE FROM t"))
+
+
+@pytest.mark.parametrize("query_result_cache_max_items", [0, 256])
+def test_database_change_is_seen(tmp_path, monkeypatch, query_result_cache_max_items):
+    path = tmp_path / "test.sqlite"
+    with sqlite3.connect(path) as connection:
+        connection.execute("CREATE TABLE Genre (GenreId INTEGER PRIMARY KEY, Name TEXT)")
+        connection.execute("INSERT INTO Genre VALUES (1, 'Rock')")
+    monkeypatch.setattr(path_enum, "path_sqlite", path)
+    one = One(
+        settings=Settings(
+            sqlite_read_only=True,
+            sqlite_immutable=True,
+            # memory mapped pages would show the change anyway, the page
+            # cache of an immutable connection doesn't
+            sqlite_mmap_size=0,
+            query_result_cache_max_items=query_result_cache_max_items,
+        )
+    )
+    database_identifier = one.get_chinook_database_identifier()
+    sql = "SELECT Name FROM Genre ORDER BY GenreId"
+    try:
+        assert "Jazz" not in one.execute_cached_select_statement(database_identifier, sql)
+        with sqlite3.connect(path) as connection:
+            connection.execute("INSERT INTO Genre VALUES (2, 'Jazz')")
+        # make sure the file version changes even on a coarse mtime clock
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2_000_000_000))
+        result = one.execute_cached_select_statement(database_identifier, sql)
+        assert "Jazz" in result
+    finally:
+        for database in one.ohmy_sql_config.databases:
+            database.connection.sa_engine.dispose()
+
+
+if __name__ == "__main__":
+    from music_bi_agent_poc.tests import run_cov_test
+
+    run_cov_test(
+        __file__,
+        "music_bi_agent_poc.sqlite_engine",
+        preview=False,
+    )
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from music_bi_agent_poc.utils import locked_cached_property
+
+
+class Resource:
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.calls = 0
+        self.started = threading.Event()
+
+    @locked_cached_property
+    def model(self) -> object:
+        self.calls += 1
+        self.started.set()
+        time.sleep(0.1)
+        if self.fail:
+            raise RuntimeError("can't load")
+        return object()
+
+
+def test_built_once():
+    resource = Resource()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        values = list(executor.map(lambda _: resource.model, range(8)))
+    assert resource.calls == 1
+    assert all(value is values[0] for value in values)
+    assert isinstance(Resource.model, locked_cached_property)
+
+
+def test_instances_dont_wait_for_each_other():
+    resource_1, resource_2 = Resource(), Resource()
+    thread = threading.Thread(target=lambda: resource_1.model)
+    thread.start()
+    resource_1.started.wait()
+    start = time.perf_counter()
+    _ = resource_2.model
+    thread.join()
+    # the second one was built while the first one was being built
+    assert time.perf_counter() - start < 0.18
+
+
+def test_error_is_not_cached():
+    resource = Resource(fail=True)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            _ = resource.model
+    assert resource.calls == 2
+    resource.fail = False
+    assert resource.model is resource.model
+
+
+class Service:
+    @locked_cached_property
+    def _cache_lock(self) -> threading.Lock:
+        return threading.Lock()
+
+    @locked_cached_property
+    def cache(self) -> dict:
+        return dict()
+
+    def get(self) -> dict:
+        with self._cache_lock:
+            return self.cache
+
+
+def test_attribute_named_like_a_lock():
+    service = Service()
+    thread = threading.Thread(target=service.get, daemon=True)
+    thread.start()
+    thread.join(timeout=1)
+    # building ``cache`` must not wait for the ``_cache_lock`` value
+    assert thread.is_alive() is False
+    assert service.get() is service.cache
+
+
+def test_set_and_reset():
+    resource = Resource()
+    resource.__dict__["model"] = "replaced"
+    assert resource.model == "replaced"
+    del resource.__dict__["model"]
+    assert resource.model != "replaced"
+    assert resource.calls == 1
+
+
+if __name__ == "__main__":
+    from music_bi_agent_poc.tests import run_cov_test
+
+    run_cov_test(
+        __file__,
+        "music_bi_agent_poc.utils",
+        preview=False,
+    )